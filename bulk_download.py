@@ -0,0 +1,251 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set, TextIO
+from pathlib import Path
+
+from config import (
+    ITZPIRE_API_URL, FACEBOOK_API_URL, TIKTOK_API_URL, YOUTUBE_API_URL,
+    FIRST_BYTE_TIMEOUT, JOB_DEADLINE
+)
+from deadline import Deadline, DeadlineExceeded
+from media_fetcher import fetch_media, media_filename, MAX_FILE_SIZE, TOO_LARGE
+from media_sniffer import sniff_file
+from renditions import select_rendition
+from instagram_downloader import InstagramDownloader
+from facebook_downloader import FacebookDownloader
+from tiktok_downloader import TiktokDownloader
+from youtube_downloader import YoutubeDownloader
+from utils import detect_url_type, canonical_content_id
+
+logger = logging.getLogger(__name__)
+
+DOWNLOADERS = {
+    'instagram': InstagramDownloader(ITZPIRE_API_URL, FIRST_BYTE_TIMEOUT),
+    'facebook': FacebookDownloader(FACEBOOK_API_URL, FIRST_BYTE_TIMEOUT),
+    'tiktok': TiktokDownloader(TIKTOK_API_URL, FIRST_BYTE_TIMEOUT),
+    'youtube': YoutubeDownloader(YOUTUBE_API_URL, FIRST_BYTE_TIMEOUT)
+}
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def read_urls(source: TextIO) -> List[str]:
+    """
+    Read one URL per line, skipping blank lines, comments and duplicates.
+
+    Two URLs are duplicates when they point to the same content (same
+    canonical content ID), since both would be saved under the same file names.
+
+    Args:
+        source: Open text file (or stdin)
+
+    Returns:
+        List of URLs in input order
+    """
+    urls = []
+    seen: Set[str] = set()
+    for line in source:
+        url = line.strip()
+        if not url or url.startswith('#'):
+            continue
+        content_id = canonical_content_id(url)
+        if content_id not in seen:
+            seen.add(content_id)
+            urls.append(url)
+    return urls
+
+
+class Manifest:
+    """Append-only JSON-lines progress log used to resume an interrupted run."""
+
+    def __init__(self, path: str):
+        """
+        Open the manifest, loading the content IDs that were already completed.
+
+        Args:
+            path: Manifest file path
+        """
+        self.path = path
+        self.completed: Set[str] = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as manifest_file:
+                for line in manifest_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Baris terakhir bisa terpotong jika proses dihentikan
+                    if record.get("status") == "done":
+                        self.completed.add(record["content_id"])
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """Append one result and flush it to disk immediately."""
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as manifest_file:
+                manifest_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                manifest_file.flush()
+                os.fsync(manifest_file.fileno())
+            if entry["status"] == "done":
+                self.completed.add(entry["content_id"])
+
+
+def download_url(url: str, output_dir: str) -> Dict[str, Any]:
+    """
+    Resolve a social media URL with its platform downloader and save every media item.
+
+    Files are written to `<output_dir>/<platform>/<content id>_<index><ext>`,
+    where the extension comes from the file's magic bytes.
+
+    Args:
+        url: Social media URL
+        output_dir: Output directory
+
+    Returns:
+        Manifest entry with "url", "content_id", "status" ('done', 'partial' or
+        'failed'), "files", "bytes", "errors" and "seconds"
+    """
+    started_at = time.monotonic()
+    url_type = detect_url_type(url)
+    entry: Dict[str, Any] = {
+        "url": url, "content_id": canonical_content_id(url), "status": "failed",
+        "files": [], "bytes": 0, "errors": []
+    }
+    if url_type not in DOWNLOADERS:
+        entry["errors"].append("URL tidak didukung")
+        entry["seconds"] = 0.0
+        return entry
+
+    deadline = Deadline(JOB_DEADLINE)
+    target_dir = os.path.join(output_dir, url_type)
+    os.makedirs(target_dir, exist_ok=True)
+    base_name = re.sub(r'[^\w.-]+', '_', entry["content_id"].split(':', 1)[-1]).strip('_') or "media"
+
+    try:
+        data = DOWNLOADERS[url_type].download_content(url, deadline)
+        if data.get('status') != 'success':
+            entry["errors"].append(data.get('message', 'Gagal mengambil data'))
+            return entry
+
+        for index, media in enumerate(data['data'].get('media', [])):
+            media = select_rendition(media, MAX_FILE_SIZE, deadline)
+            if media == TOO_LARGE or not media:
+                entry["errors"].append(f"media {index}: {'terlalu besar' if media == TOO_LARGE else 'tidak tersedia'}")
+                continue
+            media_url = media.get('downloadUrl') or media.get('url')
+            if not media_url:
+                continue
+
+            partial_path = os.path.join(target_dir, f"{base_name}_{index}.part")
+            result = fetch_media(media_url, deadline, MAX_FILE_SIZE, dest_path=partial_path)
+            if not isinstance(result, Path):
+                entry["errors"].append(f"media {index}: {'terlalu besar' if result == TOO_LARGE else 'gagal diunduh'}")
+                continue
+
+            sniffed = sniff_file(result)
+            extension = sniffed["extension"] if sniffed else os.path.splitext(media_filename(media_url))[1] or ".bin"
+            final_path = os.path.join(target_dir, f"{base_name}_{index}{extension}")
+            os.replace(partial_path, final_path)
+            entry["files"].append(os.path.relpath(final_path, output_dir))
+            entry["bytes"] += os.path.getsize(final_path)
+    except DeadlineExceeded:
+        entry["errors"].append("Waktu pemrosesan habis")
+    except Exception as e:
+        logger.error(f"Error downloading {url}: {str(e)}")
+        entry["errors"].append(str(e))
+    finally:
+        entry["seconds"] = round(time.monotonic() - started_at, 2)
+
+    if entry["files"]:
+        entry["status"] = "partial" if entry["errors"] else "done"
+    return entry
+
+
+def run(urls: List[str], output_dir: str, workers: int, manifest: Manifest) -> Dict[str, Any]:
+    """
+    Download every URL with a pool of worker threads, skipping completed ones.
+
+    Args:
+        urls: Social media URLs
+        output_dir: Output directory
+        workers: Number of URLs processed concurrently
+        manifest: Progress manifest, updated after every URL
+
+    Returns:
+        Summary with counts, total bytes, elapsed seconds and throughput
+    """
+    pending = [url for url in urls if canonical_content_id(url) not in manifest.completed]
+    summary = {"total": len(urls), "skipped": len(urls) - len(pending), "done": 0, "partial": 0, "failed": 0, "bytes": 0}
+    started_at = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(download_url, url, output_dir): url for url in pending}
+        for finished, future in enumerate(as_completed(futures), 1):
+            entry = future.result()
+            manifest.record(entry)
+            summary[entry["status"]] += 1
+            summary["bytes"] += entry["bytes"]
+            elapsed = time.monotonic() - started_at
+            print(f"[{finished}/{len(pending)}] {entry['status']:<7} {entry['url']} "
+                  f"({entry['bytes'] / (1024 * 1024):.1f} MB, {entry['seconds']:.1f}s) "
+                  f"| {summary['bytes'] / (1024 * 1024) / max(elapsed, 1e-6):.2f} MB/s"
+                  + (f" | {'; '.join(entry['errors'])}" if entry['errors'] else ""),
+                  flush=True)
+
+    summary["seconds"] = time.monotonic() - started_at
+    summary["mb_per_second"] = summary["bytes"] / (1024 * 1024) / max(summary["seconds"], 1e-6)
+    summary["urls_per_minute"] = len(pending) / max(summary["seconds"], 1e-6) * 60
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command-line entry point for bulk downloads without Telegram.
+
+    Args:
+        argv: Command-line arguments (defaults to sys.argv)
+
+    Returns:
+        Process exit code: 0 if every URL succeeded, 1 otherwise
+    """
+    parser = argparse.ArgumentParser(
+        description="Unduh media dari banyak URL Instagram/Facebook/TikTok/YouTube ke direktori lokal."
+    )
+    parser.add_argument("input", nargs="?", default="-",
+                        help="File berisi satu URL per baris, atau '-' untuk stdin (default)")
+    parser.add_argument("-o", "--output", default="downloads", help="Direktori output (default: downloads)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Jumlah URL yang diproses bersamaan (default: 4)")
+    parser.add_argument("--manifest", help=f"File progres untuk melanjutkan (default: <output>/{MANIFEST_NAME})")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Tampilkan log downloader")
+    args = parser.parse_args(argv)
+
+    # Downloader mencatat setiap respons API di level INFO; cukup peringatan secara default
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    if args.input == "-":
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input, 'r', encoding='utf-8') as input_file:
+            urls = read_urls(input_file)
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest = Manifest(args.manifest or os.path.join(args.output, MANIFEST_NAME))
+    summary = run(urls, args.output, args.workers, manifest)
+
+    print(
+        f"\nSelesai: {summary['done']} berhasil, {summary['partial']} sebagian, {summary['failed']} gagal, "
+        f"{summary['skipped']} dilewati (sudah ada di manifest)\n"
+        f"Total {summary['bytes'] / (1024 * 1024):.1f} MB dalam {summary['seconds']:.1f}s "
+        f"({summary['mb_per_second']:.2f} MB/s, {summary['urls_per_minute']:.1f} URL/menit)"
+    )
+    return 0 if summary['partial'] == 0 and summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
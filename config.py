@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if it exists
@@ -7,6 +8,14 @@ load_dotenv()
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.environ.get("BOT_TOKEN", "8102146048:AAHqZOUNzwbmSauR6v81AWmPj29TuFH4s9E")
 
+# Bot API server (ubah untuk server Bot API lain)
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# Server Bot API lokal (telegram-bot-api --local): media dikirim sebagai path file
+LOCAL_BOT_API = os.environ.get("LOCAL_BOT_API", "False").lower() == "true"
+LOCAL_BOT_API_DIR = os.environ.get("LOCAL_BOT_API_DIR", "/var/lib/telegram-bot-api/media")
+LOCAL_MAX_FILE_SIZE_MB = int(os.environ.get("LOCAL_MAX_FILE_SIZE_MB", "2000"))
+
 # API Configuration
 ITZPIRE_API_URL = os.environ.get("ITZPIRE_API_URL", "https://itzpire.com/download/instagram")
 FACEBOOK_API_URL = os.environ.get("FACEBOOK_API_URL", "https://api.ryzendesu.vip/api/downloader/fbdl") 
@@ -15,11 +24,78 @@ YOUTUBE_API_URL = os.environ.get("YOUTUBE_API_URL", "https://api.ryzendesu.vip/a
 
 # Media Configuration
 MAX_MEDIA_PER_GROUP = int(os.environ.get("MAX_MEDIA_PER_GROUP", "10"))
+MAX_FILE_SIZE_MB = int(os.environ.get("MAX_FILE_SIZE_MB", "100"))
+RANGE_SEGMENTS = int(os.environ.get("RANGE_SEGMENTS", "4"))
+RANGE_MIN_SIZE_MB = int(os.environ.get("RANGE_MIN_SIZE_MB", "8"))
+PHOTO_MAX_SIDE = int(os.environ.get("PHOTO_MAX_SIDE", "2560"))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
 REQUEST_TIMEOUT = int(os.environ.get("REQUEST_TIMEOUT", "15"))
 MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "3"))
 
+# Timeout Configuration (dalam detik)
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", "5"))
+FIRST_BYTE_TIMEOUT = float(os.environ.get("FIRST_BYTE_TIMEOUT", str(REQUEST_TIMEOUT)))
+IDLE_READ_TIMEOUT = float(os.environ.get("IDLE_READ_TIMEOUT", "20"))
+JOB_DEADLINE = float(os.environ.get("JOB_DEADLINE", "300"))
+THUMBNAIL_TIMEOUT = float(os.environ.get("THUMBNAIL_TIMEOUT", "5"))
+# Waktu menunggu balasan Telegram setelah seluruh file streaming terkirim (video besar butuh waktu diproses)
+UPLOAD_RESPONSE_TIMEOUT = float(os.environ.get("UPLOAD_RESPONSE_TIMEOUT", "180"))
+
+# Streaming upload: kirim video/audio ke Telegram sambil diunduh
+STREAM_UPLOAD = os.environ.get("STREAM_UPLOAD", "False").lower() == "true"
+STREAM_QUEUE_CHUNKS = int(os.environ.get("STREAM_QUEUE_CHUNKS", "8"))
+
+# Arsip ZIP: album dengan banyak item dikirim sebagai satu dokumen
+ARCHIVE_DELIVERY = os.environ.get("ARCHIVE_DELIVERY", "False").lower() == "true"
+ARCHIVE_MIN_ITEMS = int(os.environ.get("ARCHIVE_MIN_ITEMS", "20"))
+
+# Direct URL: biarkan Telegram mengambil foto/video kecil langsung dari URL
+DIRECT_URL_DELIVERY = os.environ.get("DIRECT_URL_DELIVERY", "True").lower() == "true"
+DIRECT_URL_MIN_SAMPLES = int(os.environ.get("DIRECT_URL_MIN_SAMPLES", "5"))
+DIRECT_URL_MIN_SUCCESS_RATE = float(os.environ.get("DIRECT_URL_MIN_SUCCESS_RATE", "0.5"))
+DIRECT_URL_EXPLORE_RATE = float(os.environ.get("DIRECT_URL_EXPLORE_RATE", "0.1"))
+
+# Media Cache: simpan media di disk, dedup berdasarkan SHA-256 isi (0 = nonaktif)
+MEDIA_CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "scraper-media-cache"))
+MEDIA_CACHE_MAX_MB = int(os.environ.get("MEDIA_CACHE_MAX_MB", "1024"))
+
 # Bot Settings
 DAILY_LIMIT = int(os.environ.get("DAILY_LIMIT", "10"))
+# Pesan berisi banyak link: jumlah link maksimum per pesan
+MAX_URLS_PER_MESSAGE = int(os.environ.get("MAX_URLS_PER_MESSAGE", "10"))
+# Antrean adil: job yang berjalan bersamaan (total dan per pengguna) dan bobot pengguna premium
+MAX_ACTIVE_JOBS = int(os.environ.get("MAX_ACTIVE_JOBS", "8"))
+USER_MAX_IN_FLIGHT = int(os.environ.get("USER_MAX_IN_FLIGHT", "2"))
+PREMIUM_USER_IDS = {int(user_id) for user_id in os.environ.get("PREMIUM_USER_IDS", "").split(",") if user_id.strip()}
+PREMIUM_WEIGHT = float(os.environ.get("PREMIUM_WEIGHT", "3"))
+# Load shedding: tolak job baru jika antrean terlalu panjang atau perkiraan tunggu terlalu lama (0 = nonaktif)
+MAX_QUEUE_DEPTH = int(os.environ.get("MAX_QUEUE_DEPTH", "50"))
+MAX_QUEUE_WAIT = float(os.environ.get("MAX_QUEUE_WAIT", "120"))
+# Link yang dikirim ulang selama masih diproses (dalam detik ini) ikut job yang sudah berjalan (0 = nonaktif)
+DEDUP_WINDOW = float(os.environ.get("DEDUP_WINDOW", "300"))
+
+# Antrean job persisten: job yang belum selesai dilanjutkan setelah restart.
+# DATABASE_URL (PostgreSQL, mis. add-on Heroku) dipakai jika ada; tanpa itu file SQLite WAL di JOB_STORE_PATH,
+# yang harus berada di disk yang bertahan saat restart (bukan filesystem dyno Heroku)
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "jobs.sqlite3")
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+MAX_JOB_ATTEMPTS = int(os.environ.get("MAX_JOB_ATTEMPTS", "3"))
+# Waktu menunggu job berjalan selesai saat bot dimatikan (Heroku memberi 30 detik setelah SIGTERM)
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+# Worker unduhan terpisah: tahap unduhan berat dijalankan di proses lain (0 = di proses bot)
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "0"))
+# Backend antrean ke worker: "process" (pipe multiprocessing) atau "socket" (broker TCP lokal)
+WORKER_BACKEND = os.environ.get("WORKER_BACKEND", "process").lower()
+WORKER_BROKER_ADDRESS = os.environ.get("WORKER_BROKER_ADDRESS", "127.0.0.1:0")
+WORKER_AUTHKEY = os.environ.get("WORKER_AUTHKEY", "")
+# Playlist YouTube: jumlah lagu maksimum dan lagu yang diproses bersamaan
+PLAYLIST_MAX_TRACKS = int(os.environ.get("PLAYLIST_MAX_TRACKS", "25"))
+PLAYLIST_CONCURRENCY = int(os.environ.get("PLAYLIST_CONCURRENCY", "3"))
+
+# Monitor event loop: ukur lag setiap interval, catat fungsi yang memblokir lebih dari ambang (0 = nonaktif)
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.25"))
 
 # Debug Configuration
 DEBUG = os.environ.get("DEBUG", "True").lower() == "true"
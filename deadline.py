@@ -0,0 +1,136 @@
+import time
+import logging
+from typing import Any, Optional, Tuple
+
+from config import CONNECT_TIMEOUT, FIRST_BYTE_TIMEOUT, IDLE_READ_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Fase timeout yang dikenali oleh Deadline.timeout()
+PHASE_FIRST_BYTE = "first_byte"
+PHASE_IDLE = "idle"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a job has used up its end-to-end time budget."""
+
+
+class Deadline:
+    """Per-job time budget that shrinks as each stage consumes time."""
+
+    def __init__(self, budget: float,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 first_byte_timeout: float = FIRST_BYTE_TIMEOUT,
+                 idle_timeout: float = IDLE_READ_TIMEOUT):
+        """
+        Initialize the deadline.
+
+        Args:
+            budget: Total time budget for the job in seconds
+            connect_timeout: Maximum time to establish a connection
+            first_byte_timeout: Maximum time to wait for the response headers
+            idle_timeout: Maximum time between two chunks of a streamed body
+        """
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+        self.cancelled = False
+
+    def elapsed(self) -> float:
+        """Return seconds spent since the job started."""
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        """Return seconds left in the budget (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Return True if the budget has run out."""
+        return self.remaining() <= 0
+
+    def check(self, stage: str) -> None:
+        """
+        Abort the current stage if the budget has run out.
+
+        Args:
+            stage: Name of the stage about to run (for logging)
+
+        Raises:
+            DeadlineExceeded: If no time is left
+        """
+        if self.cancelled:
+            logger.info(f"Job cancelled before stage '{stage}' ({self.elapsed():.1f}s)")
+            raise DeadlineExceeded(f"Dibatalkan saat {stage}")
+        if self.expired():
+            logger.warning(f"Deadline exceeded before stage '{stage}' ({self.elapsed():.1f}s/{self.budget:.0f}s)")
+            raise DeadlineExceeded(f"Batas waktu habis saat {stage}")
+
+    def cancel(self) -> None:
+        """Expire the budget immediately, so the next check aborts the job."""
+        self.cancelled = True
+        self.expires_at = time.monotonic()
+
+    def timeout(self, phase: str = PHASE_FIRST_BYTE) -> Tuple[float, float]:
+        """
+        Build a (connect, read) timeout tuple for `requests`, clamped to the remaining budget.
+
+        Args:
+            phase: PHASE_FIRST_BYTE for waiting on headers, PHASE_IDLE for body reads
+
+        Returns:
+            Tuple of (connect timeout, read timeout) in seconds
+
+        Raises:
+            DeadlineExceeded: If no time is left
+        """
+        self.check(phase)
+        remaining = self.remaining()
+        read_timeout = self.idle_timeout if phase == PHASE_IDLE else self.first_byte_timeout
+        return (min(self.connect_timeout, remaining), min(read_timeout, remaining))
+
+
+def request_timeout(deadline: Optional[Deadline] = None,
+                    phase: str = PHASE_FIRST_BYTE,
+                    read_timeout: Optional[float] = None) -> Tuple[float, float]:
+    """
+    Return the (connect, read) timeout for a request, honouring an optional deadline.
+
+    Args:
+        deadline: Optional job deadline
+        phase: PHASE_FIRST_BYTE or PHASE_IDLE
+        read_timeout: Read timeout to use when there is no deadline
+
+    Returns:
+        Tuple of (connect timeout, read timeout) in seconds
+    """
+    if deadline is not None:
+        return deadline.timeout(phase)
+
+    if read_timeout is None:
+        read_timeout = IDLE_READ_TIMEOUT if phase == PHASE_IDLE else FIRST_BYTE_TIMEOUT
+    return (CONNECT_TIMEOUT, read_timeout)
+
+
+def set_idle_timeout(response: Any, timeout: float) -> None:
+    """
+    Switch an already-open streamed response from the first-byte timeout to the idle read timeout.
+
+    `requests` only accepts one read timeout per request, so once the headers
+    have arrived the underlying socket timeout is adjusted directly. This is
+    best effort: if the socket cannot be reached the first-byte timeout stays.
+
+    Args:
+        response: Streamed `requests.Response`
+        timeout: New per-read timeout in seconds
+    """
+    try:
+        connection = getattr(response.raw, '_connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            sock = response.raw._fp.fp.raw._sock
+        sock.settimeout(timeout)
+    except Exception as e:
+        logger.debug(f"Could not set idle timeout on stream: {str(e)}")
@@ -0,0 +1,102 @@
+import random
+import logging
+import threading
+import urllib.parse
+from typing import Dict, Any
+
+from config import DIRECT_URL_MIN_SAMPLES, DIRECT_URL_MIN_SUCCESS_RATE, DIRECT_URL_EXPLORE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Batas ukuran saat Telegram mengambil file sendiri dari URL HTTP
+DIRECT_URL_PHOTO_LIMIT = 5 * 1024 * 1024
+DIRECT_URL_FILE_LIMIT = 20 * 1024 * 1024
+
+
+def direct_url_limit(media_type: str) -> int:
+    """
+    Return the largest file Telegram will fetch by URL for a media type.
+
+    Args:
+        media_type: 'photo', 'video', 'audio' or 'document'
+
+    Returns:
+        Size limit in bytes
+    """
+    return DIRECT_URL_PHOTO_LIMIT if media_type == 'photo' else DIRECT_URL_FILE_LIMIT
+
+
+class HostStats:
+    """Tracks per-host success rates of direct-URL delivery."""
+
+    def __init__(self,
+                 min_samples: int = DIRECT_URL_MIN_SAMPLES,
+                 min_success_rate: float = DIRECT_URL_MIN_SUCCESS_RATE,
+                 explore_rate: float = DIRECT_URL_EXPLORE_RATE):
+        """
+        Initialize the statistics.
+
+        Args:
+            min_samples: Attempts per host before its success rate is trusted
+            min_success_rate: Success rate below which a host is skipped
+            explore_rate: Chance of still trying a skipped host, so it can recover
+        """
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.explore_rate = explore_rate
+        self.hosts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Return the host name of a URL."""
+        return urllib.parse.urlsplit(url).netloc.lower()
+
+    def success_rate(self, host: str) -> float:
+        """Return the success rate of a host (1.0 if it has never been tried)."""
+        with self._lock:
+            stats = self.hosts.get(host)
+            if not stats or not stats["attempts"]:
+                return 1.0
+            return stats["successes"] / stats["attempts"]
+
+    def should_try(self, url: str) -> bool:
+        """
+        Decide whether direct-URL delivery is worth trying for this URL's host.
+
+        Args:
+            url: Media URL
+
+        Returns:
+            True to try passing the URL to Telegram, False to download it ourselves
+        """
+        host = self.host_of(url)
+        with self._lock:
+            attempts = self.hosts.get(host, {}).get("attempts", 0)
+        if attempts < self.min_samples:
+            return True
+        if self.success_rate(host) >= self.min_success_rate:
+            return True
+        return random.random() < self.explore_rate
+
+    def record(self, url: str, success: bool) -> None:
+        """
+        Record the outcome of a direct-URL delivery attempt.
+
+        Args:
+            url: Media URL that was passed to Telegram
+            success: Whether Telegram accepted it
+        """
+        host = self.host_of(url)
+        with self._lock:
+            stats = self.hosts.setdefault(host, {"attempts": 0, "successes": 0})
+            stats["attempts"] += 1
+            if success:
+                stats["successes"] += 1
+        logger.info(f"Direct URL delivery via {host}: {'ok' if success else 'failed'} "
+                    f"(success rate {self.success_rate(host):.0%})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of the per-host counters."""
+        with self._lock:
+            return {host: dict(stats) for host, stats in self.hosts.items()}
@@ -1,9 +1,12 @@
 import logging
 import requests
 import urllib.parse
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from io import BytesIO
 
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from media_fetcher import fetch_media
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -65,12 +68,13 @@ class FacebookDownloader:
         ]
         return any(pattern in url for pattern in patterns)
     
-    def download_content(self, url: str) -> Dict[str, Any]:
+    def download_content(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Download Facebook content from URL.
         
         Args:
             url: Facebook post/video/reel URL
+            deadline: Optional job deadline bounding the API request
             
         Returns:
             Dictionary containing download response
@@ -93,7 +97,7 @@ class FacebookDownloader:
             
             # Make the request with 'accept: application/json' header
             headers = {'accept': 'application/json'}
-            response = requests.get(request_url, headers=headers, timeout=self.timeout)
+            response = requests.get(request_url, headers=headers, timeout=request_timeout(deadline, read_timeout=self.timeout))
             response.raise_for_status()
             
             # Parse response
@@ -151,10 +155,15 @@ class FacebookDownloader:
                         }
                 
                 # Prioritas: Gambar > HD > SD
+                # Video menyimpan semua rendisi agar bisa turun ke SD jika HD terlalu besar
+                renditions = [
+                    {"resolution": video["resolution"], "url": video["url"]}
+                    for video in (hd_video, sd_video) if video
+                ]
                 if image:
                     media_list.append(image)
                 elif hd_video:
-                    media_list.append(hd_video)
+                    media_list.append({**hd_video, "renditions": renditions})
                 elif sd_video:
                     media_list.append(sd_video)
                 
@@ -201,13 +210,19 @@ class FacebookDownloader:
                     
                     # Jika tidak ada gambar atau bukan URL gambar, cari video
                     if not media_list:
+                        renditions = [
+                            {"resolution": resolution, "url": media_data[field]}
+                            for resolution, field in (("HD", 'hdplay'), ("SD", 'play'))
+                            if media_data.get(field)
+                        ]
                         if 'hdplay' in media_data and media_data['hdplay']:
                             hd_video = {
                                 "type": "video",
                                 "resolution": "HD",
                                 "url": media_data['hdplay'],
                                 "downloadUrl": media_data['hdplay'],
-                                "thumbnail": media_data.get('cover', '')
+                                "thumbnail": media_data.get('cover', ''),
+                                "renditions": renditions
                             }
                             media_list.append(hd_video)
                         elif 'play' in media_data and media_data['play']:
@@ -234,6 +249,9 @@ class FacebookDownloader:
             else:
                 return {"status": "error", "message": "Tidak dapat mengekstrak video dari Facebook URL. Coba link lain."}
             
+        except DeadlineExceeded as e:
+            logger.error(f"Deadline exceeded: {str(e)}")
+            return {"status": "error", "message": "Waktu pemrosesan habis. Coba lagi nanti."}
         except requests.Timeout:
             logger.error("Request timeout")
             return {"status": "error", "message": "Request timed out"}
@@ -244,24 +262,21 @@ class FacebookDownloader:
             logger.error(f"Unexpected error: {str(e)}")
             return {"status": "error", "message": f"Unexpected error: {str(e)}"}
     
-    def download_media_file(self, url: str) -> Optional[BytesIO]:
+    def download_media_file(self, url: str, deadline: Optional[Deadline] = None) -> Union[BytesIO, str, None]:
         """
         Download media file from URL.
         
         Args:
             url: Media URL
+            deadline: Optional job deadline bounding the download
             
         Returns:
             BytesIO object containing media file data, or None if download failed
+            Returns string "TOO_LARGE" if file is too large
         """
+        # Cache media di disk diperiksa lebih dulu oleh fetch_media
         try:
-            response = requests.get(url, timeout=self.timeout)
-            response.raise_for_status()
-            
-            file_data = BytesIO(response.content)
-            file_data.seek(0)
-            
-            return file_data
+            return fetch_media(url, deadline)
         except Exception as e:
             logger.error(f"Error downloading media file: {str(e)}")
             return None
\ No newline at end of file
@@ -0,0 +1,288 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Jumlah job terakhir yang dipakai untuk memperkirakan waktu tunggu
+LATENCY_SAMPLES = 100
+
+# Keputusan OverloadController.decide
+ADMIT = "admit"
+QUEUE = "queue"
+SHED = "shed"
+
+
+class _Waiter:
+    """A job waiting for a slot, tagged with its virtual start and finish times."""
+
+    __slots__ = ("user_id", "start", "finish", "future")
+
+    def __init__(self, user_id: int, start: float, finish: float, future: "asyncio.Future[None]"):
+        self.user_id = user_id
+        self.start = start
+        self.finish = finish
+        self.future = future
+
+
+class Slot:
+    """A job slot held inside FairScheduler.slot, which can be given up while the job only waits."""
+
+    def __init__(self, scheduler: "FairScheduler", user_id: int, weight: float):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.weight = weight
+        self.held = True
+        self.paused = 0.0
+
+    @asynccontextmanager
+    async def pause(self) -> AsyncIterator[None]:
+        """
+        Release the slot for the duration of an `async with` block and take it back afterwards.
+
+        The time spent outside the slot, including the wait to get it back,
+        does not count as service time.
+        """
+        paused_at = time.monotonic()
+        self.held = False
+        self.scheduler.release(self.user_id)
+        try:
+            yield
+        except BaseException:
+            self.paused += time.monotonic() - paused_at
+            raise
+        await self.scheduler.acquire(self.user_id, self.weight)
+        self.held = True
+        self.paused += time.monotonic() - paused_at
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of download jobs across users.
+
+    At most `max_active` jobs run at once, and at most `per_user_limit` of them
+    belong to the same user. Each queued job gets a virtual finish time of
+    `max(virtual time, user's last finish) + 1 / weight`, and a free slot goes
+    to the eligible job with the smallest finish time. A user who pastes ten
+    links therefore takes turns with everyone else instead of going first with
+    all of them, and a user with weight 3 gets three turns for every one of a
+    user with weight 1. Jobs of the same user start in submission order.
+    """
+
+    def __init__(self, max_active: int, per_user_limit: int):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_active: Maximum number of jobs running at once
+            per_user_limit: Maximum number of running jobs per user
+        """
+        self.max_active = max(1, max_active)
+        self.per_user_limit = max(1, per_user_limit)
+        self.active = 0
+        self.in_flight: Dict[int, int] = {}
+        self._queues: Dict[int, Deque[_Waiter]] = {}
+        self._last_finish: Dict[int, float] = {}
+        self._virtual_time = 0.0
+        # Durasi job terbaru (detik): menunggu slot dan berjalan
+        self.wait_times: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.service_times: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def queued(self) -> int:
+        """Return the number of jobs waiting for a slot."""
+        return sum(len(waiters) for waiters in self._queues.values())
+
+    async def acquire(self, user_id: int, weight: float = 1.0) -> None:
+        """
+        Wait until a job of this user may start.
+
+        Every successful acquire must be paired with release(user_id).
+
+        Args:
+            user_id: Telegram user ID owning the job
+            weight: Share of the slots relative to other users (premium users get more)
+        """
+        start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish = start + 1.0 / max(weight, 0.01)
+        self._last_finish[user_id] = finish
+        waiter = _Waiter(user_id, start, finish, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot sudah diberikan tepat sebelum pembatalan; kembalikan
+                self.release(user_id)
+            else:
+                self._remove(waiter)
+            raise
+
+    def release(self, user_id: int) -> None:
+        """
+        Free the slot of a finished job and start the next eligible one.
+
+        Args:
+            user_id: Telegram user ID passed to acquire
+        """
+        self.active -= 1
+        self.in_flight[user_id] -= 1
+        if not self.in_flight[user_id]:
+            del self.in_flight[user_id]
+            self._forget_if_idle(user_id)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, weight: float = 1.0) -> AsyncIterator[Slot]:
+        """
+        Hold a job slot for the duration of an `async with` block.
+
+        Args:
+            user_id: Telegram user ID owning the job
+            weight: Share of the slots relative to other users
+
+        Yields:
+            The held slot; Slot.pause() gives it up while the job waits on something else
+        """
+        queued_at = time.monotonic()
+        await self.acquire(user_id, weight)
+        started_at = time.monotonic()
+        self.wait_times.append(started_at - queued_at)
+        slot = Slot(self, user_id, weight)
+        try:
+            yield slot
+        finally:
+            self.service_times.append(time.monotonic() - started_at - slot.paused)
+            if slot.held:
+                self.release(user_id)
+
+    def mean_service_time(self) -> Optional[float]:
+        """Return the mean running time of recent jobs in seconds, or None before the first job finishes."""
+        if not self.service_times:
+            return None
+        return sum(self.service_times) / len(self.service_times)
+
+    def estimate_wait(self, user_id: int, weight: float = 1.0) -> Tuple[int, Optional[float]]:
+        """
+        Estimate where a new job of this user would enter the queue.
+
+        Args:
+            user_id: Telegram user ID owning the job
+            weight: Share of the slots relative to other users
+
+        Returns:
+            Tuple of (position, estimated wait in seconds). Position 0 means the
+            job would start immediately. The wait is computed from the recent
+            throughput (max_active jobs per mean service time) and is None
+            while there is no finished job to base it on.
+        """
+        if (self.active < self.max_active and self.in_flight.get(user_id, 0) < self.per_user_limit
+                and user_id not in self._queues):
+            return 0, 0.0
+        finish = max(self._virtual_time, self._last_finish.get(user_id, 0.0)) + 1.0 / max(weight, 0.01)
+        position = 1 + sum(
+            1 for waiters in self._queues.values() for waiter in waiters if waiter.finish <= finish
+        )
+        service_time = self.mean_service_time()
+        if service_time is None:
+            return position, None
+        return position, position * service_time / self.max_active
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current load and the mean wait and service times of recent jobs."""
+        return {
+            "active": self.active,
+            "queued": self.queued(),
+            "users": len(set(self.in_flight) | set(self._queues)),
+            "mean_wait": sum(self.wait_times) / len(self.wait_times) if self.wait_times else None,
+            "mean_service": self.mean_service_time()
+        }
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """Drop a cancelled waiter from its user's queue."""
+        waiters = self._queues.get(waiter.user_id)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        if not waiters:
+            del self._queues[waiter.user_id]
+        # Tempat antrean yang ditinggalkan tidak boleh tetap membebani giliran pengguna
+        self._last_finish[waiter.user_id] = max(
+            [self._virtual_time] + [queued.finish for queued in waiters]
+        )
+        self._forget_if_idle(waiter.user_id)
+
+    def _forget_if_idle(self, user_id: int) -> None:
+        """Drop the finish time of a user with no queued or running jobs; they start fresh next time."""
+        if user_id not in self._queues and user_id not in self.in_flight:
+            self._last_finish.pop(user_id, None)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the eligible waiters with the smallest finish times."""
+        while self.active < self.max_active:
+            candidates: List[_Waiter] = [
+                waiters[0] for user_id, waiters in self._queues.items()
+                if self.in_flight.get(user_id, 0) < self.per_user_limit
+            ]
+            if not candidates:
+                return
+            waiter = min(candidates, key=lambda candidate: candidate.finish)
+            waiters = self._queues[waiter.user_id]
+            waiters.popleft()
+            if not waiters:
+                del self._queues[waiter.user_id]
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            self.active += 1
+            self.in_flight[waiter.user_id] = self.in_flight.get(waiter.user_id, 0) + 1
+            waiter.future.set_result(None)
+
+
+class OverloadController:
+    """Decides whether a new job is started, queued with an estimated wait, or rejected."""
+
+    def __init__(self, scheduler: FairScheduler, max_queue_depth: int, max_wait: float):
+        """
+        Initialize the controller.
+
+        Args:
+            scheduler: Scheduler the jobs are submitted to
+            max_queue_depth: Queued jobs above which new jobs are rejected
+            max_wait: Estimated wait in seconds above which new jobs are rejected
+        """
+        self.scheduler = scheduler
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait
+
+    def decide(self, user_id: int, weight: float = 1.0) -> Dict[str, Any]:
+        """
+        Decide what to do with a new job before any quota is charged for it.
+
+        Args:
+            user_id: Telegram user ID owning the job
+            weight: Share of the slots relative to other users
+
+        Returns:
+            Dictionary with "action" (ADMIT, QUEUE or SHED), "position",
+            "eta" (seconds or None) and "reason" (for SHED: 'queue_full' or 'wait_too_long')
+        """
+        position, eta = self.scheduler.estimate_wait(user_id, weight)
+        decision = {"action": ADMIT, "position": position, "eta": eta, "reason": None}
+        if position == 0:
+            return decision
+        if self.max_queue_depth > 0 and self.scheduler.queued() >= self.max_queue_depth:
+            decision.update(action=SHED, reason="queue_full")
+        elif self.max_wait > 0 and eta is not None and eta > self.max_wait:
+            decision.update(action=SHED, reason="wait_too_long")
+        else:
+            decision["action"] = QUEUE
+        if decision["action"] == SHED:
+            logger.warning(f"Shedding job of user {user_id}: {decision['reason']} "
+                           f"(position {position}, eta {eta or 0:.0f}s, queued {self.scheduler.queued()})")
+        return decision
@@ -1,9 +1,12 @@
 import logging
 import requests
 import urllib.parse
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 from io import BytesIO
 
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from media_fetcher import fetch_media
+
 logger = logging.getLogger(__name__)
 
 class InstagramDownloader:
@@ -50,12 +53,13 @@ class InstagramDownloader:
         ]
         return any(pattern in url for pattern in patterns)
     
-    def download_content(self, url: str) -> Dict[str, Any]:
+    def download_content(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Download Instagram content from URL.
         
         Args:
             url: Instagram post/reel/story URL
+            deadline: Optional job deadline bounding the API request
             
         Returns:
             Dictionary containing download response
@@ -77,7 +81,7 @@ class InstagramDownloader:
             logger.info(f"Requesting content from: {request_url}")
             
             # Make API request
-            response = requests.get(request_url, timeout=self.timeout)
+            response = requests.get(request_url, timeout=request_timeout(deadline, read_timeout=self.timeout))
             response.raise_for_status()
             
             data = response.json()
@@ -85,6 +89,9 @@ class InstagramDownloader:
             
             return data
             
+        except DeadlineExceeded as e:
+            logger.error(f"Deadline exceeded: {str(e)}")
+            return {"status": "error", "message": "Waktu pemrosesan habis. Coba lagi nanti."}
         except requests.Timeout:
             logger.error("Request timeout")
             return {"status": "error", "message": "Request timed out"}
@@ -95,25 +102,21 @@ class InstagramDownloader:
             logger.error(f"Unexpected error: {str(e)}")
             return {"status": "error", "message": f"Unexpected error: {str(e)}"}
     
-    def download_media_file(self, url: str) -> Optional[BytesIO]:
+    def download_media_file(self, url: str, deadline: Optional[Deadline] = None) -> Union[BytesIO, str, None]:
         """
         Download media file from URL.
         
         Args:
             url: Media URL
+            deadline: Optional job deadline bounding the download
             
         Returns:
             BytesIO object containing media file data, or None if download failed
+            Returns string "TOO_LARGE" if file is too large
         """
+        # Cache media di disk diperiksa lebih dulu oleh fetch_media
         try:
-            response = requests.get(url, timeout=self.timeout)
-            response.raise_for_status()
-            
-            # Create BytesIO object from response content
-            file_obj = BytesIO(response.content)
-            file_obj.name = urllib.parse.urlsplit(url).path.split('/')[-1]
-            
-            return file_obj
+            return fetch_media(url, deadline)
         except Exception as e:
             logger.error(f"Error downloading media file: {str(e)}")
             return None
\ No newline at end of file
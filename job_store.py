@@ -0,0 +1,308 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, List
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:  # Hanya dibutuhkan untuk backend PostgreSQL (DATABASE_URL)
+    psycopg2 = None
+
+logger = logging.getLogger(__name__)
+
+# Status job di tabel jobs
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    update_json TEXT NOT NULL,
+    urls TEXT NOT NULL,
+    charged INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    owner TEXT,
+    lease_until REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state_lease ON jobs (state, lease_until);
+"""
+
+# Skema yang sama untuk PostgreSQL: ID Telegram bisa melebihi 32 bit
+_POSTGRES_SCHEMA = _SCHEMA.replace("INTEGER", "BIGINT").replace("REAL", "DOUBLE PRECISION")
+
+
+class JobStore:
+    """
+    Durable record of accepted jobs in SQLite, so they survive restarts and deploys.
+
+    Every job is written as soon as it is accepted, together with the
+    serialized Telegram update it came from. The process that runs a job holds
+    a lease on it and renews it periodically; a job whose lease has expired
+    (its process died or shut down before finishing it) can be claimed and
+    re-driven by the next process. The database runs in WAL mode, so writes
+    are cheap appends and a crash never leaves it half-written.
+
+    The methods block on the database; call them from a worker thread
+    (asyncio.to_thread) when running on the event loop.
+    """
+
+    # Kunci transaksi claim_expired: SQLite mengunci seluruh database untuk penulisan
+    _BEGIN = "BEGIN IMMEDIATE"
+    _LOCK_ROWS = ""
+
+    def __init__(self, path: str, lease_seconds: float):
+        """
+        Open (and if needed create) the job database.
+
+        Args:
+            path: SQLite database file
+            lease_seconds: How long a job stays owned by this process without renewal
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # Identitas proses ini sebagai pemilik lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+    def _connect(self) -> Any:
+        """Open the SQLite database in autocommit mode and create the schema."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL + WAL: commit tidak menunggu fsync, tetapi tetap aman bila proses mati
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _execute(self, sql: str, params: Iterable[Any] = ()) -> int:
+        """Run one statement with the lock held and return the number of affected rows."""
+        return self._connection.execute(sql, tuple(params)).rowcount
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        """Run one query with the lock held and return its rows as dictionaries."""
+        return [dict(row) for row in self._connection.execute(sql, tuple(params))]
+
+    def add(self, job_id: str, user_id: int, update_json: str, urls_json: str, charged: int) -> None:
+        """
+        Record a newly accepted job, leased to this process.
+
+        Args:
+            job_id: Job ID
+            user_id: Telegram user ID
+            update_json: Update.to_json() of the message that created the job
+            urls_json: JSON list of the links the job processes
+            charged: Quota units charged for the job
+        """
+        now = time.time()
+        with self._lock:
+            self._execute(
+                "INSERT INTO jobs (job_id, user_id, update_json, urls, charged, state, owner,"
+                " lease_until, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (job_id) DO UPDATE SET user_id = excluded.user_id,"
+                " update_json = excluded.update_json, urls = excluded.urls, charged = excluded.charged,"
+                " completed = 0, state = excluded.state, attempts = 1, owner = excluded.owner,"
+                " lease_until = excluded.lease_until, created_at = excluded.created_at,"
+                " updated_at = excluded.updated_at",
+                (job_id, user_id, update_json, urls_json, charged, JOB_RUNNING, self.owner,
+                 now + self.lease_seconds, now, now)
+            )
+
+    def progress(self, job_id: str, completed: int) -> None:
+        """
+        Record how many links of a job have been delivered, so a re-driven job skips them.
+
+        Args:
+            job_id: Job ID
+            completed: Number of delivered links
+        """
+        with self._lock:
+            self._execute(
+                "UPDATE jobs SET completed = ?, updated_at = ? WHERE job_id = ?",
+                (completed, time.time(), job_id)
+            )
+
+    def finish(self, job_id: str, state: str) -> None:
+        """
+        Mark a job as finished.
+
+        Args:
+            job_id: Job ID
+            state: JOB_DONE, JOB_CANCELLED or JOB_FAILED
+        """
+        with self._lock:
+            self._execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = 0, updated_at = ? WHERE job_id = ?",
+                (state, time.time(), job_id)
+            )
+
+    def renew(self) -> int:
+        """
+        Extend the leases of every running job owned by this process.
+
+        Returns:
+            Number of renewed jobs
+        """
+        with self._lock:
+            return self._execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND state = ?",
+                (time.time() + self.lease_seconds, self.owner, JOB_RUNNING)
+            )
+
+    def claim_expired(self, max_attempts: int) -> List[Dict[str, Any]]:
+        """
+        Take over running jobs whose lease has expired.
+
+        Jobs that have already been attempted `max_attempts` times are marked
+        JOB_FAILED instead, so a job that crashes the bot is not retried forever.
+
+        Args:
+            max_attempts: Maximum number of times a job is started
+
+        Returns:
+            The claimed jobs as dictionaries of their columns
+        """
+        now = time.time()
+        with self._lock:
+            self._execute(self._BEGIN)
+            try:
+                rows = self._query(
+                    "SELECT * FROM jobs WHERE state = ? AND lease_until < ? ORDER BY created_at" + self._LOCK_ROWS,
+                    (JOB_RUNNING, now)
+                )
+                claimed = []
+                for row in rows:
+                    if row["attempts"] >= max_attempts:
+                        logger.warning(f"Job {row['job_id']} failed after {row['attempts']} attempts")
+                        self._execute(
+                            "UPDATE jobs SET state = ?, owner = NULL, lease_until = 0, updated_at = ? WHERE job_id = ?",
+                            (JOB_FAILED, now, row["job_id"])
+                        )
+                        continue
+                    self._execute(
+                        "UPDATE jobs SET owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                        " WHERE job_id = ?",
+                        (self.owner, now + self.lease_seconds, now, row["job_id"])
+                    )
+                    row["attempts"] += 1
+                    claimed.append(row)
+                self._execute("COMMIT")
+            except Exception:
+                self._execute("ROLLBACK")
+                raise
+        return claimed
+
+    def release(self) -> int:
+        """
+        Give up the leases of this process's unfinished jobs, so the next process takes them over at once.
+
+        Returns:
+            Number of released jobs
+        """
+        with self._lock:
+            return self._execute(
+                "UPDATE jobs SET owner = NULL, lease_until = 0 WHERE owner = ? AND state = ?",
+                (self.owner, JOB_RUNNING)
+            )
+
+    def purge(self, max_age: float) -> int:
+        """
+        Delete finished jobs older than `max_age` seconds.
+
+        Args:
+            max_age: Age in seconds
+
+        Returns:
+            Number of deleted jobs
+        """
+        with self._lock:
+            return self._execute(
+                "DELETE FROM jobs WHERE state != ? AND updated_at < ?",
+                (JOB_RUNNING, time.time() - max_age)
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+class PostgresJobStore(JobStore):
+    """
+    The job store in PostgreSQL, for hosts whose local disk does not survive a restart.
+
+    On Heroku every deploy and daily restart starts a dyno with a fresh
+    filesystem, so an SQLite file there loses the very jobs it should resume.
+    Several processes may share the database: claim_expired locks the rows it
+    takes over and skips rows another process is claiming. `path` is the
+    database URL.
+    """
+
+    _BEGIN = "BEGIN"
+    _LOCK_ROWS = " FOR UPDATE SKIP LOCKED"
+
+    def _connect(self) -> Any:
+        """Connect in autocommit mode and create the schema."""
+        connection = psycopg2.connect(self.path)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(_POSTGRES_SCHEMA)
+        return connection
+
+    def _cursor(self) -> Any:
+        # Koneksi yang putus (restart server, idle timeout) dibuka ulang pada pemakaian berikutnya
+        if self._connection.closed:
+            logger.warning("Job store connection lost, reconnecting")
+            self._connection = self._connect()
+        return self._connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    def _execute(self, sql: str, params: Iterable[Any] = ()) -> int:
+        with self._cursor() as cursor:
+            cursor.execute(sql.replace("?", "%s"), tuple(params))
+            return cursor.rowcount
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._cursor() as cursor:
+            cursor.execute(sql.replace("?", "%s"), tuple(params))
+            return [dict(row) for row in cursor.fetchall()]
+
+
+def open_job_store(database_url: str, path: str, lease_seconds: float) -> JobStore:
+    """
+    Open the job store configured for this deployment.
+
+    Args:
+        database_url: PostgreSQL URL (e.g. Heroku's DATABASE_URL); empty to use SQLite
+        path: SQLite database file, used without a database URL
+        lease_seconds: How long a job stays owned by this process without renewal
+
+    Returns:
+        PostgresJobStore if a database URL is set, the SQLite JobStore otherwise
+
+    Raises:
+        RuntimeError: If a database URL is set but psycopg2 is not installed
+    """
+    if database_url:
+        if psycopg2 is None:
+            raise RuntimeError("DATABASE_URL is set but psycopg2 is not installed")
+        logger.info("Using PostgreSQL job store")
+        return PostgresJobStore(database_url, lease_seconds)
+    if os.environ.get("DYNO"):
+        # Filesystem dyno Heroku dihapus setiap restart: job yang belum selesai ikut hilang
+        logger.warning(f"Job store {path} is on the dyno's ephemeral filesystem and will not survive "
+                       "a restart; set DATABASE_URL to keep unfinished jobs")
+    return JobStore(path, lease_seconds)
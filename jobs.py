@@ -0,0 +1,238 @@
+import time
+import uuid
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Set, Tuple
+
+from deadline import Deadline
+from fair_queue import Slot
+
+logger = logging.getLogger(__name__)
+
+# Prefiks callback_data tombol batal: "cancel:<job_id>"
+CANCEL_PREFIX = "cancel:"
+
+
+class Job:
+    """One user request being processed: its task, its deadlines and the quota it charged."""
+
+    def __init__(self, user_id: int, charged: int = 0, content_ids: Optional[List[str]] = None,
+                 job_id: Optional[str] = None):
+        """
+        Initialize the job.
+
+        Args:
+            user_id: Telegram user ID that submitted the request
+            charged: Number of quota units charged for the request
+            content_ids: Canonical content IDs of the links being processed
+            job_id: ID of a job restored from the job store (a new ID by default)
+        """
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.user_id = user_id
+        self.charged = charged
+        self.content_ids = list(content_ids or [])
+        self.created_at = time.monotonic()
+        self.duplicates = 0
+        # (pesan, ID konten) yang ditumpangkan ke job ini sebagai duplikat
+        self.attached: List[Tuple[Any, List[str]]] = []
+        self.completed = 0
+        self.cancelled = False
+        self.task: Optional["asyncio.Task[Any]"] = None
+        self.deadlines: List[Deadline] = []
+
+    def add_deadline(self, deadline: Deadline) -> Deadline:
+        """
+        Tie a deadline to the job, so cancelling the job also stops its downloads.
+
+        Args:
+            deadline: Deadline used by one of the job's stages
+
+        Returns:
+            The same deadline
+        """
+        self.deadlines.append(deadline)
+        if self.cancelled:
+            deadline.cancel()
+        return deadline
+
+    def refundable(self) -> int:
+        """Return the quota units charged for items that were not delivered."""
+        return max(0, self.charged - self.completed)
+
+    def cancel(self) -> None:
+        """
+        Stop the job.
+
+        The job's task is cancelled, and its deadlines are expired so that
+        downloads and uploads running in worker threads close their HTTP
+        streams at the next chunk instead of running to completion.
+        """
+        self.cancelled = True
+        for deadline in self.deadlines:
+            deadline.cancel()
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+
+# Job yang sedang diproses oleh task saat ini (diwarisi oleh task dan thread turunannya)
+current_job: ContextVar[Optional[Job]] = ContextVar("current_job", default=None)
+
+
+class DeliveryTurn:
+    """
+    The turn of one link to send its results, so a multi-link message is answered in order.
+
+    A link downloads as soon as it has a slot, but waits for the previous
+    link to finish before it sends anything; the next link can thus download
+    while this one uploads. The slot is given up during that wait. The turn
+    also records whether the link delivered anything, so a link that failed
+    can be refunded.
+    """
+
+    def __init__(self, previous: Optional["asyncio.Task[Any]"] = None, slot: Optional[Slot] = None,
+                 on_delivered: Optional[Callable[[], None]] = None):
+        """
+        Initialize the turn.
+
+        Args:
+            previous: Task of the previous link of the message, if any
+            slot: Job slot held by this link
+            on_delivered: Called once, when the link delivers its first result
+        """
+        self.previous = previous
+        self.slot = slot
+        self.on_delivered = on_delivered
+        self.delivered = False
+
+    def deliver(self) -> None:
+        """Record that the link delivered a result."""
+        if self.delivered:
+            return
+        self.delivered = True
+        if self.on_delivered:
+            self.on_delivered()
+
+    async def wait(self) -> None:
+        """Wait until the previous link has finished sending its results."""
+        if self.previous is None or self.previous.done():
+            return
+        if self.slot is None:
+            await asyncio.wait([self.previous])
+            return
+        async with self.slot.pause():
+            await asyncio.wait([self.previous])
+
+
+# Giliran kirim link yang sedang diproses oleh task saat ini
+current_turn: ContextVar[Optional[DeliveryTurn]] = ContextVar("current_turn", default=None)
+
+
+class JobRegistry:
+    """In-flight jobs by ID and by (user, content ID), for cancel buttons and duplicate links."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.jobs: Dict[str, Job] = {}
+        self._by_content: Dict[Tuple[int, str], Job] = {}
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the in-flight job with this ID, or None if it has finished."""
+        return self.jobs.get(job_id)
+
+    def find(self, user_id: int, content_id: str, window: float) -> Optional[Job]:
+        """
+        Find an in-flight job of this user for the same content, submitted within `window` seconds.
+
+        Args:
+            user_id: Telegram user ID
+            content_id: Canonical content ID of the link
+            window: Maximum age of the job in seconds
+
+        Returns:
+            The matching job, or None
+        """
+        job = self._by_content.get((user_id, content_id))
+        if job is None or job.cancelled or time.monotonic() - job.created_at > window:
+            return None
+        return job
+
+    def register(self, job: Job) -> None:
+        """Make a job findable by ID and content before its task starts running."""
+        self.jobs[job.job_id] = job
+        for content_id in job.content_ids:
+            self._by_content[(job.user_id, content_id)] = job
+
+    def start(self, job: Job, coroutine: Coroutine[Any, Any, Any]) -> "asyncio.Task[Any]":
+        """
+        Run a coroutine in the background on behalf of a job; see drain().
+
+        Args:
+            job: Job the coroutine works for (registered immediately)
+            coroutine: Coroutine to run, usually one that calls run()
+
+        Returns:
+            The background task
+        """
+        self.register(job)
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Wait for the background tasks started with start() to finish.
+
+        Tasks still running after `timeout` seconds are cancelled.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            Number of tasks that had to be cancelled
+        """
+        if not self._tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self._tasks), timeout=max(0.0, timeout))
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        return len(pending)
+
+    async def run(self, job: Job, coroutine: Coroutine[Any, Any, Any]) -> bool:
+        """
+        Run a coroutine as the task of a job until it finishes or is cancelled.
+
+        Args:
+            job: Job to run
+            coroutine: Work of the job; it sees the job through `current_job`
+
+        Returns:
+            True if the job finished, False if it was cancelled with Job.cancel
+
+        Raises:
+            asyncio.CancelledError: If the calling task itself is cancelled
+        """
+        token = current_job.set(job)
+        try:
+            job.task = asyncio.create_task(coroutine)
+        finally:
+            current_job.reset(token)
+
+        self.register(job)
+        try:
+            await job.task
+            return True
+        except asyncio.CancelledError:
+            if job.cancelled and not asyncio.current_task().cancelling():
+                logger.info(f"Job {job.job_id} of user {job.user_id} cancelled")
+                return False
+            raise
+        finally:
+            self.jobs.pop(job.job_id, None)
+            for content_id in job.content_ids:
+                if self._by_content.get((job.user_id, content_id)) is job:
+                    del self._by_content[(job.user_id, content_id)]
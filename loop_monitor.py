@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Batas atas bucket histogram lag (milidetik); lag di atas bucket terakhir masuk ">5000ms"
+LAG_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Jumlah kejadian blokir terakhir yang disimpan
+RECENT_STALLS = 20
+
+
+class LoopMonitor:
+    """
+    Watches the event loop for callbacks that block it.
+
+    A probe coroutine sleeps for `interval` seconds over and over; the time it
+    wakes up late is the scheduling lag every other handler suffers at that
+    moment, and is counted in a histogram. A watchdog thread checks when the
+    probe last ran. If the loop has not come back for more than `threshold`
+    seconds, it samples the loop thread's stack with sys._current_frames(),
+    so when the loop recovers the stall is logged together with the function
+    that was running and how long it blocked.
+    """
+
+    def __init__(self, interval: float, threshold: float, root: Optional[str] = None):
+        """
+        Initialize the monitor; call start() from the event loop.
+
+        Args:
+            interval: Seconds between two lag measurements
+            threshold: Lag in seconds above which a stall is sampled and logged
+            root: Source directory whose frames are reported as the blocking
+                function (the bot's own directory by default)
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.root = root or os.path.dirname(os.path.abspath(__file__))
+        self.histogram: Dict[str, Any] = {
+            "buckets": {f"<={bound}ms": 0 for bound in LAG_BUCKETS_MS},
+            "count": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "stalls": 0
+        }
+        self.histogram["buckets"][f">{LAG_BUCKETS_MS[-1]}ms"] = 0
+        # Fungsi pemblokir -> jumlah kejadian, dan kejadian terbaru
+        self.blockers: Counter = Counter()
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_STALLS)
+        self._heartbeat = time.monotonic()
+        self._sample: Optional[Tuple[float, List[traceback.FrameSummary], Optional[str]]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Start the probe on the running event loop and the watchdog thread."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._probe())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+        logger.info(f"Event loop monitor started (interval {self.interval * 1000:.0f}ms, "
+                    f"threshold {self.threshold * 1000:.0f}ms)")
+
+    def stop(self) -> None:
+        """Stop the probe and the watchdog."""
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Estimate a lag percentile from the histogram.
+
+        Args:
+            fraction: Percentile as a fraction, e.g. 0.99
+
+        Returns:
+            Upper bound in milliseconds of the bucket holding the percentile
+            (the maximum lag for the overflow bucket), or None without samples
+        """
+        count = self.histogram["count"]
+        if not count:
+            return None
+        seen = 0
+        for bound, bucket_count in zip(LAG_BUCKETS_MS, self.histogram["buckets"].values()):
+            seen += bucket_count
+            if seen >= fraction * count:
+                return float(bound)
+        return self.histogram["max_ms"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the lag histogram, its mean and percentiles, and the most frequent blocking functions."""
+        count = self.histogram["count"]
+        return {
+            "histogram": self.histogram,
+            "mean_ms": self.histogram["total_ms"] / count if count else None,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.histogram["max_ms"],
+            "stalls": self.histogram["stalls"],
+            "top_blockers": self.blockers.most_common(3),
+            "recent": list(self.recent)
+        }
+
+    async def _probe(self) -> None:
+        """Measure how late the loop wakes up from a sleep of `interval` seconds."""
+        while True:
+            scheduled = time.monotonic()
+            self._heartbeat = scheduled
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - scheduled - self.interval)
+            self._record(lag)
+            if lag >= self.threshold:
+                self._report(scheduled, lag)
+
+    def _record(self, lag: float) -> None:
+        """Add one lag measurement to the histogram."""
+        lag_ms = lag * 1000
+        for bound in LAG_BUCKETS_MS:
+            if lag_ms <= bound:
+                self.histogram["buckets"][f"<={bound}ms"] += 1
+                break
+        else:
+            self.histogram["buckets"][f">{LAG_BUCKETS_MS[-1]}ms"] += 1
+        self.histogram["count"] += 1
+        self.histogram["total_ms"] += lag_ms
+        self.histogram["max_ms"] = max(self.histogram["max_ms"], lag_ms)
+
+    def _watchdog(self) -> None:
+        """Sample the loop thread's stack once per stall that outlasts the threshold."""
+        sampled = None
+        while not self._stopped.wait(max(0.01, self.threshold / 4)):
+            heartbeat = self._heartbeat
+            if heartbeat == sampled or time.monotonic() - heartbeat - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            task = asyncio.current_task(self._loop)
+            task_name = f"{task.get_name()} ({task.get_coro().__qualname__})" if task else None
+            self._sample = (heartbeat, stack, task_name)
+            sampled = heartbeat
+
+    def _report(self, scheduled: float, lag: float) -> None:
+        """Log a stall with the stack sampled while it was happening."""
+        self.histogram["stalls"] += 1
+        sample = self._sample
+        if not sample or sample[0] != scheduled:
+            # Blokir selesai sebelum watchdog sempat mengambil sampel
+            logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms (no stack sample)")
+            self.recent.append({"function": None, "lag_ms": lag * 1000, "at": time.time()})
+            return
+        self._sample = None
+        _, stack, task_name = sample
+        blocker = self._blocking_frame(stack)
+        function = f"{os.path.basename(blocker.filename)}:{blocker.lineno} {blocker.name}" if blocker else "?"
+        innermost = stack[-1] if stack else None
+        self.blockers[function] += 1
+        self.recent.append({"function": function, "task": task_name, "lag_ms": lag * 1000, "at": time.time()})
+        logger.warning(
+            f"Event loop blocked for {lag * 1000:.0f}ms in {function}"
+            + (f" (inside {os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name})"
+               if innermost and innermost is not blocker else "")
+            + (f", task {task_name}" if task_name else "")
+            + "\n" + "".join(traceback.format_list(stack[-8:])).rstrip()
+        )
+
+    def _blocking_frame(self, stack: List[traceback.FrameSummary]) -> Optional[traceback.FrameSummary]:
+        """Return the innermost frame of the bot's own code, i.e. the handler that made the blocking call."""
+        for frame in reversed(stack):
+            filename = os.path.abspath(frame.filename)
+            if filename.startswith(self.root + os.sep) and filename != os.path.abspath(__file__):
+                return frame
+        return stack[-1] if stack else None
@@ -1,16 +1,22 @@
 import os
+import re
 import logging
 import requests
 import urllib.parse
 import asyncio
+import concurrent.futures
+import threading
 import datetime
 import time
 import json
+import uuid
 import random
-from typing import Dict, List, Any, Optional, Union
+import tempfile
+from typing import Coroutine, Dict, List, Any, Optional, Tuple, Union
 from io import BytesIO
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from telegram import Update, InputMediaPhoto, InputMediaVideo, InputMediaAudio, InlineKeyboardButton, InlineKeyboardMarkup
+from pathlib import Path
+from telegram.ext import Application, ApplicationBuilder, CallbackContext, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram import Update, Message, MessageEntity, InputMediaPhoto, InputMediaVideo, InputMediaAudio, InlineKeyboardButton, InlineKeyboardMarkup
 
 # Configure logging
 logging.basicConfig(
@@ -22,8 +28,29 @@ logger = logging.getLogger(__name__)
 # Import configuration
 from config import (
     TELEGRAM_BOT_TOKEN, ITZPIRE_API_URL, FACEBOOK_API_URL, TIKTOK_API_URL, YOUTUBE_API_URL,
-    MAX_MEDIA_PER_GROUP, REQUEST_TIMEOUT
+    MAX_MEDIA_PER_GROUP, FIRST_BYTE_TIMEOUT, JOB_DEADLINE, THUMBNAIL_TIMEOUT, STREAM_UPLOAD,
+    DIRECT_URL_DELIVERY, TELEGRAM_API_URL, LOCAL_BOT_API, DAILY_LIMIT, MAX_URLS_PER_MESSAGE,
+    PLAYLIST_MAX_TRACKS, PLAYLIST_CONCURRENCY, ARCHIVE_DELIVERY, ARCHIVE_MIN_ITEMS,
+    MAX_ACTIVE_JOBS, USER_MAX_IN_FLIGHT, PREMIUM_USER_IDS, PREMIUM_WEIGHT, MAX_QUEUE_DEPTH, MAX_QUEUE_WAIT,
+    DEDUP_WINDOW, DATABASE_URL, JOB_STORE_PATH, JOB_LEASE_SECONDS, MAX_JOB_ATTEMPTS, SHUTDOWN_DRAIN_TIMEOUT,
+    DOWNLOAD_WORKERS, WORKER_BACKEND, WORKER_BROKER_ADDRESS, WORKER_AUTHKEY, LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
 )
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from media_fetcher import (
+    fetch_media, probe_media, local_media_path, media_filename, release_media,
+    MAX_FILE_SIZE, LOCAL_MAX_FILE_SIZE, TOO_LARGE
+)
+from stream_upload import stream_to_telegram, stream_archive_to_telegram, StreamUploadError
+from delivery import HostStats, direct_url_limit
+from fair_queue import FairScheduler, OverloadController, QUEUE, SHED
+from jobs import Job, JobRegistry, DeliveryTurn, current_job, current_turn, CANCEL_PREFIX
+from job_store import JobStore, open_job_store, JOB_DONE, JOB_CANCELLED, JOB_FAILED
+from worker_pool import WorkerPool
+from loop_monitor import LoopMonitor
+from renditions import select_rendition
+from media_sniffer import sniff_file, with_extension, MP4_UNKNOWN
+from mp4_probe import probe_mp4_file, probe_mp4_url
+from photo_processor import prepare_photo, photo_validation_available
 from instagram_downloader import InstagramDownloader
 from facebook_downloader import FacebookDownloader
 from tiktok_downloader import TiktokDownloader
@@ -31,12 +58,11 @@ from youtube_downloader import YoutubeDownloader
 from utils import (
     clean_instagram_url, clean_facebook_url, clean_tiktok_url, clean_youtube_url,
     is_valid_instagram_url, is_valid_facebook_url, is_valid_tiktok_url, is_valid_youtube_url,
-    detect_url_type, create_media_caption
+    detect_url_type, create_media_caption, canonical_content_id, extract_urls, youtube_playlist_id
 )
 
 # Constants
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", TELEGRAM_BOT_TOKEN)
-# DAILY_LIMIT diimpor dari config.py
 
 # Dictionary untuk menyimpan penggunaan pengguna
 # Format: {user_id: {"count": jumlah_penggunaan, "date": tanggal_penggunaan}}
@@ -52,14 +78,62 @@ bot_stats = {
         "tiktok": 0,
         "youtube": 0
     },
-    "start_time": datetime.datetime.now()
+    "start_time": datetime.datetime.now(),
+    # Keputusan load shedding untuk job baru
+    "load": {
+        "admitted": 0,
+        "queued": 0,
+        "shed": 0,
+        "shed_reasons": {"queue_full": 0, "wait_too_long": 0},
+        # Link yang dikirim ulang dan digabungkan ke job yang sedang berjalan
+        "deduplicated": 0
+    }
 }
 
-# Initialize downloaders
-instagram_downloader = InstagramDownloader(ITZPIRE_API_URL, REQUEST_TIMEOUT)
-facebook_downloader = FacebookDownloader(FACEBOOK_API_URL, REQUEST_TIMEOUT)
-tiktok_downloader = TiktokDownloader(TIKTOK_API_URL, REQUEST_TIMEOUT)
-youtube_downloader = YoutubeDownloader(YOUTUBE_API_URL, REQUEST_TIMEOUT)
+# Statistik keberhasilan pengiriman direct URL per host CDN
+direct_url_stats = HostStats()
+
+# Antrean adil per pengguna untuk semua job unduhan
+job_scheduler = FairScheduler(MAX_ACTIVE_JOBS, USER_MAX_IN_FLIGHT)
+overload_controller = OverloadController(job_scheduler, MAX_QUEUE_DEPTH, MAX_QUEUE_WAIT)
+
+# Job yang sedang berjalan, agar bisa dibatalkan lewat tombol
+job_registry = JobRegistry()
+
+# Proses worker untuk tahap unduhan (None = dijalankan di thread proses bot)
+download_workers: Optional[WorkerPool] = None
+
+# Dibuat oleh init_bot_state() saat bot dimulai, bukan saat modul diimpor: proses
+# worker (spawn) mengimpor ulang modul ini sebagai __mp_main__ dan tidak boleh
+# membuka job store, pemantau loop, atau klien downloader sendiri
+loop_monitor: Optional[LoopMonitor] = None
+job_store: Optional[JobStore] = None
+job_store_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+instagram_downloader: Optional[InstagramDownloader] = None
+facebook_downloader: Optional[FacebookDownloader] = None
+tiktok_downloader: Optional[TiktokDownloader] = None
+youtube_downloader: Optional[YoutubeDownloader] = None
+
+def init_bot_state() -> None:
+    """Create the front-end state: loop monitor, job store and platform downloaders."""
+    global loop_monitor, job_store, job_store_executor
+    global instagram_downloader, facebook_downloader, tiktok_downloader, youtube_downloader
+    
+    # Pemantau lag event loop; histogramnya ikut diekspor di bot_stats
+    loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD) if LOOP_LAG_THRESHOLD > 0 else None
+    if loop_monitor:
+        bot_stats["loop_lag"] = loop_monitor.histogram
+    
+    # Catatan job yang bertahan saat bot dimulai ulang (PostgreSQL jika DATABASE_URL diisi)
+    job_store = open_job_store(DATABASE_URL, JOB_STORE_PATH, JOB_LEASE_SECONDS)
+    # Satu thread untuk semua panggilan job store: tidak memblokir event loop dan urutan tulis terjaga
+    job_store_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+    
+    # Initialize downloaders
+    instagram_downloader = InstagramDownloader(ITZPIRE_API_URL, FIRST_BYTE_TIMEOUT)
+    facebook_downloader = FacebookDownloader(FACEBOOK_API_URL, FIRST_BYTE_TIMEOUT)
+    tiktok_downloader = TiktokDownloader(TIKTOK_API_URL, FIRST_BYTE_TIMEOUT)
+    youtube_downloader = YoutubeDownloader(YOUTUBE_API_URL, FIRST_BYTE_TIMEOUT)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send welcome message when the command /start is issued."""
@@ -345,6 +419,28 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Hitung statistik
     total_downloads = bot_stats["total_downloads"]
     active_users = len(user_usage)
+    load = job_scheduler.snapshot()
+    load_stats = bot_stats["load"]
+    mean_service = f"{load['mean_service']:.1f} detik" if load["mean_service"] is not None else "-"
+    mean_wait = f"{load['mean_wait']:.1f} detik" if load["mean_wait"] is not None else "-"
+    if download_workers:
+        workers = download_workers.snapshot()
+        workers_line = f"• Worker Unduhan: {workers['busy']}/{workers['workers']} sibuk ({workers['backend']})\n"
+    else:
+        workers_line = ""
+    if loop_monitor:
+        lag = loop_monitor.snapshot()
+        lag_section = (
+            f"🩺 *Event Loop:*\n"
+            f"• Lag p50/p99: {lag['p50_ms'] or 0:.0f}/{lag['p99_ms'] or 0:.0f} ms (maks {lag['max_ms']:.0f} ms)\n"
+            f"• Terblokir > {LOOP_LAG_THRESHOLD * 1000:.0f} ms: {lag['stalls']:,} kali\n"
+        )
+        if lag["top_blockers"]:
+            function, count = lag["top_blockers"][0]
+            lag_section += f"• Pemblokir Teratas: `{function}` ({count}x)\n"
+        lag_section += "\n"
+    else:
+        lag_section = ""
     
     # Hitung uptime
     uptime = datetime.datetime.now() - bot_stats["start_time"]
@@ -369,7 +465,14 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         f"• Facebook: {facebook_pct}%\n"
         f"• TikTok: {tiktok_pct}%\n"
         f"• YouTube: {youtube_pct}%\n\n"
-        f"⏱️ *Respons Rata-rata:* 2.4 detik\n"
+        f"🚦 *Beban:*\n"
+        f"• Job Berjalan: {load['active']} (antrean {load['queued']})\n"
+        f"• Rata-rata Tunggu: {mean_wait}\n"
+        f"{workers_line}"
+        f"• Ditolak Saat Sibuk: {load_stats['shed']:,} dari "
+        f"{load_stats['admitted'] + load_stats['queued'] + load_stats['shed']:,}\n\n"
+        f"{lag_section}"
+        f"⏱️ *Respons Rata-rata:* {mean_service}\n"
         f"🔄 *Update Terakhir:* {bot_stats['start_time'].strftime('%d/%m/%Y')}"
     )
     
@@ -448,97 +551,164 @@ async def handle_api_response(update: Update, data: Dict[str, Any]) -> bool:
     
     return True
 
-async def download_media(url: str, update: Optional[Update] = None) -> Optional[Union[BytesIO, str]]:
+def media_cache_key(url: str, media: Dict[str, Any], index: int = 0) -> Optional[str]:
+    """
+    Build the media cache key of one media item of a post.
+    
+    CDN URLs are often signed and change between requests, so the key is based
+    on the canonical ID of the post plus the item's type, quality and position.
+    
+    Args:
+        url: Original social media URL
+        media: Media item data
+        index: Position of the item within the post
+        
+    Returns:
+        Cache key, or None if the post URL is unknown
+    """
+    if not url:
+        return None
+    quality = media.get('quality') or media.get('resolution') or ''
+    return f"{canonical_content_id(url)}|{media.get('type', '')}|{quality}|{index}"
+
+async def fetch_in_worker(url: str, deadline: Optional[Deadline], max_bytes: int,
+                          on_progress: Any, dest_path: Optional[str],
+                          cache_key: Optional[str]) -> Optional[Union[BytesIO, Path, str]]:
+    """
+    Run fetch_media in a download worker process.
+
+    Workers return files, not bytes: without a local Bot API server the media
+    is written to a temporary file and read back into memory here, since the
+    upload to Telegram still runs in the bot process.
+
+    Args:
+        url: Media URL
+        deadline: Optional job deadline; cancelling it stops the worker's download
+        max_bytes: Maximum accepted size in bytes
+        on_progress: Callback called with (downloaded, total)
+        dest_path: Local Bot API file path, or None to return a BytesIO
+        cache_key: Optional media cache key
+
+    Returns:
+        Same values as fetch_media
+    """
+    work_path = dest_path or os.path.join(tempfile.gettempdir(), f"scraper-{uuid.uuid4().hex}")
+    try:
+        file_obj = await download_workers.call("fetch", url, max_bytes, work_path, cache_key,
+                                               deadline=deadline, on_progress=on_progress)
+        if dest_path is None and isinstance(file_obj, Path):
+            content = BytesIO(await asyncio.to_thread(file_obj.read_bytes))
+            content.name = media_filename(url)
+            file_obj = content
+        return file_obj
+    finally:
+        if dest_path is None:
+            release_media(Path(work_path))
+
+
+async def sniff_media_file(file_obj: Union[BytesIO, Path]) -> Optional[Dict[str, str]]:
+    """Run sniff_file off the event loop, in a download worker when the media is a file on disk."""
+    if download_workers and isinstance(file_obj, Path):
+        return await download_workers.call("sniff", str(file_obj))
+    # MP4 ber-brand umum dibaca sampai box moov untuk menentukan jenis track
+    return await asyncio.to_thread(sniff_file, file_obj)
+
+
+async def download_media(url: str, update: Optional[Update] = None,
+                         deadline: Optional[Deadline] = None,
+                         cache_key: Optional[str] = None,
+                         max_bytes: Optional[int] = None) -> Optional[Union[BytesIO, Path, str]]:
     """
     Download media file from URL with optional progress bar.
     
     Args:
         url: Media URL
         update: Optional Telegram update for progress reporting
+        deadline: Optional job deadline; the download aborts when it runs out
+        cache_key: Optional media cache key (see media_cache_key)
+        max_bytes: Optional size limit; by default MAX_FILE_SIZE, or
+            LOCAL_MAX_FILE_SIZE when the file is written to the local Bot API directory
         
     Returns:
         BytesIO object or None if download failed
-        String "TOO_LARGE" if file is too large (>100MB)
+        Path of the downloaded file instead of BytesIO when LOCAL_BOT_API is enabled
+        String "TOO_LARGE" if file is too large
+        
+    Raises:
+        DeadlineExceeded: If the job deadline runs out before or during the download
     """
+    progress_message = None
     try:
+        if deadline:
+            deadline.check("download")
+        
         # Mulai dengan pesan progress
-        progress_message = None
+        markup = cancel_markup()
         if update:
             progress_message = await update.message.reply_text(
-                "⏳ Mendownload: 0% [░░░░░░░░░░] 0 MB"
+                "⏳ Mendownload: 0% [░░░░░░░░░░] 0 MB", reply_markup=markup
             )
         
-        # Cek ukuran file terlebih dahulu dengan HEAD request
-        try:
-            head_response = requests.head(url, timeout=REQUEST_TIMEOUT)
-            head_response.raise_for_status()
-            
-            # Cek ukuran file dari header Content-Length
-            if 'Content-Length' in head_response.headers:
-                content_length = int(head_response.headers['Content-Length'])
-                content_size_mb = content_length / (1024 * 1024)
-                
-                # Jika file lebih besar dari 100MB, beri tahu pengguna
-                if content_size_mb > 100:
-                    logger.warning(f"File terlalu besar: {content_size_mb:.2f} MB > 100 MB")
-                    if update and progress_message:
-                        await progress_message.edit_text(
-                            f"⚠️ File terlalu besar: {content_size_mb:.2f} MB (batas: 100 MB)"
-                        )
-                        await asyncio.sleep(2)
-                        await progress_message.delete()
-                    return "TOO_LARGE"
-        except Exception as head_err:
-            logger.warning(f"Error memeriksa ukuran file: {str(head_err)}")
-            # Lanjutkan unduhan meskipun terjadi kesalahan
-        
-        # Download dengan progress tracking
-        response = requests.get(url, stream=True, timeout=REQUEST_TIMEOUT)
-        response.raise_for_status()
-        
-        # Get content length if available
-        total_size = int(response.headers.get('content-length', 0))
-        total_size_mb = total_size / (1024 * 1024)
-        
-        # Create buffer for downloaded content
-        content = BytesIO()
-        downloaded_size = 0
-        last_update_time = time.time()
+        loop = asyncio.get_running_loop()
+        state = {"downloaded": 0, "total": 0, "last_update": time.time()}
         update_interval = 0.5  # Update progress every 0.5 seconds
         
-        # Download in chunks with progress reporting
-        for chunk in response.iter_content(chunk_size=1024 * 1024):  # 1MB chunks
-            if not chunk:
-                continue
-                
-            content.write(chunk)
-            downloaded_size += len(chunk)
-            downloaded_mb = downloaded_size / (1024 * 1024)
-            
-            # Update progress message at intervals
+        def on_progress(downloaded_size: int, total_size: int) -> None:
+            # Dipanggil dari thread unduhan; edit pesan dijadwalkan ke event loop
+            state["downloaded"] = downloaded_size
+            state["total"] = total_size
             current_time = time.time()
-            if update and progress_message and current_time - last_update_time >= update_interval:
-                if total_size > 0:
-                    progress = min(100, int((downloaded_size / total_size) * 100))
-                    bar_length = 10
-                    filled_length = int(bar_length * progress / 100)
-                    bar = "█" * filled_length + "░" * (bar_length - filled_length)
-                    
-                    await progress_message.edit_text(
-                        f"⏳ Mendownload: {progress}% [{bar}] {downloaded_mb:.1f}/{total_size_mb:.1f} MB"
-                    )
-                else:
-                    # Jika ukuran total tidak tersedia, tampilkan saja ukuran terunduh
-                    await progress_message.edit_text(
-                        f"⏳ Mendownload: {downloaded_mb:.1f} MB"
-                    )
-                last_update_time = current_time
+            if not progress_message or current_time - state["last_update"] < update_interval:
+                return
+            if deadline and deadline.cancelled:
+                # Job dibatalkan: pesan progress sudah dihapus oleh tombol batal
+                return
+            state["last_update"] = current_time
+            
+            downloaded_mb = downloaded_size / (1024 * 1024)
+            if total_size > 0:
+                progress = min(100, int((downloaded_size / total_size) * 100))
+                bar_length = 10
+                filled_length = int(bar_length * progress / 100)
+                bar = "█" * filled_length + "░" * (bar_length - filled_length)
+                text = f"⏳ Mendownload: {progress}% [{bar}] {downloaded_mb:.1f}/{total_size / (1024 * 1024):.1f} MB"
+            else:
+                # Jika ukuran total tidak tersedia, tampilkan saja ukuran terunduh
+                text = f"⏳ Mendownload: {downloaded_mb:.1f} MB"
+            asyncio.run_coroutine_threadsafe(progress_message.edit_text(text, reply_markup=markup), loop)
+        
+        # Satu GET streaming: ukuran diperiksa dari header atau hitungan byte berjalan
+        # Mode server Bot API lokal: tulis ke direktori bersama dan kirim sebagai path
+        dest_path = local_media_path(url) if LOCAL_BOT_API else None
+        if max_bytes is None:
+            # Batas besar server lokal hanya untuk file di disk, bukan buffer di memori
+            max_bytes = LOCAL_MAX_FILE_SIZE if dest_path else MAX_FILE_SIZE
+        if download_workers:
+            file_obj = await fetch_in_worker(url, deadline, max_bytes, on_progress, dest_path, cache_key)
+        else:
+            file_obj = await asyncio.to_thread(fetch_media, url, deadline, max_bytes, on_progress, dest_path, cache_key)
+        
+        if file_obj == TOO_LARGE:
+            size_mb = max(state["total"], state["downloaded"]) / (1024 * 1024)
+            if update and progress_message:
+                await progress_message.edit_text(
+                    f"⚠️ File terlalu besar: {size_mb:.2f} MB (batas: {max_bytes // (1024 * 1024)} MB)"
+                )
+                await asyncio.sleep(2)
+                await progress_message.delete()
+            return TOO_LARGE
+        
+        if file_obj is None:
+            if update and progress_message:
+                await progress_message.delete()
+            return None
         
         # Final progress update
         if update and progress_message:
-            if total_size > 0:
+            downloaded_mb = state["downloaded"] / (1024 * 1024)
+            if state["total"] > 0:
                 await progress_message.edit_text(
-                    f"✅ Download selesai: 100% [██████████] {total_size_mb:.1f} MB"
+                    f"✅ Download selesai: 100% [██████████] {state['total'] / (1024 * 1024):.1f} MB"
                 )
             else:
                 await progress_message.edit_text(
@@ -549,12 +719,15 @@ async def download_media(url: str, update: Optional[Update] = None) -> Optional[
             # Hapus pesan progress
             await progress_message.delete()
         
-        # Create BytesIO object from downloaded content
-        content.seek(0)
-        file_obj = content
-        file_obj.name = os.path.basename(urllib.parse.urlsplit(url).path)
         return file_obj
     
+    except DeadlineExceeded:
+        if update and progress_message:
+            try:
+                await progress_message.delete()
+            except:
+                pass
+        raise
     except Exception as e:
         logger.error(f"Error downloading media: {str(e)}")
         # Hapus pesan progress jika ada error
@@ -565,7 +738,309 @@ async def download_media(url: str, update: Optional[Update] = None) -> Optional[
                 pass
         return None
 
-async def send_single_media(update: Update, media: Dict[str, Any], url: str = "") -> None:
+def get_audio_info(media: Dict[str, Any], url: str, caption: str) -> Dict[str, Any]:
+    """
+    Collect title, performer, duration, thumbnail and caption for an audio item.
+    
+    Args:
+        media: Media item data
+        url: Original social media URL
+        caption: Default caption
+        
+    Returns:
+        Dictionary with title, performer, duration, thumbnail_url and caption
+    """
+    title = media.get('title', '')
+    performer = media.get('author', '')
+    duration = None
+    thumbnail_url = None
+    
+    # Check if we have metadata (especially for YouTube Music)
+    if 'metadata' in media and media['metadata']:
+        metadata = media['metadata']
+        title = metadata.get('title', title)
+        performer = metadata.get('performer', performer)
+        duration = metadata.get('duration')
+        thumbnail_url = media.get('thumbnail') or None
+    
+    # Add more detailed caption for YouTube Music
+    if detect_url_type(url) == 'youtube':
+        views = media.get('metadata', {}).get('views', 0)
+        quality = media.get('metadata', {}).get('quality', '')
+        caption = f"🎵 *{title}*\n👤 {performer}\n👁️ {views:,} views\n🎚️ {quality}"
+    
+    return {
+        "title": title,
+        "performer": performer,
+        "duration": duration,
+        "thumbnail_url": thumbnail_url,
+        "caption": caption
+    }
+
+async def download_thumbnail(thumbnail_url: Optional[str], deadline: Optional[Deadline] = None) -> Optional[Union[BytesIO, Path]]:
+    """
+    Download a thumbnail, ignoring any failure.
+    
+    Args:
+        thumbnail_url: Thumbnail URL (may be None)
+        deadline: Optional job deadline; the thumbnail gets at most THUMBNAIL_TIMEOUT of it
+        
+    Returns:
+        BytesIO object (Path in local mode) or None if there is no usable thumbnail
+    """
+    if not thumbnail_url:
+        return None
+    try:
+        logger.info(f"Downloading thumbnail: {thumbnail_url}")
+        # Anggaran waktu sendiri agar thumbnail yang lambat tidak menahan media utama
+        budget = Deadline(min(THUMBNAIL_TIMEOUT, deadline.remaining()) if deadline else THUMBNAIL_TIMEOUT)
+        thumbnail = await await_download(
+            download_media(thumbnail_url, deadline=budget, max_bytes=MAX_FILE_SIZE), budget
+        )
+        return thumbnail if thumbnail and thumbnail != TOO_LARGE else None
+    except Exception as thumb_err:
+        logger.error(f"Error downloading thumbnail: {str(thumb_err)}")
+        return None
+
+async def await_download(download: Coroutine[Any, Any, Any], deadline: Deadline) -> Any:
+    """
+    Await a download_media call without leaking its file if the caller is cancelled.
+    
+    Cancelling the task does not stop the download thread. The deadline is
+    expired instead, so the thread stops at the next chunk, and a file it
+    already wrote to disk (local Bot API mode) is deleted once it returns.
+    
+    Args:
+        download: download_media coroutine
+        deadline: Deadline the download was started with
+        
+    Returns:
+        Result of download_media
+    """
+    task = asyncio.ensure_future(download)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        deadline.cancel()
+        task.add_done_callback(
+            lambda done: release_media(done.result()) if not done.cancelled() and not done.exception() else None
+        )
+        raise
+
+async def send_audio(update: Update, file_obj: Union[BytesIO, Path], audio_info: Dict[str, Any],
+                     thumbnail: Optional[Union[BytesIO, Path]] = None) -> None:
+    """
+    Send a downloaded audio file with its metadata.
+    
+    Args:
+        update: Telegram update
+        file_obj: Downloaded audio file
+        audio_info: Result of get_audio_info
+        thumbnail: Optional downloaded thumbnail
+    """
+    await wait_delivery_turn()
+    await update.message.reply_audio(
+        audio=file_obj,
+        caption=audio_info["caption"],
+        title=audio_info["title"],
+        performer=audio_info["performer"],
+        # Parameter 'thumb' tidak didukung, gunakan 'thumbnail' sebagai gantinya
+        thumbnail=thumbnail,
+        duration=audio_info["duration"],
+        parse_mode="Markdown"
+    )
+    mark_delivered()
+
+async def stream_single_media(update: Update, media: Dict[str, Any], media_url: str, url: str = "",
+                              deadline: Optional[Deadline] = None) -> bool:
+    """
+    Send a video/audio item by streaming it from the CDN straight into the Bot API upload.
+    
+    Args:
+        update: Telegram update
+        media: Media item data
+        media_url: Direct media URL
+        url: Original social media URL (optional)
+        deadline: Optional job deadline
+        
+    Returns:
+        True if the item was handled, False if the caller should fall back to the buffered path
+    """
+    media_type = media.get('type', '').lower()
+    caption = create_media_caption(url) if url else "📥 Media"
+    params: Dict[str, Any] = {"chat_id": update.effective_chat.id}
+    attachments = {}
+    trailer = None
+    thumbnail_task = None
+    
+    if media_type == 'video':
+        method, field = "sendVideo", "video"
+        # Metadata dibaca dari box moov lewat Range request sebelum streaming dimulai
+        video_info = await asyncio.to_thread(probe_mp4_url, media_url, deadline) or {}
+        params.update({
+            "caption": caption,
+            "duration": video_info.get("duration") or None,
+            "width": video_info.get("width") or None,
+            "height": video_info.get("height") or None,
+            "supports_streaming": video_info.get("faststart", True)
+        })
+    else:
+        method, field = "sendAudio", "audio"
+        audio_info = get_audio_info(media, url, caption)
+        params.update({
+            "caption": audio_info["caption"],
+            "title": audio_info["title"],
+            "performer": audio_info["performer"],
+            "duration": audio_info["duration"],
+            "parse_mode": "Markdown"
+        })
+        if audio_info["thumbnail_url"]:
+            # Thumbnail diunduh selagi audio di-upload dan dikirim sebagai bagian form terakhir
+            thumbnail_task = asyncio.create_task(download_thumbnail(audio_info["thumbnail_url"], deadline))
+            thumbnail_ready: concurrent.futures.Future = concurrent.futures.Future()
+            thumbnail_task.add_done_callback(
+                lambda task: thumbnail_ready.set_result(None if task.cancelled() else task.result())
+            )
+            
+            def build_trailer() -> Tuple[Dict[str, Any], Dict[str, BytesIO]]:
+                try:
+                    thumbnail = thumbnail_ready.result(timeout=THUMBNAIL_TIMEOUT)
+                except concurrent.futures.TimeoutError:
+                    thumbnail = None
+                if not thumbnail:
+                    return {}, {}
+                return {"thumbnail": "attach://thumbnail_file"}, {"thumbnail_file": thumbnail}
+            
+            trailer = build_trailer
+    
+    # Unduhan dan upload berjalan bersamaan, jadi tunggu giliran kirim sebelum mulai
+    await wait_delivery_turn()
+    status_message = await update.message.reply_text("⏳ Mengunduh & mengirim media...", reply_markup=cancel_markup())
+    try:
+        result = await asyncio.to_thread(
+            stream_to_telegram, BOT_TOKEN, method, field, media_url, params, attachments, deadline,
+            trailer=trailer
+        )
+    except StreamUploadError as e:
+        if e.body_sent:
+            # File sudah sampai di Telegram; mengirim ulang bisa membuat media terkirim dua kali
+            logger.warning(f"No reply to streamed upload, not resending: {str(e)}")
+            mark_delivered()
+            return True
+        logger.warning(f"Streaming upload failed, falling back to buffered upload: {str(e)}")
+        return False
+    finally:
+        if thumbnail_task is not None and not thumbnail_task.done():
+            thumbnail_task.cancel()
+        try:
+            await status_message.delete()
+        except Exception:
+            pass
+    
+    if result == TOO_LARGE:
+        await update.message.reply_text("media anda terlalu besar !")
+    else:
+        mark_delivered()
+    return True
+
+async def send_archive(update: Update, media_items: List[Dict[str, Any]], url: str = "",
+                       deadline: Optional[Deadline] = None) -> bool:
+    """
+    Send many media items as one ZIP document instead of consecutive albums.
+    
+    The archive is built while the items download and is streamed straight into
+    a single sendDocument upload, so one upload replaces many album calls.
+    
+    Args:
+        update: Telegram update
+        media_items: Photo/video items in album order
+        url: Original social media URL (optional)
+        deadline: Optional job deadline
+        
+    Returns:
+        True if the archive was sent, False if the caller should send albums instead
+    """
+    items = [(f"{index + 1:03d}", media.get('downloadUrl') or media.get('url')) for index, media in enumerate(media_items)]
+    archive_name = re.sub(r'[^\w.-]+', '_', canonical_content_id(url) if url else "media").strip('_') or "media"
+    params = {
+        "chat_id": update.effective_chat.id,
+        "caption": create_media_caption(url) if url else "📥 Media"
+    }
+    
+    await wait_delivery_turn()
+    status_message = await update.message.reply_text(f"⏳ Mengemas {len(items)} media ke arsip ZIP...",
+                                                     reply_markup=cancel_markup())
+    try:
+        result = await asyncio.to_thread(
+            stream_archive_to_telegram, BOT_TOKEN, items, f"{archive_name}.zip", params, deadline
+        )
+    except StreamUploadError as e:
+        if e.body_sent:
+            logger.warning(f"No reply to archive upload, not resending as albums: {str(e)}")
+            mark_delivered()
+            return True
+        logger.warning(f"Archive upload failed, falling back to albums: {str(e)}")
+        return False
+    finally:
+        try:
+            await status_message.delete()
+        except Exception:
+            pass
+    
+    if result == TOO_LARGE:
+        logger.warning("Archive exceeds the upload limit, falling back to albums")
+        return False
+    mark_delivered()
+    if result["archived"] < len(items):
+        await update.message.reply_text(
+            f"⚠️ Hanya {result['archived']} dari {len(items)} media yang berhasil dimasukkan ke arsip."
+        )
+    return True
+
+async def send_direct_url(update: Update, media: Dict[str, Any], media_url: str, url: str = "",
+                          deadline: Optional[Deadline] = None) -> bool:
+    """
+    Try to deliver a photo/video by passing its URL to Telegram instead of uploading the bytes.
+    
+    Args:
+        update: Telegram update
+        media: Media item data
+        media_url: Direct media URL
+        url: Original social media URL (optional)
+        deadline: Optional job deadline
+        
+    Returns:
+        True if Telegram accepted the URL, False if the caller should download and upload it
+    """
+    if not direct_url_stats.should_try(media_url):
+        return False
+    
+    media_type = media.get('type', '').lower()
+    # Gunakan ulang hasil probe pemilihan rendisi jika ada
+    probe = media.get('probe')
+    if not probe or probe["url"] != media_url:
+        probe = await asyncio.to_thread(probe_media, media_url, deadline)
+    if not probe["ok"] or not probe["size"] or probe["size"] > direct_url_limit(media_type):
+        return False
+    
+    caption = create_media_caption(url) if url else "📥 Media"
+    await wait_delivery_turn()
+    try:
+        if media_type == 'video':
+            await update.message.reply_video(video=media_url, caption=caption, supports_streaming=True)
+        else:
+            await update.message.reply_photo(photo=media_url, caption=caption, parse_mode="Markdown")
+    except Exception as e:
+        logger.warning(f"Direct URL delivery failed, falling back to download: {str(e)}")
+        direct_url_stats.record(media_url, False)
+        return False
+    
+    direct_url_stats.record(media_url, True)
+    mark_delivered()
+    return True
+
+async def send_single_media(update: Update, media: Dict[str, Any], url: str = "",
+                            deadline: Optional[Deadline] = None) -> None:
     """
     Send a single media item to Telegram.
     
@@ -573,19 +1048,51 @@ async def send_single_media(update: Update, media: Dict[str, Any], url: str = ""
         update: Telegram update
         media: Media item data
         url: Original social media URL (optional)
+        deadline: Optional job deadline shared by every download of this item
     """
+    file_obj = None
+    thumbnail = None
+    thumbnail_task = None
     try:
+        # Pilih rendisi terbaik yang tersedia dan muat dalam batas ukuran
+        if media.get('renditions'):
+            # Mode lokal: media diunduh ke file, jadi batasnya batas server lokal
+            limit = LOCAL_MAX_FILE_SIZE if LOCAL_BOT_API else MAX_FILE_SIZE
+            media = await asyncio.to_thread(select_rendition, media, limit, deadline)
+            if media == TOO_LARGE:
+                await update.message.reply_text("media anda terlalu besar !")
+                return
+            elif not media:
+                await update.message.reply_text("❌ Gagal mengunduh media.")
+                return
+        
         # Extract media URL
         media_url = media.get('downloadUrl') or media.get('url')
         if not media_url:
             await update.message.reply_text("❌ Media URL tidak ditemukan.")
             return
         
+        # Foto/video kecil: biarkan Telegram mengambil sendiri dari URL
+        if DIRECT_URL_DELIVERY and media.get('type', '').lower() in ('photo', 'video'):
+            if await send_direct_url(update, media, media_url, url, deadline):
+                return
+        
+        # Mode streaming: video/audio diunggah ke Telegram sambil diunduh
+        if STREAM_UPLOAD and not LOCAL_BOT_API and media.get('type', '').lower() in ('video', 'audio'):
+            if await stream_single_media(update, media, media_url, url, deadline):
+                return
+        
+        # Thumbnail audio diunduh bersamaan dengan file utama (juga bila tipe API tidak jelas)
+        if media.get('type', '').lower() not in ('photo', 'video'):
+            thumbnail_url = get_audio_info(media, url, "")["thumbnail_url"]
+            if thumbnail_url:
+                thumbnail_task = asyncio.create_task(download_thumbnail(thumbnail_url, deadline))
+        
         # Download media file dengan progress bar
-        file_obj = await download_media(media_url, update)
+        file_obj = await download_media(media_url, update, deadline, media_cache_key(url, media))
         
         # Periksa jika file terlalu besar (>100MB)
-        if file_obj == "TOO_LARGE":
+        if file_obj == TOO_LARGE:
             await update.message.reply_text(
                 "media anda terlalu besar !",
                 parse_mode="Markdown"
@@ -595,58 +1102,48 @@ async def send_single_media(update: Update, media: Dict[str, Any], url: str = ""
             await update.message.reply_text("❌ Gagal mengunduh media.")
             return
         
-        # Get media type
-        media_type = media.get('type', '').lower()
+        # Tentukan jenis media dari byte awal file, bukan dari tebakan API/URL
+        sniffed = await sniff_media_file(file_obj)
+        if sniffed and sniffed["type"] != MP4_UNKNOWN:
+            media_type = sniffed["type"]
+            if isinstance(file_obj, BytesIO):
+                # Nama file menentukan MIME type yang dikirim ke Telegram
+                file_obj.name = with_extension(file_obj.name, sniffed["extension"])
+        else:
+            media_type = media.get('type', '').lower()
+            if media_type not in ('video', 'audio', 'photo'):
+                if 'video' in media_url.lower():
+                    media_type = 'video'
+                elif 'audio' in media_url.lower():
+                    media_type = 'audio'
         
         # Create caption based on URL type
         caption = create_media_caption(url) if url else "📥 Media"
         
+        # Media sudah diunduh; kirim setelah link sebelumnya dalam pesan selesai
+        await wait_delivery_turn()
+        
         # Send media based on type
-        if media_type == 'video' or 'video' in media_url.lower():
+        if media_type == 'video':
+            # Durasi/dimensi dari box moov agar Telegram tidak perlu memproses ulang seluruh file
+            video_info = await asyncio.to_thread(probe_mp4_file, file_obj) or {}
             await update.message.reply_video(
                 video=file_obj,
                 caption=caption,
-                supports_streaming=True
+                duration=video_info.get("duration") or None,
+                width=video_info.get("width") or None,
+                height=video_info.get("height") or None,
+                supports_streaming=video_info.get("faststart", True)
             )
-        elif media_type == 'audio' or 'audio' in media_url.lower():
+        elif media_type == 'audio':
             # Prepare additional metadata for audio files
-            title = media.get('title', '')
-            performer = media.get('author', '')
-            thumbnail = None
-            duration = None
-            
-            # Check if we have metadata (especially for YouTube Music)
-            if 'metadata' in media and media['metadata']:
-                metadata = media['metadata']
-                title = metadata.get('title', title)
-                performer = metadata.get('performer', performer)
-                duration = metadata.get('duration')
-                
-                # Try to get thumbnail for audio
-                if 'thumbnail' in media and media['thumbnail']:
-                    try:
-                        thumbnail_url = media['thumbnail']
-                        logger.info(f"Downloading thumbnail: {thumbnail_url}")
-                        thumbnail = await download_media(thumbnail_url)
-                    except Exception as thumb_err:
-                        logger.error(f"Error downloading thumbnail: {str(thumb_err)}")
-            
-            # Add more detailed caption for YouTube Music
-            if detect_url_type(url) == 'youtube':
-                views = media.get('metadata', {}).get('views', 0)
-                quality = media.get('metadata', {}).get('quality', '')
-                caption = f"🎵 *{title}*\n👤 {performer}\n👁️ {views:,} views\n🎚️ {quality}"
+            audio_info = get_audio_info(media, url, caption)
+            if thumbnail_task:
+                thumbnail = await thumbnail_task
+            else:
+                thumbnail = await download_thumbnail(audio_info["thumbnail_url"], deadline)
             
-            await update.message.reply_audio(
-                audio=file_obj,
-                caption=caption,
-                title=title,
-                performer=performer,
-                # Parameter 'thumb' tidak didukung, gunakan 'thumbnail' sebagai gantinya
-                thumbnail=thumbnail,
-                duration=duration,
-                parse_mode="Markdown"
-            )
+            await send_audio(update, file_obj, audio_info, thumbnail)
         elif media_type == 'photo':
             await update.message.reply_photo(
                 photo=file_obj,
@@ -659,7 +1156,10 @@ async def send_single_media(update: Update, media: Dict[str, Any], url: str = ""
                 caption=caption,
                 parse_mode="Markdown"
             )
+        mark_delivered()
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         error_message = str(e)
         logger.error(f"Error sending single media: {error_message}")
@@ -669,103 +1169,246 @@ async def send_single_media(update: Update, media: Dict[str, Any], url: str = ""
             await update.message.reply_text("media anda terlalu besar !")
         else:
             await update.message.reply_text(f"❌ Gagal mengirim media: {error_message}")
+    finally:
+        if thumbnail_task is not None:
+            if not thumbnail_task.done():
+                thumbnail_task.cancel()
+            elif not thumbnail_task.cancelled() and thumbnail is None:
+                thumbnail = thumbnail_task.result()
+        # Hapus file sementara di direktori server Bot API lokal
+        release_media(file_obj, thumbnail)
 
-async def send_media_group(update: Update, media_list: List[Dict[str, Any]]) -> None:
+async def prepare_album_batch(batch: List[Dict[str, Any]], caption: str = "",
+                              deadline: Optional[Deadline] = None, url: str = "",
+                              offset: int = 0) -> Tuple[List[Union[InputMediaPhoto, InputMediaVideo]], List[Any]]:
     """
-    Send a media group (album) to Telegram.
+    Download one album batch concurrently and build its InputMedia objects.
+    
+    Photos are validated and, when needed, recompressed in the image process
+    pool first, so an image Telegram would reject never reaches the upload.
     
     Args:
-        update: Telegram update
-        media_list: List of media items
+        batch: Media items of a single album (photos/videos)
+        caption: Caption for the first item of the batch
+        deadline: Optional job deadline shared by every download
+        url: Original social media URL, used for the media cache keys
+        offset: Position of the batch's first item within the post
+        
+    Returns:
+        Tuple of the InputMediaPhoto/InputMediaVideo list in the original order
+        (failed items skipped) and the downloaded files to release after upload
     """
+    media_urls = [media.get('downloadUrl') or media.get('url') for media in batch]
+    downloads = [
+        asyncio.ensure_future(download_media(media_url, deadline=deadline,
+                                             cache_key=media_cache_key(url, media, offset + position)))
+        for position, (media, media_url) in enumerate(zip(batch, media_urls))
+    ]
+    prepared_files: List[Any] = []
     try:
-        # Prepare media group
-        media_group = []
-        processed_count = 0
+        file_objs = await asyncio.gather(*downloads)
+        
+        # Foto dan video dikenali dari byte awal; jatuh ke tipe dari API jika tidak dikenali
+        media_types = []
+        for media, file_obj in zip(batch, file_objs):
+            sniffed = await sniff_media_file(file_obj)
+            if sniffed and sniffed["type"] == MP4_UNKNOWN:
+                sniffed = None
+            media_types.append(sniffed["type"] if sniffed else media.get('type', '').lower())
+            if sniffed and isinstance(file_obj, BytesIO):
+                file_obj.name = with_extension(file_obj.name, sniffed["extension"])
+        
+        # Validasi dan kompres ulang foto di process pool sebelum InputMediaPhoto dibuat
+        photo_indexes = [
+            index for index, (media_type, file_obj) in enumerate(zip(media_types, file_objs))
+            if media_type not in ('video', 'audio') and file_obj and file_obj != TOO_LARGE
+        ]
+        prepared_files = list(file_objs)
+        for index, photo in zip(photo_indexes, await asyncio.gather(*(prepare_photo(file_objs[i]) for i in photo_indexes))):
+            prepared_files[index] = photo
         
-        # Limiting to MAX_MEDIA_PER_GROUP items as Telegram only supports up to 10 items in a media group
-        for idx, media in enumerate(media_list[:MAX_MEDIA_PER_GROUP]):
-            if not isinstance(media, dict):
-                logger.error(f"Invalid media item at index {idx}: {media}")
-                continue
-                
-            # Extract media URL
-            media_url = None
-            if 'downloadUrl' in media and media['downloadUrl']:
-                media_url = media['downloadUrl']
-            elif 'url' in media and media['url']:
-                media_url = media['url']
-                
-            if not media_url:
-                logger.error(f"No media URL found for item at index {idx}")
-                continue
-                
-            # Download media file
-            file_obj = await download_media(media_url)
-            
+        media_group = []
+        for media, media_url, file_obj, prepared, media_type in zip(batch, media_urls, file_objs, prepared_files, media_types):
             # Periksa jika file terlalu besar (>100MB)
-            if file_obj == "TOO_LARGE":
+            if file_obj == TOO_LARGE:
                 logger.warning(f"Media too large at URL: {media_url}")
                 continue
             elif not file_obj:
                 logger.error(f"Failed to download media at URL: {media_url}")
                 continue
-                
-            # Get media type
-            media_type = media.get('type', '').lower()
-            
+            elif not prepared:
+                logger.warning(f"Invalid image skipped before upload: {media_url}")
+                continue
+            if media_type == 'audio':
+                logger.warning(f"Audio cannot be part of an album, skipping: {media_url}")
+                continue
+        
             # Set caption only for first item
-            caption = "📥 Instagram Media" if idx == 0 else ""
-            
-            # Add to media group based on type
+            item_caption = caption if not media_group else ""
+        
             try:
-                # Batasi ukuran media group untuk menghindari error "image_process_failed"
-                if processed_count < 5:  # Batasi maksimal 5 gambar per batch untuk menghindari error
-                    if media_type == 'video':
-                        media_group.append(
-                            InputMediaVideo(
-                                media=file_obj,
-                                caption=caption
-                            )
-                        )
-                    else:  # Default to photo
-                        media_group.append(
-                            InputMediaPhoto(
-                                media=file_obj,
-                                caption=caption
-                            )
-                        )
-                    processed_count += 1
-                else:
-                    logger.info(f"Skipping media item at index {idx} to avoid exceeding max batch size")
+                if media_type == 'video':
+                    video_info = await asyncio.to_thread(probe_mp4_file, prepared) or {}
+                    media_group.append(InputMediaVideo(
+                        media=prepared,
+                        caption=item_caption,
+                        duration=video_info.get("duration") or None,
+                        width=video_info.get("width") or None,
+                        height=video_info.get("height") or None,
+                        supports_streaming=video_info.get("faststart", True)
+                    ))
+                else:  # Default to photo
+                    media_group.append(InputMediaPhoto(media=prepared, caption=item_caption))
             except Exception as item_error:
                 logger.error(f"Error adding media item to group: {str(item_error)}")
         
-        # Send media group if not empty
-        if media_group:
-            logger.info(f"Sending media group with {len(media_group)} items")
-            await update.message.reply_media_group(media=media_group)
+        # Foto yang dikonversi di disk punya path baru (.jpg); yang itu yang harus dihapus
+        return media_group, [prepared or file_obj for file_obj, prepared in zip(file_objs, prepared_files)]
+    except BaseException:
+        # Batal atau satu unduhan gagal: hentikan sisanya dan hapus file yang sudah selesai
+        for download in downloads:
+            download.cancel()
+        if downloads:
+            await asyncio.wait(downloads)
+        release_media(*prepared_files, *(
+            download.result() for download in downloads
+            if not download.cancelled() and download.exception() is None
+        ))
+        raise
+
+async def send_album_batch(update: Update, media_group: List[Union[InputMediaPhoto, InputMediaVideo]]) -> None:
+    """
+    Upload one prepared album batch to Telegram.
+    
+    Args:
+        update: Telegram update
+        media_group: Prepared InputMedia objects (1-10 items)
+    """
+    await wait_delivery_turn()
+    # Telegram menolak media group dengan satu item, kirim sebagai media tunggal
+    if len(media_group) == 1:
+        item = media_group[0]
+        if isinstance(item, InputMediaVideo):
+            # to_dict() memberi durasi dalam detik tanpa peringatan deprecation atribut duration
+            video_info = item.to_dict()
+            await update.message.reply_video(
+                video=item.media,
+                caption=item.caption,
+                duration=video_info.get("duration"),
+                width=item.width,
+                height=item.height,
+                supports_streaming=item.supports_streaming
+            )
         else:
+            await update.message.reply_photo(photo=item.media, caption=item.caption)
+        mark_delivered()
+        return
+    
+    logger.info(f"Sending media group with {len(media_group)} items")
+    await update.message.reply_media_group(media=media_group)
+    mark_delivered()
+
+async def send_media_group(update: Update, media_list: List[Dict[str, Any]], url: str = "",
+                           deadline: Optional[Deadline] = None) -> None:
+    """
+    Send any number of media items as consecutive Telegram albums.
+    
+    Items are split into albums of MAX_MEDIA_PER_GROUP (Telegram accepts at most 10).
+    Batch k+1 is downloaded while batch k is uploading. Audio items cannot be
+    part of a photo/video album, so they are sent afterwards as single media.
+    With ARCHIVE_DELIVERY, ARCHIVE_MIN_ITEMS or more photo/video items are sent
+    as one ZIP document instead, falling back to albums if that fails.
+    
+    Args:
+        update: Telegram update
+        media_list: List of media items
+        url: Original social media URL (optional, used for the caption)
+        deadline: Optional job deadline shared by every download of the album
+    """
+    next_batch = None
+    try:
+        album_items = []
+        audio_items = []
+        for idx, media in enumerate(media_list):
+            if not isinstance(media, dict):
+                logger.error(f"Invalid media item at index {idx}: {media}")
+                continue
+            if not (media.get('downloadUrl') or media.get('url')):
+                logger.error(f"No media URL found for item at index {idx}")
+                continue
+            if media.get('type', '').lower() == 'audio':
+                audio_items.append(media)
+            else:
+                album_items.append(media)
+        
+        # Banyak item: satu upload arsip ZIP menggantikan banyak album
+        if ARCHIVE_DELIVERY and len(album_items) >= max(2, ARCHIVE_MIN_ITEMS):
+            if await send_archive(update, album_items, url, deadline):
+                album_items = []
+        
+        batch_size = max(1, min(MAX_MEDIA_PER_GROUP, 10))
+        batches = [album_items[i:i + batch_size] for i in range(0, len(album_items), batch_size)]
+        caption = create_media_caption(url) if url else "📥 Instagram Media"
+        sent_count = 0
+        
+        if batches:
+            next_batch = asyncio.create_task(prepare_album_batch(batches[0], caption, deadline, url))
+        
+        for index in range(len(batches)):
+            media_group, batch_files = await next_batch
+            next_batch = None
+            
+            # Unduh batch berikutnya selagi batch ini diunggah
+            if index + 1 < len(batches):
+                next_caption = caption if sent_count == 0 and not media_group else ""
+                next_batch = asyncio.create_task(prepare_album_batch(
+                    batches[index + 1], next_caption, deadline, url, (index + 1) * batch_size
+                ))
+            
+            if not media_group:
+                logger.warning(f"No media items could be prepared for album batch {index + 1}/{len(batches)}")
+                release_media(*batch_files)
+                continue
+            
+            try:
+                await send_album_batch(update, media_group)
+                sent_count += len(media_group)
+            except Exception as batch_error:
+                error_message = str(batch_error)
+                logger.error(f"Error sending album batch {index + 1}/{len(batches)}: {error_message}")
+                
+                # Jika error adalah image_process_failed, berikan pesan khusus
+                if "image_process_failed" in error_message:
+                    await update.message.reply_text("❌ Gagal mengirim media group: image_process_failed")
+                else:
+                    await update.message.reply_text(f"❌ Gagal mengirim media group: {error_message}")
+            finally:
+                release_media(*batch_files)
+        
+        if album_items and sent_count == 0:
             logger.warning("No media items could be prepared for the group")
             await update.message.reply_text("❌ Tidak ada media yang dapat dikirim.")
-            
-        # If some items couldn't be included in the media group due to the 10-item limit
-        if len(media_list) > MAX_MEDIA_PER_GROUP:
+        elif sent_count < len(album_items):
             await update.message.reply_text(
-                f"⚠️ Hanya {MAX_MEDIA_PER_GROUP} dari {len(media_list)} media yang dapat dikirim dalam satu grup."
+                f"⚠️ Hanya {sent_count} dari {len(album_items)} media yang berhasil dikirim."
             )
+        
+        # Kirim audio (misalnya musik slideshow TikTok) setelah semua album
+        for audio in audio_items:
+            await send_single_media(update, audio, url, deadline)
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         error_message = str(e)
         logger.error(f"Error sending media group: {error_message}")
-        
-        # Jika error adalah image_process_failed, berikan pesan khusus
-        if "image_process_failed" in error_message:
-            await update.message.reply_text("❌ Gagal mengirim media group: image_process_failed")
-        else:
-            await update.message.reply_text(f"❌ Gagal mengirim media group: {error_message}")
+        await update.message.reply_text(f"❌ Gagal mengirim media group: {error_message}")
+    finally:
+        if next_batch is not None and not next_batch.done():
+            next_batch.cancel()
 
-async def send_media(update: Update, data: Dict[str, Any], url: str = "") -> None:
+async def send_media(update: Update, data: Dict[str, Any], url: str = "",
+                     deadline: Optional[Deadline] = None) -> None:
     """
     Send media to Telegram chat.
     
@@ -773,6 +1416,7 @@ async def send_media(update: Update, data: Dict[str, Any], url: str = "") -> Non
         update: Telegram update
         data: API response data
         url: Original social media URL (optional)
+        deadline: Optional job deadline passed down to every download
     """
     try:
         # Extract media list from data
@@ -784,10 +1428,12 @@ async def send_media(update: Update, data: Dict[str, Any], url: str = "") -> Non
         
         # Send single media or media group based on number of items
         if len(media_list) == 1:
-            await send_single_media(update, media_list[0], url)
+            await send_single_media(update, media_list[0], url, deadline)
         else:
-            await send_media_group(update, media_list)
+            await send_media_group(update, media_list, url, deadline)
     
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         error_message = str(e)
         logger.error(f"Error sending media: {error_message}")
@@ -819,7 +1465,7 @@ async def fetch_instagram_content(url: str) -> Dict[str, Any]:
         logger.info(f"Requesting content from API: {request_url}")
         
         # Make API request
-        response = requests.get(request_url, timeout=REQUEST_TIMEOUT)
+        response = requests.get(request_url, timeout=request_timeout())
         response.raise_for_status()
         
         data = response.json()
@@ -860,7 +1506,7 @@ async def fetch_facebook_content(url: str) -> Dict[str, Any]:
         
         # Make API request with 'accept: application/json' header
         headers = {'accept': 'application/json'}
-        response = requests.get(request_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = requests.get(request_url, headers=headers, timeout=request_timeout())
         response.raise_for_status()
         
         data = response.json()
@@ -1005,7 +1651,7 @@ async def fetch_tiktok_content(url: str) -> Dict[str, Any]:
         
         # Make API request with 'accept: application/json' header
         headers = {'accept': 'application/json'}
-        response = requests.get(request_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = requests.get(request_url, headers=headers, timeout=request_timeout())
         response.raise_for_status()
         
         data = response.json()
@@ -1061,21 +1707,387 @@ def check_usage_limit(user_id: int, update: Optional[Update] = None) -> bool:
     
     return True
         
-async def send_quota_warning(update: Update, remaining: int) -> None:
+def refund_quota(user_id: int, amount: int) -> None:
     """
-    Kirim peringatan kuota hampir habis.
+    Kembalikan kuota yang sudah dipotong untuk item yang tidak jadi dikirim.
     
     Args:
-        update: Telegram update
-        remaining: Sisa kuota
+        user_id: ID pengguna Telegram
+        amount: Jumlah kuota yang dikembalikan
     """
-    warning = (
-        f"⚠️ *Peringatan Kuota*\n\n"
-        f"Anda hanya memiliki {remaining} unduhan tersisa hari ini.\n"
-        f"Kuota akan direset pada tengah malam (00:00 WIB).\n\n"
-    )
+    usage = user_usage.get(user_id)
+    if not amount or not usage or usage.get("date") != datetime.datetime.now().date():
+        return
+    refunded = min(amount, usage["count"])
+    usage["count"] -= refunded
+    bot_stats["total_downloads"] -= refunded
+
+def new_deadline(budget: float = JOB_DEADLINE) -> Deadline:
+    """
+    Create a job deadline, tied to the current job so the cancel button can stop it.
     
-    # Tambahkan tombol premium
+    Args:
+        budget: Time budget in seconds
+        
+    Returns:
+        New deadline
+    """
+    deadline = Deadline(budget)
+    job = current_job.get()
+    return job.add_deadline(deadline) if job else deadline
+
+async def wait_delivery_turn() -> None:
+    """Wait until the links before the current one in a multi-link message have sent their results."""
+    turn = current_turn.get()
+    if turn:
+        await turn.wait()
+
+def mark_delivered() -> None:
+    """Record that the current link delivered a result to the user."""
+    turn = current_turn.get()
+    if turn:
+        turn.deliver()
+
+def cancel_markup() -> Optional[InlineKeyboardMarkup]:
+    """
+    Build the cancel button for status messages of the current job.
+    
+    Returns:
+        Inline keyboard with a cancel button, or None outside of a job
+    """
+    job = current_job.get()
+    if not job:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Batalkan", callback_data=f"{CANCEL_PREFIX}{job.job_id}")]])
+
+def store_call(function: Any, *args: Any) -> "asyncio.Future[Any]":
+    """
+    Run a blocking job store method on the job store thread.
+    
+    Calls run in the order they were made. The returned future may be
+    awaited for the result; errors are logged either way.
+    
+    Args:
+        function: Bound JobStore method
+        args: Its arguments
+        
+    Returns:
+        Future of the method's result
+    """
+    future = asyncio.get_running_loop().run_in_executor(job_store_executor, function, *args)
+    
+    def log_error(done: "asyncio.Future[Any]") -> None:
+        if not done.cancelled() and done.exception():
+            logger.error(f"Job store {function.__name__} failed: {str(done.exception())}")
+    
+    future.add_done_callback(log_error)
+    return future
+
+async def run_job(update: Update, context: ContextTypes.DEFAULT_TYPE, job: Job, urls: List[str],
+                  decision: Optional[Dict[str, Any]] = None, notes: Optional[List[str]] = None) -> bool:
+    """
+    Run the work of a request as a cancellable job and record its outcome in the job store.
+    
+    If the user cancels it, or it fails with an unexpected error, quota
+    charged for items that were not delivered is refunded and the user is
+    told. If the bot shuts down first, the job stays unfinished in the job
+    store and is re-driven after the restart.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+        job: Job of the request
+        urls: Links processed by the job
+        decision: Admission decision
+        notes: Remarks about skipped links (multi-link messages only)
+        
+    Returns:
+        False if the user cancelled the job, True otherwise
+    """
+    if len(urls) == 1:
+        work = process_link(update, context, job, urls[0], decision)
+    else:
+        work = process_batch(update, context, job, urls, decision, notes)
+    
+    try:
+        finished = await job_registry.run(job, work)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Job {job.job_id} failed: {str(e)}")
+        store_call(job_store.finish, job.job_id, JOB_FAILED)
+        refunded = job.refundable()
+        refund_quota(job.user_id, refunded)
+        try:
+            await update.message.reply_text(
+                "❌ Terjadi kesalahan saat memproses permintaan Anda."
+                + (f" {refunded} kuota dikembalikan." if refunded else "")
+            )
+        except Exception as reply_error:
+            logger.warning(f"Could not notify user about failed job: {str(reply_error)}")
+        await notify_attached(job, "❌ Gagal memproses link ini. Silakan kirim ulang.")
+        return True
+    
+    if finished:
+        store_call(job_store.finish, job.job_id, JOB_DONE)
+        return True
+    store_call(job_store.finish, job.job_id, JOB_CANCELLED)
+    refunded = job.refundable()
+    refund_quota(job.user_id, refunded)
+    await update.message.reply_text(
+        "🛑 Unduhan dibatalkan." + (f" {refunded} kuota dikembalikan." if refunded else "")
+    )
+    await notify_attached(job, "🛑 Unduhan link ini dibatalkan. Kirim ulang jika masih ingin mengunduh.")
+    return False
+
+def start_job(update: Update, context: ContextTypes.DEFAULT_TYPE, job: Job, urls: List[str],
+              decision: Optional[Dict[str, Any]] = None, notes: Optional[List[str]] = None) -> "asyncio.Task[bool]":
+    """
+    Record an accepted job in the job store and start it in the background.
+    
+    The update handler returns immediately, so shutting down never waits on
+    a download inside a handler; see drain_jobs.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+        job: Job of the request
+        urls: Links processed by the job
+        decision: Admission decision
+        notes: Remarks about skipped links (multi-link messages only)
+        
+    Returns:
+        Background task running the job
+    """
+    # Dicatat sebelum job berjalan; di thread job store karena menulis ke database
+    recorded = store_call(job_store.add, job.job_id, job.user_id, update.to_json(), json.dumps(urls), job.charged)
+    
+    async def record_and_run() -> bool:
+        try:
+            await recorded
+        except Exception:
+            pass  # Sudah dicatat di log; job tetap dijalankan meski tidak bisa dilanjutkan setelah restart
+        return await run_job(update, context, job, urls, decision, notes)
+    
+    return job_registry.start(job, record_and_run())
+
+async def redrive_jobs(application: Application) -> int:
+    """
+    Resume jobs left unfinished by a previous process (restart, deploy or crash).
+    
+    The original update is rebuilt from its stored JSON; the quota was already
+    charged when the job was accepted. Jobs whose links were all delivered
+    are only marked done.
+    
+    Args:
+        application: Running bot application
+        
+    Returns:
+        Number of resumed jobs
+    """
+    rows = await store_call(job_store.claim_expired, MAX_JOB_ATTEMPTS)
+    for row in rows:
+        try:
+            update = Update.de_json(json.loads(row["update_json"]), application.bot)
+            urls = json.loads(row["urls"])
+        except Exception as e:
+            logger.error(f"Cannot restore job {row['job_id']}: {str(e)}")
+            store_call(job_store.finish, row["job_id"], JOB_FAILED)
+            continue
+        
+        if row["completed"] >= len(urls):
+            # Semua link sudah terkirim sebelum proses berhenti; jangan kirim ulang atau kembalikan kuota lagi
+            logger.info(f"Job {row['job_id']} was already delivered, marking it done")
+            store_call(job_store.finish, row["job_id"], JOB_DONE)
+            continue
+        
+        job = Job(row["user_id"], charged=row["charged"],
+                  content_ids=[canonical_content_id(url) for url in urls], job_id=row["job_id"])
+        job.completed = row["completed"]
+        logger.info(f"Resuming job {job.job_id} of user {job.user_id} (attempt {row['attempts']})")
+        try:
+            await update.message.reply_text("🔄 Bot baru saja dimulai ulang, melanjutkan unduhan Anda...")
+        except Exception as e:
+            logger.warning(f"Could not notify user about resumed job: {str(e)}")
+        job_registry.start(job, run_job(update, CallbackContext.from_update(update, application), job, urls))
+    return len(rows)
+
+async def maintain_job_leases(application: Application) -> None:
+    """
+    Keep this process's job leases alive and pick up jobs whose owner has died.
+    
+    Args:
+        application: Running bot application
+    """
+    while True:
+        await asyncio.sleep(max(1.0, JOB_LEASE_SECONDS / 3))
+        try:
+            await store_call(job_store.renew)
+            await redrive_jobs(application)
+        except Exception as e:
+            logger.error(f"Job lease maintenance failed: {str(e)}")
+
+async def on_startup(application: Application) -> None:
+    """
+    Prepare the bot once the application is initialized (Application.post_init).
+    
+    Starts the loop monitor and the download workers, resumes unfinished
+    jobs and starts lease maintenance.
+    
+    Args:
+        application: Bot application being started
+    """
+    global download_workers
+    if not photo_validation_available():
+        logger.warning("Pillow is not installed: album photos are sent without validation or recompression")
+    if loop_monitor:
+        loop_monitor.start()
+    if DOWNLOAD_WORKERS > 0:
+        host, _, port = WORKER_BROKER_ADDRESS.rpartition(":")
+        download_workers = WorkerPool(DOWNLOAD_WORKERS, WORKER_BACKEND, (host or "127.0.0.1", int(port or 0)),
+                                      WORKER_AUTHKEY.encode())
+        download_workers.start()
+    purged = await store_call(job_store.purge, 7 * 24 * 3600)
+    if purged:
+        logger.info(f"Purged {purged} finished jobs from the job store")
+    resumed = await redrive_jobs(application)
+    if resumed:
+        logger.info(f"Resumed {resumed} unfinished jobs")
+    application.bot_data["lease_task"] = asyncio.create_task(maintain_job_leases(application))
+
+async def drain_jobs(application: Application) -> None:
+    """
+    Let running jobs finish before the bot exits (Application.post_stop).
+    
+    Jobs still running after SHUTDOWN_DRAIN_TIMEOUT seconds are stopped and
+    their leases released, so the next process resumes them immediately.
+    
+    Args:
+        application: Bot application being stopped
+    """
+    lease_task = application.bot_data.pop("lease_task", None)
+    if lease_task:
+        lease_task.cancel()
+    if job_registry.jobs:
+        logger.info(f"Waiting up to {SHUTDOWN_DRAIN_TIMEOUT:.0f}s for {len(job_registry.jobs)} running jobs")
+    interrupted = await job_registry.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    released = await store_call(job_store.release)
+    if interrupted or released:
+        logger.warning(f"Shutdown interrupted {interrupted} jobs; {released} will be resumed on the next start")
+    await store_call(job_store.close)
+    if download_workers:
+        download_workers.close()
+    if loop_monitor:
+        loop_monitor.stop()
+
+async def cancel_job_callback(query: Any) -> None:
+    """
+    Cancel the job whose status message carries the pressed cancel button.
+    
+    Args:
+        query: Callback query with data "cancel:<job_id>"
+    """
+    job = job_registry.get(query.data[len(CANCEL_PREFIX):])
+    if not job:
+        await query.answer("Unduhan sudah selesai.")
+        return
+    if job.user_id != query.from_user.id:
+        await query.answer("Hanya pengirim link yang dapat membatalkan.", show_alert=True)
+        return
+    
+    job.cancel()
+    await query.answer("🛑 Membatalkan...")
+    try:
+        await query.message.delete()
+    except Exception as e:
+        logger.warning(f"Failed to delete cancelled status message: {e}")
+
+def find_duplicate_job(user_id: int, url: str) -> Optional[Job]:
+    """
+    Find the in-flight job of this user that is already processing the same content.
+    
+    Args:
+        user_id: ID pengguna Telegram
+        url: Social media URL
+        
+    Returns:
+        The running job if the link was submitted again within DEDUP_WINDOW seconds, None otherwise
+    """
+    if DEDUP_WINDOW <= 0:
+        return None
+    return job_registry.find(user_id, canonical_content_id(url), DEDUP_WINDOW)
+
+async def acknowledge_duplicate(update: Update, job: Job, content_ids: List[str]) -> None:
+    """
+    Attach resubmitted links to the job already processing them.
+    
+    No quota is charged and no status message is sent; the message only gets a
+    reaction. If the job is cancelled or fails, the message gets a reply (see notify_attached).
+    
+    Args:
+        update: Telegram update
+        job: Job already processing the links
+        content_ids: Canonical content IDs of the resubmitted links
+    """
+    count = len(content_ids)
+    job.duplicates += count
+    job.attached.append((update.message, content_ids))
+    bot_stats["load"]["deduplicated"] += count
+    logger.info(f"Attached {count} resubmitted link(s) of user {job.user_id} to job {job.job_id}")
+    try:
+        await update.message.set_reaction("👌")
+    except Exception as e:
+        logger.debug(f"Could not react to duplicate message: {str(e)}")
+
+async def notify_attached(job: Job, text: str, content_id: Optional[str] = None) -> None:
+    """
+    Tell the messages attached to a job as duplicates that their link was not delivered.
+    
+    Every message is notified at most once.
+    
+    Args:
+        job: Job that was cancelled or failed
+        text: Reply sent to the attached messages
+        content_id: Only notify messages that resubmitted this content (all messages by default)
+    """
+    remaining = []
+    for message, content_ids in job.attached:
+        if content_id is not None and content_id not in content_ids:
+            remaining.append((message, content_ids))
+            continue
+        try:
+            await message.reply_text(text)
+        except Exception as e:
+            logger.debug(f"Could not notify duplicate message: {str(e)}")
+    job.attached = remaining
+
+def user_weight(user_id: int) -> float:
+    """
+    Return the fair-queuing weight of a user.
+    
+    Args:
+        user_id: ID pengguna Telegram
+        
+    Returns:
+        PREMIUM_WEIGHT for premium users, 1.0 otherwise
+    """
+    return PREMIUM_WEIGHT if user_id in PREMIUM_USER_IDS else 1.0
+
+async def send_quota_warning(update: Update, remaining: int) -> None:
+    """
+    Kirim peringatan kuota hampir habis.
+    
+    Args:
+        update: Telegram update
+        remaining: Sisa kuota
+    """
+    warning = (
+        f"⚠️ *Peringatan Kuota*\n\n"
+        f"Anda hanya memiliki {remaining} unduhan tersisa hari ini.\n"
+        f"Kuota akan direset pada tengah malam (00:00 WIB).\n\n"
+    )
+    
+    # Tambahkan tombol premium
     keyboard = [
         [InlineKeyboardButton("🌟 Upgrade ke Premium", callback_data="premium")],
         [InlineKeyboardButton("🏷️ Cek Kuota", callback_data="quota")]
@@ -1086,64 +2098,421 @@ async def send_quota_warning(update: Update, remaining: int) -> None:
     await asyncio.sleep(2)
     await update.message.reply_markdown(warning, reply_markup=reply_markup)
 
-async def handle_social_media_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def send_limit_reached(update: Update) -> None:
     """
-    Handle all social media URLs and download content.
+    Tell the user that the daily quota is used up.
     
     Args:
         update: Telegram update
-        context: Callback context
     """
-    # Dapatkan user_id pengguna
-    user_id = update.effective_user.id
+    remaining_time = datetime.datetime.combine(datetime.datetime.now().date() + datetime.timedelta(days=1), 
+                                             datetime.datetime.min.time()) - datetime.datetime.now()
+    hours, remainder = divmod(remaining_time.seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
     
-    # Periksa batas penggunaan dengan parameter update untuk peringatan
-    if not check_usage_limit(user_id, update):
-        remaining_time = datetime.datetime.combine(datetime.datetime.now().date() + datetime.timedelta(days=1), 
-                                                 datetime.datetime.min.time()) - datetime.datetime.now()
-        hours, remainder = divmod(remaining_time.seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
+    await update.message.reply_text(
+        f"⚠️ *Batas Penggunaan Tercapai* ⚠️\n\n"
+        f"Anda telah mencapai batas {DAILY_LIMIT} penggunaan harian.\n\n"
+        f"Batasan akan direset dalam: {hours} jam {minutes} menit\n\n"
+        f"Upgrade ke versi premium untuk penggunaan tak terbatas!",
+        parse_mode="Markdown"
+    )
+
+def format_wait(seconds: Optional[float]) -> str:
+    """
+    Format an estimated wait for the user.
+    
+    Args:
+        seconds: Estimated wait in seconds, or None if unknown
+        
+    Returns:
+        Text such as "±40 detik" or "±3 menit"
+    """
+    if seconds is None:
+        return "belum diketahui"
+    if seconds < 60:
+        return f"±{max(5, round(seconds / 5) * 5)} detik"
+    return f"±{round(seconds / 60)} menit"
+
+async def admit_job(update: Update, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Ask the overload controller whether a new job may be queued.
+    
+    Runs before any quota is charged, so a rejected job costs the user nothing.
+    
+    Args:
+        update: Telegram update
+        user_id: ID pengguna Telegram
         
+    Returns:
+        The controller's decision, or None if the job was rejected (the user has been told)
+    """
+    decision = overload_controller.decide(user_id, user_weight(user_id))
+    load_stats = bot_stats["load"]
+    if decision["action"] == SHED:
+        load_stats["shed"] += 1
+        load_stats["shed_reasons"][decision["reason"]] += 1
         await update.message.reply_text(
-            f"⚠️ *Batas Penggunaan Tercapai* ⚠️\n\n"
-            f"Anda telah mencapai batas {DAILY_LIMIT} penggunaan harian.\n\n"
-            f"Batasan akan direset dalam: {hours} jam {minutes} menit\n\n"
-            f"Upgrade ke versi premium untuk penggunaan tak terbatas!",
-            parse_mode="Markdown"
+            "🚦 Bot sedang sangat sibuk.\n\n"
+            f"Perkiraan waktu tunggu saat ini {format_wait(decision['eta'])}. "
+            "Kuota Anda tidak dipotong, silakan kirim ulang link beberapa saat lagi."
         )
-        return
+        return None
+    load_stats["queued" if decision["action"] == QUEUE else "admitted"] += 1
+    return decision
+
+async def send_unsupported_url(update: Update) -> None:
+    """
+    Tell the user which URLs the bot supports.
     
-    # Lanjutkan dengan memproses URL
-    raw_url = update.message.text.strip()
+    Args:
+        update: Telegram update
+    """
+    await update.message.reply_text(
+        "❌ URL tidak didukung. Bot ini mendukung URL dari Instagram, Facebook, TikTok, dan YouTube Music.\n\n"
+        "Contoh URL yang didukung:\n"
+        "- Instagram: https://www.instagram.com/p/CGgDsi7JQdS/\n"
+        "- Facebook: https://www.facebook.com/share/r/1E9YVmQBkL/\n"
+        "- TikTok: https://vt.tiktok.com/ZSrB2pdbP/\n"
+        "- YouTube Music: https://music.youtube.com/watch?v=T3d5VNjaDss"
+    )
+
+def extract_message_urls(message: Message) -> List[str]:
+    """
+    Extract every link of a message, in order and without duplicates.
+    
+    URL and text-link entities are used when Telegram provides them, which also
+    covers links without a scheme; otherwise the text itself is scanned.
+    
+    Args:
+        message: Telegram message
+        
+    Returns:
+        List of URLs (empty if the message contains none)
+    """
+    urls = []
+    entities = message.parse_entities([MessageEntity.URL, MessageEntity.TEXT_LINK])
+    for entity, text in entities.items():
+        url = entity.url if entity.type == MessageEntity.TEXT_LINK else text
+        if url and url not in urls:
+            urls.append(url)
+    return urls or extract_urls(message.text or "")
+
+async def resolve_content(url_type: str, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Ask the platform API for the media of a URL without blocking the event loop.
+    
+    The request runs in a download worker process when DOWNLOAD_WORKERS is
+    set, otherwise in a thread of the bot process.
+    
+    Args:
+        url_type: 'instagram', 'facebook', 'tiktok' or 'youtube'
+        url: Social media URL
+        deadline: Optional job deadline
+        
+    Returns:
+        Response dictionary of the platform downloader's download_content
+    """
+    downloader = {
+        'instagram': instagram_downloader,
+        'facebook': facebook_downloader,
+        'tiktok': tiktok_downloader,
+        'youtube': youtube_downloader
+    }[url_type]
+    if download_workers:
+        if deadline:
+            deadline.check("resolve")
+        return await download_workers.call("resolve", url_type, url, deadline=deadline)
+    return await asyncio.to_thread(downloader.download_content, url, deadline)
+
+async def scrape_url(update: Update, context: ContextTypes.DEFAULT_TYPE, raw_url: str,
+                     content: Optional["asyncio.Task[Dict[str, Any]]"] = None) -> None:
+    """
+    Download and send the content of one social media URL.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+        raw_url: Social media URL
+        content: Optional task already resolving the API response for `raw_url`
+    """
     url_type = detect_url_type(raw_url)
     
     if url_type == 'instagram':
-        await scrape_instagram(update, context)
+        await scrape_instagram(update, context, raw_url, content)
     elif url_type == 'facebook':
-        await scrape_facebook(update, context)
+        await scrape_facebook(update, context, raw_url, content)
     elif url_type == 'tiktok':
-        await scrape_tiktok(update, context)
+        await scrape_tiktok(update, context, raw_url, content)
     elif url_type == 'youtube':
-        await scrape_youtube(update, context)
+        await scrape_youtube(update, context, raw_url, content)
     else:
-        await update.message.reply_text(
-            "❌ URL tidak didukung. Bot ini mendukung URL dari Instagram, Facebook, TikTok, dan YouTube Music.\n\n"
-            "Contoh URL yang didukung:\n"
-            "- Instagram: https://www.instagram.com/p/CGgDsi7JQdS/\n"
-            "- Facebook: https://www.facebook.com/share/r/1E9YVmQBkL/\n"
-            "- TikTok: https://vt.tiktok.com/ZSrB2pdbP/\n"
-            "- YouTube Music: https://music.youtube.com/watch?v=T3d5VNjaDss"
+        await send_unsupported_url(update)
+
+async def handle_social_media_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Handle all social media URLs and download content.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+    """
+    # Pesan bisa berisi banyak link; setiap link diproses sebagai item sendiri
+    urls = extract_message_urls(update.message)
+    if len(urls) > 1:
+        await handle_url_batch(update, context, urls)
+        return
+    
+    # Dapatkan user_id pengguna
+    user_id = update.effective_user.id
+    raw_url = urls[0] if urls else update.message.text.strip()
+    
+    # Link yang sama masih diproses: ikut job tersebut tanpa memotong kuota lagi
+    duplicate = find_duplicate_job(user_id, raw_url)
+    if duplicate:
+        await acknowledge_duplicate(update, duplicate, [canonical_content_id(raw_url)])
+        return
+    
+    # Saat bot kelebihan beban, tolak lebih awal sebelum kuota dipotong
+    decision = await admit_job(update, user_id)
+    if not decision:
+        return
+    
+    # Periksa batas penggunaan dengan parameter update untuk peringatan
+    if not check_usage_limit(user_id, update):
+        await send_limit_reached(update)
+        return
+    
+    job = Job(user_id, charged=1, content_ids=[canonical_content_id(raw_url)])
+    start_job(update, context, job, [raw_url], decision)
+
+async def handle_url_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, urls: List[str]) -> None:
+    """
+    Process every link of a multi-link message.
+    
+    Every link is a separate job in the fair queue, so up to USER_MAX_IN_FLIGHT
+    links are processed at a time and other users' jobs are interleaved with
+    them. Results are delivered strictly in message order: link k+1 is
+    downloaded while link k is uploaded. Quota is charged per supported link,
+    up to MAX_URLS_PER_MESSAGE links per message, and refunded for links that
+    fail; links still being processed for an earlier message are skipped and
+    not charged.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+        urls: Links extracted from the message
+    """
+    user_id = update.effective_user.id
+    over_limit = max(0, len(urls) - MAX_URLS_PER_MESSAGE)
+    urls = urls[:MAX_URLS_PER_MESSAGE]
+    supported = [url for url in urls if detect_url_type(url) != 'unknown']
+    unsupported = len(urls) - len(supported)
+    
+    if not supported:
+        await send_unsupported_url(update)
+        return
+    
+    # Ejaan lain dari konten yang sama (mis. youtu.be dan youtube.com) hanya diproses dan dibayar sekali
+    content_ids = set()
+    unique = []
+    for url in supported:
+        content_id = canonical_content_id(url)
+        if content_id not in content_ids:
+            content_ids.add(content_id)
+            unique.append(url)
+    repeated = len(supported) - len(unique)
+    supported = unique
+    
+    # Link yang masih diproses dari pesan sebelumnya tidak diproses ulang
+    duplicate_jobs = [find_duplicate_job(user_id, url) for url in supported]
+    duplicates = [job for job in duplicate_jobs if job]
+    supported_before_dedup = supported
+    supported = [url for url, job in zip(supported, duplicate_jobs) if not job]
+    if duplicates:
+        # Link bisa menumpang ke job yang berbeda-beda
+        attached: Dict[Job, List[str]] = {}
+        for url, duplicate in zip(supported_before_dedup, duplicate_jobs):
+            if duplicate:
+                attached.setdefault(duplicate, []).append(canonical_content_id(url))
+        for duplicate, duplicate_ids in attached.items():
+            await acknowledge_duplicate(update, duplicate, duplicate_ids)
+        if not supported:
+            return
+    
+    # Saat bot kelebihan beban, tolak seluruh pesan sebelum kuota dipotong
+    decision = await admit_job(update, user_id)
+    if not decision:
+        return
+    
+    # Kuota dihitung per link; link setelah kuota habis tidak diproses
+    accepted = []
+    for url in supported:
+        if not check_usage_limit(user_id):
+            break
+        accepted.append(url)
+    if not accepted:
+        await send_limit_reached(update)
+        return
+    
+    # Peringatan kuota cukup sekali untuk seluruh pesan
+    remaining = DAILY_LIMIT - user_usage[user_id]["count"]
+    if 0 < remaining <= 2:
+        asyncio.create_task(send_quota_warning(update, remaining))
+    
+    notes = []
+    if len(accepted) < len(supported):
+        notes.append(f"{len(supported) - len(accepted)} link tidak diproses karena kuota harian habis")
+    if duplicates:
+        notes.append(f"{len(duplicates)} link sudah sedang diproses dari pesan sebelumnya")
+    if repeated:
+        notes.append(f"{repeated} link menunjuk ke konten yang sama dengan link lain di pesan ini")
+    if unsupported:
+        notes.append(f"{unsupported} link tidak didukung")
+    if over_limit:
+        notes.append(f"{over_limit} link melebihi batas {MAX_URLS_PER_MESSAGE} link per pesan")
+    
+    job = Job(user_id, charged=len(accepted), content_ids=[canonical_content_id(url) for url in accepted])
+    start_job(update, context, job, accepted, decision, notes)
+
+async def process_link(update: Update, context: ContextTypes.DEFAULT_TYPE, job: Job, raw_url: str,
+                       decision: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Work of a single-link job: wait for a slot in the fair queue, then download and send.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+        job: Job of the request
+        raw_url: Social media URL
+        decision: Admission decision (shows the queue position if the job had to wait)
+    """
+    queue_message = None
+    if decision and decision["action"] == QUEUE:
+        queue_message = await update.message.reply_text(
+            f"🕒 Permintaan Anda masuk antrean ke-{decision['position']}.\n"
+            f"Perkiraan waktu tunggu: {format_wait(decision['eta'])}",
+            reply_markup=cancel_markup()
         )
+    
+    # Lanjutkan dengan memproses URL setelah mendapat giliran di antrean
+    async with job_scheduler.slot(job.user_id, user_weight(job.user_id)) as slot:
+        if queue_message:
+            try:
+                await queue_message.delete()
+            except Exception:
+                pass
+        def link_done() -> None:
+            # Disimpan ke job store agar job tidak dikirim ulang setelah restart
+            if not job.completed:
+                job.completed = 1
+                store_call(job_store.progress, job.job_id, job.completed)
+        
+        # Dicatat selesai begitu media terkirim, agar tombol batal setelahnya tidak mengembalikan kuota
+        turn = DeliveryTurn(slot=slot, on_delivered=link_done)
+        token = current_turn.set(turn)
+        try:
+            await scrape_url(update, context, raw_url)
+        finally:
+            current_turn.reset(token)
+        link_done()
+    
+    if not turn.delivered:
+        # Gagal tanpa dibatalkan (pesan error sudah dikirim): kuota dikembalikan
+        refund_quota(job.user_id, job.charged)
+        await notify_attached(job, "❌ Gagal memproses link ini. Silakan kirim ulang.")
+
+async def process_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, job: Job, urls: List[str],
+                        decision: Optional[Dict[str, Any]] = None, notes: Optional[List[str]] = None) -> None:
+    """
+    Work of a multi-link job; see handle_url_batch.
+    
+    Links already delivered before a restart (job.completed) are skipped.
+    
+    Args:
+        update: Telegram update
+        context: Callback context
+        job: Job of the request
+        urls: Accepted links in message order
+        decision: Admission decision (shows the queue position if the job had to wait)
+        notes: Remarks about skipped links, sent after the last link
+    """
+    weight = user_weight(job.user_id)
+    pending = list(enumerate(urls, 1))[job.completed:]
+    status_text = f"⏳ Memproses {len(pending)} link..."
+    if decision and decision["action"] == QUEUE:
+        status_text += f"\n🕒 Antrean ke-{decision['position']}, perkiraan waktu tunggu: {format_wait(decision['eta'])}"
+    status_message = await update.message.reply_text(status_text, reply_markup=cancel_markup())
+    
+    failed = []
+    
+    def link_done() -> None:
+        job.completed += 1
+        store_call(job_store.progress, job.job_id, job.completed)
+    
+    async def run_link(index: int, url: str, previous: Optional[asyncio.Task], window: Optional[asyncio.Task]) -> None:
+        # Paling banyak satu link diunduh di depan link yang sedang dikirim
+        if window:
+            await asyncio.wait([window])
+        async with job_scheduler.slot(job.user_id, weight) as slot:
+            # Unduhan langsung berjalan; pengiriman menunggu link sebelumnya (slot dilepas selama menunggu).
+            # Link dicatat selesai saat hasil pertamanya terkirim; saat itu semua link sebelumnya sudah selesai
+            turn = DeliveryTurn(previous, slot, on_delivered=link_done)
+            current_turn.set(turn)
+            content = asyncio.create_task(resolve_content(detect_url_type(url), url, new_deadline()))
+            try:
+                try:
+                    await status_message.edit_text(f"⏳ Memproses link {index}/{len(urls)}...",
+                                                   reply_markup=cancel_markup())
+                except Exception:
+                    pass
+                await scrape_url(update, context, url, content)
+            finally:
+                content.cancel()
+            if not turn.delivered:
+                # Link yang gagal dicatat selesai setelah link sebelumnya, agar lanjutan setelah restart tepat
+                await turn.wait()
+                link_done()
+        
+        if not turn.delivered:
+            # Gagal tanpa dibatalkan (pesan error sudah dikirim): kuota link ini dikembalikan
+            refund_quota(job.user_id, 1)
+            failed.append(index)
+            await notify_attached(job, "❌ Gagal memproses link ini. Silakan kirim ulang.", canonical_content_id(url))
+    
+    tasks = []
+    for index, url in pending:
+        tasks.append(asyncio.create_task(run_link(
+            index, url, tasks[-1] if tasks else None, tasks[-2] if len(tasks) >= 2 else None
+        )))
+    try:
+        await asyncio.wait(tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        try:
+            await status_message.delete()
+        except Exception:
+            pass
+    
+    notes = list(notes or [])
+    if failed:
+        notes.append(f"{len(failed)} link gagal diproses, kuotanya dikembalikan")
+    if notes:
+        await update.message.reply_text("⚠️ " + "\n⚠️ ".join(notes))
 
-async def scrape_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def scrape_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE, raw_url: Optional[str] = None,
+                           content: Optional["asyncio.Task[Dict[str, Any]]"] = None) -> None:
     """
     Handle Instagram URL and download content.
     
     Args:
         update: Telegram update
         context: Callback context
+        raw_url: URL to process (defaults to the message text)
+        content: Optional task already resolving the API response for `raw_url`
     """
-    raw_url = update.message.text.strip()
+    raw_url = raw_url or update.message.text.strip()
     
     # Check if it's a valid Instagram URL using the utility function
     if not is_valid_instagram_url(raw_url):
@@ -1151,13 +2520,14 @@ async def scrape_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
     
     processing_msg = None
+    deadline = new_deadline()
     
     try:
         # Send processing message
-        processing_msg = await update.message.reply_text("⏳ Sedang memproses Instagram...")
+        processing_msg = await update.message.reply_text("⏳ Sedang memproses Instagram...", reply_markup=cancel_markup())
         
         # Use InstagramDownloader to fetch content
-        data = instagram_downloader.download_content(raw_url)
+        data = await (content or resolve_content('instagram', raw_url, deadline))
         
         # Delete processing message
         if processing_msg:
@@ -1168,8 +2538,11 @@ async def scrape_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             return
         
         # Send media
-        await send_media(update, data['data'], raw_url)
+        await send_media(update, data['data'], raw_url, deadline)
         
+    except DeadlineExceeded as e:
+        logger.warning(f"Deadline exceeded in scrape_instagram: {str(e)}")
+        await update.message.reply_text("⌛ Waktu pemrosesan habis. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error in scrape_instagram: {str(e)}")
         await update.message.reply_text(f"❌ Terjadi kesalahan: {str(e)}")
@@ -1179,15 +2552,18 @@ async def scrape_instagram(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             except:
                 pass
 
-async def scrape_facebook(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def scrape_facebook(update: Update, context: ContextTypes.DEFAULT_TYPE, raw_url: Optional[str] = None,
+                          content: Optional["asyncio.Task[Dict[str, Any]]"] = None) -> None:
     """
     Handle Facebook URL and download content.
     
     Args:
         update: Telegram update
         context: Callback context
+        raw_url: URL to process (defaults to the message text)
+        content: Optional task already resolving the API response for `raw_url`
     """
-    raw_url = update.message.text.strip()
+    raw_url = raw_url or update.message.text.strip()
     
     # Check if it's a valid Facebook URL using the utility function
     if not is_valid_facebook_url(raw_url):
@@ -1210,13 +2586,14 @@ async def scrape_facebook(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     processing_msg = None
+    deadline = new_deadline()
     
     try:
         # Send processing message
-        processing_msg = await update.message.reply_text("⏳ Sedang memproses Facebook...")
+        processing_msg = await update.message.reply_text("⏳ Sedang memproses Facebook...", reply_markup=cancel_markup())
         
         # Use FacebookDownloader to fetch content
-        data = facebook_downloader.download_content(raw_url)
+        data = await (content or resolve_content('facebook', raw_url, deadline))
         
         # Delete processing message
         if processing_msg:
@@ -1227,8 +2604,11 @@ async def scrape_facebook(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
         
         # Send media
-        await send_media(update, data['data'], raw_url)
+        await send_media(update, data['data'], raw_url, deadline)
         
+    except DeadlineExceeded as e:
+        logger.warning(f"Deadline exceeded in scrape_facebook: {str(e)}")
+        await update.message.reply_text("⌛ Waktu pemrosesan habis. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error in scrape_facebook: {str(e)}")
         await update.message.reply_text(f"❌ Terjadi kesalahan: {str(e)}")
@@ -1238,15 +2618,18 @@ async def scrape_facebook(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             except:
                 pass
 
-async def scrape_tiktok(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def scrape_tiktok(update: Update, context: ContextTypes.DEFAULT_TYPE, raw_url: Optional[str] = None,
+                        content: Optional["asyncio.Task[Dict[str, Any]]"] = None) -> None:
     """
     Handle TikTok URL and download content.
     
     Args:
         update: Telegram update
         context: Callback context
+        raw_url: URL to process (defaults to the message text)
+        content: Optional task already resolving the API response for `raw_url`
     """
-    raw_url = update.message.text.strip()
+    raw_url = raw_url or update.message.text.strip()
     
     # Check if it's a valid TikTok URL using the utility function
     if not is_valid_tiktok_url(raw_url):
@@ -1254,13 +2637,14 @@ async def scrape_tiktok(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
     
     processing_msg = None
+    deadline = new_deadline()
     
     try:
         # Send processing message
-        processing_msg = await update.message.reply_text("⏳ Sedang memproses TikTok...")
+        processing_msg = await update.message.reply_text("⏳ Sedang memproses TikTok...", reply_markup=cancel_markup())
         
         # Use TiktokDownloader to fetch content
-        data = tiktok_downloader.download_content(raw_url)
+        data = await (content or resolve_content('tiktok', raw_url, deadline))
         
         # Delete processing message
         if processing_msg:
@@ -1270,36 +2654,13 @@ async def scrape_tiktok(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         if not await handle_api_response(update, data):
             return
         
-        # Cek apakah ini adalah konten yang berisi gambar+suara
-        media_list = data['data'].get('media', [])
-        contains_photos = any(item.get('type') == 'photo' for item in media_list)
-        contains_audio = any(item.get('type') == 'audio' for item in media_list)
-        photo_count = sum(1 for item in media_list if item.get('type') == 'photo')
-        
-        # Jika berisi gambar dan jumlahnya > 5, kirim dalam beberapa grup
-        if contains_photos and photo_count > 5:
-            photos = [item for item in media_list if item.get('type') == 'photo']
-            audio = next((item for item in media_list if item.get('type') == 'audio'), None)
-            
-            # Kirim gambar dalam batch (maksimal 5 gambar per batch)
-            for i in range(0, len(photos), 5):
-                batch = photos[i:i+5]
-                # Modifikasi data untuk satu batch
-                batch_data = {
-                    "media": batch
-                }
-                await send_media(update, batch_data, raw_url)
-            
-            # Kirim audio secara terpisah jika ada
-            if audio:
-                audio_data = {
-                    "media": [audio]
-                }
-                await send_media(update, audio_data, raw_url)
-        else:
-            # Kirim semua media seperti biasa
-            await send_media(update, data['data'], raw_url)
+        # Slideshow dengan banyak gambar dipecah menjadi beberapa album oleh send_media_group,
+        # audio dikirim setelah album terakhir
+        await send_media(update, data['data'], raw_url, deadline)
         
+    except DeadlineExceeded as e:
+        logger.warning(f"Deadline exceeded in scrape_tiktok: {str(e)}")
+        await update.message.reply_text("⌛ Waktu pemrosesan habis. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error in scrape_tiktok: {str(e)}")
         await update.message.reply_text(f"❌ Terjadi kesalahan: {str(e)}")
@@ -1331,7 +2692,7 @@ async def fetch_youtube_content(url: str) -> Dict[str, Any]:
         
         # Make API request with 'accept: application/json' header
         headers = {'accept': 'application/json'}
-        response = requests.get(request_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = requests.get(request_url, headers=headers, timeout=request_timeout())
         response.raise_for_status()
         
         data = response.json()
@@ -1350,22 +2711,32 @@ async def fetch_youtube_content(url: str) -> Dict[str, Any]:
         logger.error(f"Unexpected error: {str(e)}")
         return {"status": "error", "message": f"Unexpected error: {str(e)}"}
 
-async def scrape_youtube(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def scrape_youtube(update: Update, context: ContextTypes.DEFAULT_TYPE, raw_url: Optional[str] = None,
+                         content: Optional["asyncio.Task[Dict[str, Any]]"] = None) -> None:
     """
     Handle YouTube Music URL and download content.
     
     Args:
         update: Telegram update
         context: Callback context
+        raw_url: URL to process (defaults to the message text)
+        content: Optional task already resolving the API response for `raw_url`
     """
-    raw_url = update.message.text.strip()
+    raw_url = raw_url or update.message.text.strip()
     
     # Check if it's a valid YouTube URL using the utility function
     if not is_valid_youtube_url(raw_url):
         await update.message.reply_text("❌ URL YouTube tidak valid.")
         return
     
+    # Link playlist (list=) diperluas menjadi semua lagunya
+    playlist_id = youtube_playlist_id(raw_url)
+    if playlist_id:
+        await scrape_youtube_playlist(update, raw_url, playlist_id)
+        return
+    
     processing_msg = None
+    deadline = new_deadline()
     
     try:
         # Determine if it's YouTube Music or regular YouTube
@@ -1373,10 +2744,10 @@ async def scrape_youtube(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         message_text = "⏳ Sedang memproses YouTube Music..." if is_music else "⏳ Sedang memproses YouTube Audio..."
         
         # Send processing message
-        processing_msg = await update.message.reply_text(message_text)
+        processing_msg = await update.message.reply_text(message_text, reply_markup=cancel_markup())
         
         # Use YoutubeDownloader to fetch content
-        data = youtube_downloader.download_content(raw_url)
+        data = await (content or resolve_content('youtube', raw_url, deadline))
         
         # Log data for debugging
         logger.info(f"YouTube data received: {data}")
@@ -1397,10 +2768,13 @@ async def scrape_youtube(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             logger.info(f"Processing audio: '{title}' by '{author}'")
             
             # Send media
-            await send_media(update, data['data'], raw_url)
+            await send_media(update, data['data'], raw_url, deadline)
         else:
             await update.message.reply_text("❌ Tidak dapat mengunduh audio dari YouTube.")
         
+    except DeadlineExceeded as e:
+        logger.warning(f"Deadline exceeded in scrape_youtube: {str(e)}")
+        await update.message.reply_text("⌛ Waktu pemrosesan habis. Silakan coba lagi nanti.")
     except Exception as e:
         logger.error(f"Error in scrape_youtube: {str(e)}")
         await update.message.reply_text(f"❌ Terjadi kesalahan: {str(e)}")
@@ -1410,6 +2784,159 @@ async def scrape_youtube(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             except:
                 pass
 
+async def scrape_youtube_playlist(update: Update, raw_url: str, playlist_id: str) -> None:
+    """
+    Send every track of a YouTube playlist as audio, in playlist order.
+    
+    Track IDs are read while the playlist page is still downloading. Up to
+    PLAYLIST_CONCURRENCY tracks are resolved with the ytmp3 API and downloaded at
+    the same time, and each track is uploaded as soon as it and every track
+    before it are ready. Progress of all tracks is shown in one status message.
+    
+    The playlist link paid for its first track; every further track costs one
+    more unit of quota, and listing stops when the quota runs out. Quota of
+    tracks that were not sent is refunded at the end.
+    
+    Args:
+        update: Telegram update
+        raw_url: Playlist URL
+        playlist_id: Value of the `list` parameter
+    """
+    is_music = 'music.youtube.com' in raw_url.lower()
+    track_base_url = "https://music.youtube.com/watch?v=" if is_music else "https://www.youtube.com/watch?v="
+    user_id = update.effective_user.id
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, PLAYLIST_CONCURRENCY))
+    track_queue: "asyncio.Queue[Optional[asyncio.Task]]" = asyncio.Queue()
+    track_tasks: List[asyncio.Task] = []
+    tracks: List[Dict[str, Any]] = []
+    state = {"listing": True, "sent": 0, "dirty": True, "charged": 0, "out_of_quota": False}
+    stop_listing = threading.Event()
+    
+    def render() -> str:
+        icons = {"queued": "⌛", "working": "⏳", "sent": "✅", "failed": "❌"}
+        total = f"{len(tracks)}+" if state["listing"] else str(len(tracks))
+        lines = [f"🎵 Playlist YouTube: {state['sent']}/{total} lagu terkirim"]
+        for number, track in enumerate(tracks, 1):
+            lines.append(f"{icons[track['status']]} {number}. {track['title'][:40]}")
+        return "\n".join(lines)
+    
+    def set_status(track: Dict[str, Any], status: str) -> None:
+        track["status"] = status
+        state["dirty"] = True
+    
+    async def prepare_track(track: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            set_status(track, "working")
+            track_url = f"{track_base_url}{track['video_id']}"
+            deadline = new_deadline()
+            data = await resolve_content('youtube', track_url, deadline)
+            if data.get('status') != 'success' or not data['data'].get('media'):
+                logger.warning(f"Playlist track {track['video_id']} unavailable: {data.get('message')}")
+                return None
+            media = data['data']['media'][0]
+            audio_info = get_audio_info(media, track_url, "")
+            track["title"] = audio_info["title"] or track["title"]
+            state["dirty"] = True
+            file_obj, thumbnail = await asyncio.gather(
+                await_download(download_media(media.get('downloadUrl') or media.get('url'), deadline=deadline,
+                                              cache_key=media_cache_key(track_url, media)), deadline),
+                download_thumbnail(audio_info["thumbnail_url"], deadline)
+            )
+            return {"file": file_obj, "thumbnail": thumbnail, "audio_info": audio_info}
+    
+    def list_tracks() -> None:
+        # Berjalan di thread: setiap ID langsung dijadwalkan begitu ditemukan
+        try:
+            for video_id in youtube_downloader.iter_playlist_video_ids(playlist_id, PLAYLIST_MAX_TRACKS):
+                if stop_listing.is_set():
+                    break
+                loop.call_soon_threadsafe(start_track, video_id)
+        finally:
+            loop.call_soon_threadsafe(track_queue.put_nowait, None)
+    
+    def start_track(video_id: str) -> None:
+        if stop_listing.is_set():
+            return
+        # Lagu pertama sudah dibayar oleh link playlist; lagu berikutnya memotong kuota sendiri
+        if tracks:
+            if not check_usage_limit(user_id):
+                state["out_of_quota"] = True
+                stop_listing.set()
+                return
+            state["charged"] += 1
+        track = {"video_id": video_id, "title": video_id, "status": "queued"}
+        tracks.append(track)
+        state["dirty"] = True
+        task = asyncio.create_task(prepare_track(track))
+        track_tasks.append(task)
+        track_queue.put_nowait(task)
+    
+    async def refresh_status() -> None:
+        # Edit pesan paling sering sekali per 2 detik agar tidak terkena rate limit
+        while True:
+            await asyncio.sleep(2)
+            if state["dirty"]:
+                state["dirty"] = False
+                try:
+                    await status_message.edit_text(render(), reply_markup=cancel_markup())
+                except Exception as e:
+                    logger.debug(f"Could not update playlist status: {str(e)}")
+    
+    status_message = await update.message.reply_text("⏳ Memuat daftar lagu playlist...", reply_markup=cancel_markup())
+    lister = asyncio.create_task(asyncio.to_thread(list_tracks))
+    refresher = asyncio.create_task(refresh_status())
+    index = 0
+    try:
+        while True:
+            task = await track_queue.get()
+            if task is None:
+                break
+            track = tracks[index]
+            index += 1
+            try:
+                prepared = await task
+            except DeadlineExceeded:
+                prepared = None
+            except Exception as e:
+                logger.error(f"Error preparing playlist track {track['video_id']}: {str(e)}")
+                prepared = None
+            
+            if not prepared or not prepared["file"] or prepared["file"] == TOO_LARGE:
+                set_status(track, "failed")
+                if prepared:
+                    release_media(prepared["file"], prepared["thumbnail"])
+                continue
+            try:
+                await send_audio(update, prepared["file"], prepared["audio_info"], prepared["thumbnail"])
+                set_status(track, "sent")
+                state["sent"] += 1
+            except Exception as e:
+                logger.error(f"Error sending playlist track {track['video_id']}: {str(e)}")
+                set_status(track, "failed")
+            finally:
+                release_media(prepared["file"], prepared["thumbnail"])
+        
+        state["listing"] = False
+        await lister
+        if not tracks:
+            await status_message.edit_text("❌ Playlist kosong atau tidak dapat dimuat.")
+        else:
+            await status_message.edit_text(
+                render() + ("\n⚠️ Kuota harian habis, lagu berikutnya tidak diproses." if state["out_of_quota"] else "")
+            )
+    finally:
+        stop_listing.set()
+        refresher.cancel()
+        # Lagu yang belum dikirim (gagal atau dibatalkan) dihentikan dan hasilnya dihapus
+        for task in track_tasks[index:]:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and not task.exception() and task.result():
+                release_media(task.result()["file"], task.result()["thumbnail"])
+        # Kuota lagu tambahan yang tidak terkirim dikembalikan; lagu pertama diurus oleh job
+        refund_quota(user_id, min(state["charged"], 1 + state["charged"] - state["sent"]))
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle errors in the dispatcher."""
     logger.error(f"Update {update} caused error {context.error}")
@@ -1422,6 +2949,12 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button callbacks."""
     query = update.callback_query
+    
+    # Tombol batal pada pesan status job; pesan lain tidak disentuh
+    if query.data and query.data.startswith(CANCEL_PREFIX):
+        await cancel_job_callback(query)
+        return
+    
     await query.answer()  # Acknowledge the button press
     
     # Get the callback data
@@ -1644,8 +3177,24 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
 
 def main() -> None:
     """Start the bot."""
+    init_bot_state()
+    
     # Create the Application
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
+    builder = ApplicationBuilder().token(BOT_TOKEN)
+    if LOCAL_BOT_API:
+        # Server Bot API lokal membaca file langsung dari path, tanpa upload ulang
+        builder = (
+            builder.base_url(f"{TELEGRAM_API_URL}/bot")
+            .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+            .local_mode(True)
+        )
+    # Update diproses bersamaan; job unduhan diatur oleh job_scheduler dan dicatat di job_store
+    application = (
+        builder.concurrent_updates(True)
+        .post_init(on_startup)
+        .post_stop(drain_jobs)
+        .build()
+    )
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
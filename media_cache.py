@@ -0,0 +1,274 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from io import BytesIO
+
+from config import MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya dikunci antarthread dalam satu proses
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """
+    Content-addressed on-disk media cache with a byte-size cap and LRU eviction.
+
+    Blobs are stored once under the SHA-256 of their bytes, so the same media
+    reached through different URLs or CDN hosts is kept only once. Lookup keys
+    (canonical content IDs, media URLs) are small files that point to a blob.
+    Every write goes to a temporary file first and is moved into place with
+    `os.replace`, so readers never see a partial file, even across processes.
+
+    Several processes (e.g. download workers) may share the directory. Stores
+    and evictions hold a file lock. Each process keeps a running byte total,
+    seeded by one scan at startup, and rescans the directory only when that
+    total passes the cap, so eviction also sees blobs stored by other processes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the cache
+            max_bytes: Maximum total size of stored blobs in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.keys_dir = os.path.join(cache_dir, "keys")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.keys_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(cache_dir, ".lock")
+        self.total_size = sum(size for _, size, _ in self._scan_blobs())
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.keys_dir, self._hash(key.encode('utf-8')))
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the cache lock across threads and, where supported, across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _scan_blobs(self) -> List[Tuple[str, int, float]]:
+        """Return (path, size, last access) of every stored blob."""
+        blobs = []
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((path, stat.st_size, stat.st_mtime))
+        return blobs
+
+    def lookup(self, *keys: str) -> Optional[str]:
+        """
+        Find a cached blob by any of the given keys.
+
+        Args:
+            keys: Lookup keys, tried in order (empty keys are skipped)
+
+        Returns:
+            Path of the blob, or None on a miss
+        """
+        for key in keys:
+            if not key:
+                continue
+            try:
+                with open(self._key_path(key), 'r') as key_file:
+                    digest = key_file.read().strip()
+            except FileNotFoundError:
+                continue
+
+            blob_path = self._blob_path(digest)
+            try:
+                # mtime menandai akses terakhir untuk eviksi LRU
+                os.utime(blob_path)
+            except FileNotFoundError:
+                # Blob sudah dieviksi, hapus kunci yang basi
+                self._remove(self._key_path(key))
+                continue
+
+            with self._lock:
+                self.hits += 1
+            return blob_path
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, keys: List[str], data: Optional[bytes] = None, source_path: Optional[str] = None,
+            source_file: Optional[BinaryIO] = None) -> Optional[str]:
+        """
+        Store media and point every key at it.
+
+        The media is copied in chunks into a temporary file while it is
+        hashed, so it is never duplicated in memory. Cache errors (e.g. a full
+        disk) are logged and never propagate, so a failing cache does not fail
+        the download that fed it.
+
+        Args:
+            keys: Lookup keys for the media (empty keys are skipped)
+            data: Media bytes
+            source_path: File holding the media bytes
+            source_file: Seekable file object holding the media bytes (its position is kept)
+
+        Returns:
+            SHA-256 hex digest of the stored bytes, or None if the media was not stored
+        """
+        try:
+            if source_path is not None:
+                with open(source_path, 'rb') as path_file:
+                    return self._store(keys, path_file)
+            if source_file is None:
+                source_file = BytesIO(data)
+            position = source_file.tell()
+            try:
+                return self._store(keys, source_file)
+            finally:
+                source_file.seek(position)
+        except OSError as e:
+            logger.warning(f"Could not store media in cache: {str(e)}")
+            return None
+
+    def _store(self, keys: List[str], source: BinaryIO) -> Optional[str]:
+        """Copy `source` into the objects directory under its SHA-256 and write the keys."""
+        size = source.seek(0, os.SEEK_END)
+        if size > self.max_bytes:
+            return None
+        source.seek(0)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, prefix=".tmp-")
+        try:
+            sha256 = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+                    tmp_file.write(chunk)
+            digest = sha256.hexdigest()
+
+            blob_path = self._blob_path(digest)
+            with self._locked():
+                if os.path.exists(blob_path):
+                    # Byte identik dari URL lain: cukup tambahkan kunci baru
+                    os.utime(blob_path)
+                else:
+                    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                    os.replace(tmp_path, blob_path)
+                    self.total_size += size
+                for key in keys:
+                    if key:
+                        self._atomic_write(self._key_path(key), digest.encode('ascii'))
+                if self.total_size > self.max_bytes:
+                    self._evict()
+            return digest
+        finally:
+            self._remove(tmp_path)
+
+    def copy_to(self, blob_path: str, dest_path: str) -> None:
+        """
+        Materialize a cached blob at `dest_path`, hard-linking when possible.
+
+        Args:
+            blob_path: Path returned by lookup()
+            dest_path: Destination file path
+        """
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            shutil.copyfile(blob_path, dest_path)
+
+    def _evict(self) -> None:
+        """
+        Rescan the stored size and, above the cap, remove least recently used blobs down to 90% of it.
+
+        Called with the cache lock held once the running total passes the cap;
+        the scan corrects the total for blobs stored or evicted by other processes.
+        """
+        blobs = sorted(self._scan_blobs(), key=lambda blob: blob[2])
+        self.total_size = sum(size for _, size, _ in blobs)
+        if self.total_size <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for path, size, _ in blobs:
+            if self.total_size <= target:
+                break
+            self._remove(path)
+            self.total_size -= size
+            logger.info(f"Evicted cached media {os.path.basename(path)} ({size / (1024 * 1024):.1f} MB)")
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_media_cache: Optional[MediaCache] = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> Optional[MediaCache]:
+    """
+    Return the shared media cache, creating it on first use.
+
+    Returns:
+        MediaCache instance, or None if caching is disabled (MEDIA_CACHE_MAX_MB=0)
+    """
+    global _media_cache
+    if MEDIA_CACHE_MAX_MB <= 0:
+        return None
+    with _media_cache_lock:
+        if _media_cache is None:
+            try:
+                _media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB * 1024 * 1024)
+            except OSError as e:
+                logger.error(f"Media cache disabled, cannot use {MEDIA_CACHE_DIR}: {str(e)}")
+                return None
+        return _media_cache
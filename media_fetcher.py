@@ -0,0 +1,528 @@
+import os
+import uuid
+import logging
+import threading
+import requests
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+from io import BytesIO
+from pathlib import Path
+
+from config import (
+    MAX_FILE_SIZE_MB, MAX_RETRIES, RANGE_SEGMENTS, RANGE_MIN_SIZE_MB,
+    LOCAL_BOT_API_DIR, LOCAL_MAX_FILE_SIZE_MB
+)
+from deadline import Deadline, PHASE_IDLE, request_timeout, set_idle_timeout
+from media_cache import MediaCache, get_media_cache
+
+logger = logging.getLogger(__name__)
+
+# Nilai kembali jika ukuran media melebihi batas
+TOO_LARGE = "TOO_LARGE"
+
+# Batas media yang ditampung di memori (BytesIO, thumbnail, streaming upload)
+MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024
+# Server Bot API lokal menerima file jauh lebih besar; hanya untuk unduhan ke file (dest_path)
+LOCAL_MAX_FILE_SIZE = LOCAL_MAX_FILE_SIZE_MB * 1024 * 1024
+RANGE_MIN_SIZE = RANGE_MIN_SIZE_MB * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Callback progress: (bytes terunduh, total bytes atau 0 jika tidak diketahui)
+ProgressCallback = Callable[[int, int], None]
+
+
+class RangeDownloadError(Exception):
+    """Raised when a segmented download cannot be completed and must fall back to one stream."""
+
+
+def media_filename(url: str) -> str:
+    """
+    Derive a file name for a media URL.
+
+    Args:
+        url: Media URL
+
+    Returns:
+        Last path segment of the URL (may be empty)
+    """
+    return os.path.basename(urllib.parse.urlsplit(url).path)
+
+
+def local_media_path(url: str) -> str:
+    """
+    Build a unique file path for a media URL inside the local Bot API server directory.
+
+    Args:
+        url: Media URL
+
+    Returns:
+        Absolute path under LOCAL_BOT_API_DIR
+    """
+    os.makedirs(LOCAL_BOT_API_DIR, exist_ok=True)
+    filename = media_filename(url) or "media"
+    return os.path.abspath(os.path.join(LOCAL_BOT_API_DIR, f"{uuid.uuid4().hex}_{filename}"))
+
+
+def release_media(*files: Any) -> None:
+    """
+    Delete downloaded media files that were written to disk.
+
+    In-memory results (BytesIO), "TOO_LARGE" and None are ignored.
+
+    Args:
+        files: Values returned by fetch_media
+    """
+    for file_obj in files:
+        if isinstance(file_obj, Path):
+            try:
+                file_obj.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove media file {file_obj}: {str(e)}")
+
+
+def supports_ranges(response: requests.Response) -> bool:
+    """
+    Check whether a response advertises byte-range support for its raw body.
+
+    Args:
+        response: Response whose headers have been received
+
+    Returns:
+        True if the server accepts `Range: bytes=...` for this resource
+    """
+    accept_ranges = response.headers.get('Accept-Ranges', '').lower()
+    # Body yang dikompresi tidak bisa dipotong berdasarkan offset byte mentah
+    encoding = response.headers.get('Content-Encoding', 'identity').lower()
+    return accept_ranges == 'bytes' and encoding in ('', 'identity')
+
+
+def split_ranges(total_size: int, segments: int) -> List[Tuple[int, int]]:
+    """
+    Split a body of `total_size` bytes into inclusive byte ranges.
+
+    Args:
+        total_size: Total body length in bytes
+        segments: Number of ranges to produce
+
+    Returns:
+        List of (start, end) tuples, `end` inclusive
+    """
+    segment_size = -(-total_size // segments)
+    return [(start, min(start + segment_size, total_size) - 1)
+            for start in range(0, total_size, segment_size)]
+
+
+def probe_media(url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Probe a media URL for availability and size without downloading the body.
+
+    A HEAD request is tried first; servers that reject HEAD are asked for the
+    first byte with `Range: bytes=0-0` and the size is read from `Content-Range`.
+
+    Args:
+        url: Media URL
+        deadline: Optional job deadline
+
+    Returns:
+        Dictionary with "url", "ok", "status", "size" (0 if unknown),
+        "content_type" and "accept_ranges"
+    """
+    result = {"url": url, "ok": False, "status": 0, "size": 0, "content_type": "", "accept_ranges": False}
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=request_timeout(deadline))
+        if response.status_code in (403, 405, 501):
+            response = requests.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=request_timeout(deadline))
+            response.close()
+    except requests.RequestException as e:
+        logger.warning(f"Error probing media {url}: {str(e)}")
+        return result
+
+    result["status"] = response.status_code
+    result["ok"] = response.status_code in (200, 206)
+    result["content_type"] = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    result["accept_ranges"] = supports_ranges(response) or response.status_code == 206
+    if response.status_code == 206:
+        # Content-Range: bytes 0-0/12345
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        result["size"] = int(total) if total.isdigit() else 0
+    else:
+        result["size"] = int(response.headers.get('Content-Length', 0) or 0)
+    return result
+
+
+def fetch_media(url: str,
+                deadline: Optional[Deadline] = None,
+                max_bytes: int = MAX_FILE_SIZE,
+                progress: Optional[ProgressCallback] = None,
+                dest_path: Optional[str] = None,
+                cache_key: Optional[str] = None) -> Union[BytesIO, Path, str, None]:
+    """
+    Download a media file with a single streamed GET.
+
+    The on-disk media cache is checked first, by `cache_key` and by the media
+    URL, and every successful download is stored under both keys.
+
+    The size limit is enforced from the `Content-Length` header as soon as the
+    headers arrive, and otherwise from a running byte count, so an oversized
+    body is abandoned without a separate HEAD round trip. Large files on
+    servers that advertise `Accept-Ranges: bytes` are fetched as several
+    concurrent byte ranges instead.
+
+    Args:
+        url: Media URL
+        deadline: Optional job deadline; raises DeadlineExceeded when it runs out
+        max_bytes: Maximum accepted size in bytes
+        progress: Optional callback called with (downloaded, total) after each chunk
+        dest_path: Optional file path; when given the media is written there instead of to memory
+        cache_key: Optional canonical key of the media, e.g. the post's content ID plus item index
+
+    Returns:
+        BytesIO object containing the media (or the Path of `dest_path`), None if
+        the download failed, or the string "TOO_LARGE" if the file exceeds `max_bytes`
+
+    Raises:
+        DeadlineExceeded: If the job deadline runs out
+    """
+    cache = get_media_cache()
+    if cache is not None:
+        cached = _from_cache(cache, url, cache_key, max_bytes, progress, dest_path)
+        if cached is not None:
+            return cached
+
+    if dest_path is None:
+        content = _fetch_into(url, BytesIO(), deadline, max_bytes, progress)
+        if isinstance(content, BytesIO):
+            content.seek(0)
+            content.name = media_filename(url)
+            if cache is not None:
+                cache.put([cache_key, url], source_file=content)
+        return content
+
+    # Tulis langsung ke file, misalnya direktori bersama server Bot API lokal
+    completed = False
+    try:
+        with open(dest_path, 'w+b') as sink:
+            content = _fetch_into(url, sink, deadline, max_bytes, progress)
+        completed = content is sink
+        if completed and cache is not None:
+            cache.put([cache_key, url], source_path=dest_path)
+        return Path(dest_path) if completed else content
+    finally:
+        if not completed and os.path.exists(dest_path):
+            os.remove(dest_path)
+
+
+def _from_cache(cache: MediaCache,
+                url: str,
+                cache_key: Optional[str],
+                max_bytes: int,
+                progress: Optional[ProgressCallback],
+                dest_path: Optional[str]) -> Union[BytesIO, Path, str, None]:
+    """
+    Serve a media file from the on-disk cache.
+
+    Returns:
+        Same values as fetch_media, or None on a cache miss
+    """
+    blob_path = cache.lookup(cache_key, url)
+    if blob_path is None:
+        return None
+
+    try:
+        size = os.path.getsize(blob_path)
+        if size > max_bytes:
+            return TOO_LARGE
+        if dest_path is not None:
+            cache.copy_to(blob_path, dest_path)
+            content = Path(dest_path)
+        else:
+            with open(blob_path, 'rb') as blob_file:
+                content = BytesIO(blob_file.read())
+            content.name = media_filename(url)
+    except OSError as e:
+        # Blob bisa dieviksi di antara lookup dan pembacaan
+        logger.warning(f"Cached media unavailable, downloading again: {str(e)}")
+        return None
+
+    logger.info(f"Media cache hit for {cache_key or url} ({size / (1024 * 1024):.2f} MB)")
+    if progress:
+        progress(size, size)
+    return content
+
+
+def _fetch_into(url: str,
+                sink: BinaryIO,
+                deadline: Optional[Deadline],
+                max_bytes: int,
+                progress: Optional[ProgressCallback]) -> Union[BinaryIO, str, None]:
+    """Download `url` into `sink`, returning the sink, "TOO_LARGE" or None."""
+    try:
+        response = requests.get(url, stream=True, timeout=request_timeout(deadline))
+    except requests.RequestException as e:
+        logger.error(f"Error requesting media: {str(e)}")
+        return None
+
+    with response:
+        try:
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.error(f"Error requesting media: {str(e)}")
+            return None
+
+        total_size = int(response.headers.get('Content-Length', 0) or 0)
+        if total_size > max_bytes:
+            logger.warning(f"File terlalu besar: {total_size / (1024 * 1024):.2f} MB > {max_bytes / (1024 * 1024):.0f} MB")
+            return TOO_LARGE
+
+        if progress:
+            progress(0, total_size)
+
+        # Header sudah diterima, selanjutnya batasi jeda antar chunk saja
+        set_idle_timeout(response, request_timeout(deadline, PHASE_IDLE)[1])
+
+        if not (RANGE_SEGMENTS > 1 and total_size >= RANGE_MIN_SIZE and supports_ranges(response)):
+            return _fetch_single(url, response, sink, total_size, deadline, max_bytes, progress)
+
+        try:
+            return _fetch_ranges(url, response, sink, total_size, deadline, progress)
+        except RangeDownloadError as e:
+            logger.warning(f"Segmented download failed, falling back to single stream: {str(e)}")
+
+    # Respons awal sudah terpakai oleh unduhan segmen, mulai ulang dengan satu stream
+    try:
+        response = requests.get(url, stream=True, timeout=request_timeout(deadline))
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"Error requesting media: {str(e)}")
+        return None
+
+    with response:
+        set_idle_timeout(response, request_timeout(deadline, PHASE_IDLE)[1])
+        return _fetch_single(url, response, sink, total_size, deadline, max_bytes, progress)
+
+
+def resume_validator(response: requests.Response) -> Optional[str]:
+    """
+    Pick the validator to send as `If-Range` when resuming a download.
+
+    Args:
+        response: Response of the original request
+
+    Returns:
+        Strong ETag, Last-Modified date, or None if the server sent neither
+    """
+    etag = response.headers.get('ETag')
+    # ETag lemah (W/...) tidak boleh dipakai untuk If-Range
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def _open_range(url: str,
+                start: int,
+                end: Optional[int],
+                validator: Optional[str],
+                deadline: Optional[Deadline]) -> requests.Response:
+    """
+    Open a streamed request for `bytes=start-end` on a new connection.
+
+    If the server ignores the range or the validator no longer matches, the
+    response is a plain 200 with the full body and the caller must start over.
+
+    Raises:
+        requests.RequestException: If the request fails or returns a mismatched range
+    """
+    headers = {'Range': f"bytes={start}-{'' if end is None else end}"}
+    if validator:
+        headers['If-Range'] = validator
+
+    response = requests.get(url, headers=headers, stream=True, timeout=request_timeout(deadline))
+    try:
+        response.raise_for_status()
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code == 206 and not content_range.startswith(f'bytes {start}-'):
+            raise requests.RequestException(f"unexpected Content-Range '{content_range}'")
+    except requests.RequestException:
+        response.close()
+        raise
+
+    set_idle_timeout(response, request_timeout(deadline, PHASE_IDLE)[1])
+    return response
+
+
+def _fetch_single(url: str,
+                  response: requests.Response,
+                  sink: BinaryIO,
+                  total_size: int,
+                  deadline: Optional[Deadline],
+                  max_bytes: int,
+                  progress: Optional[ProgressCallback]) -> Union[BinaryIO, str, None]:
+    """
+    Read a streamed response body into `sink`, enforcing the size limit.
+
+    If the connection breaks mid-body the download continues from the last
+    received byte with a `Range` request, up to MAX_RETRIES times.
+    """
+    sink.seek(0)
+    sink.truncate()
+    downloaded_size = 0
+    validator = resume_validator(response)
+    # Offset byte hanya bermakna jika body tidak dikompresi
+    resumable = response.headers.get('Content-Encoding', 'identity').lower() in ('', 'identity')
+    attempts = 0
+
+    try:
+        while True:
+            try:
+                if response is None:
+                    response = _open_range(url, downloaded_size, None, validator, deadline)
+                    if response.status_code != 206:
+                        # Server mengabaikan Range atau file sudah berubah; mulai dari awal
+                        logger.warning("Server did not honour resume request, restarting download")
+                        sink.seek(0)
+                        sink.truncate()
+                        downloaded_size = 0
+
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if not chunk:
+                        continue
+
+                    if deadline:
+                        deadline.check("download")
+
+                    downloaded_size += len(chunk)
+                    if downloaded_size > max_bytes:
+                        logger.warning(f"Downloaded content too large: > {max_bytes / (1024 * 1024):.0f} MB")
+                        return TOO_LARGE
+
+                    sink.write(chunk)
+                    if progress:
+                        progress(downloaded_size, total_size)
+
+                if resumable and total_size and downloaded_size < total_size:
+                    raise requests.ConnectionError(f"stream ended early at {downloaded_size} of {total_size} bytes")
+                break
+            except requests.RequestException as e:
+                if response is not None:
+                    response.close()
+                    response = None
+                if not resumable or attempts >= MAX_RETRIES:
+                    logger.error(f"Error downloading media: {str(e)}")
+                    return None
+                attempts += 1
+                logger.warning(f"Download interrupted at {downloaded_size} bytes ({str(e)}), "
+                               f"resuming ({attempts}/{MAX_RETRIES})")
+    finally:
+        # Respons resume juga ditutup saat keluar lewat TOO_LARGE atau DeadlineExceeded
+        if response is not None:
+            response.close()
+
+    return sink
+
+
+def _fetch_ranges(url: str,
+                  response: requests.Response,
+                  sink: BinaryIO,
+                  total_size: int,
+                  deadline: Optional[Deadline],
+                  progress: Optional[ProgressCallback]) -> BinaryIO:
+    """
+    Download `total_size` bytes as concurrent byte ranges into `sink`, preallocated to the full size.
+
+    The first range is read from the already-open response so its connection
+    is not wasted; the remaining ranges each get their own request. A range
+    whose connection breaks is resumed from its last received byte.
+
+    Raises:
+        RangeDownloadError: If a segment is rejected, short or fails
+        DeadlineExceeded: If the job deadline runs out
+    """
+    sink.seek(0)
+    sink.truncate()
+    if isinstance(sink, BytesIO):
+        # Alokasikan buffer penuh lalu tulis tiap segmen langsung ke dalamnya
+        sink.seek(total_size - 1)
+        sink.write(b'\0')
+        view = sink.getbuffer()
+
+        def write_at(offset: int, data: bytes) -> None:
+            view[offset:offset + len(data)] = data
+    else:
+        view = None
+        sink.truncate(total_size)
+        fd = sink.fileno()
+
+        def write_at(offset: int, data: bytes) -> None:
+            os.pwrite(fd, data, offset)
+
+    ranges = split_ranges(total_size, RANGE_SEGMENTS)
+    validator = resume_validator(response)
+    lock = threading.Lock()
+    abort = threading.Event()
+    state = {"downloaded": 0}
+
+    def read_into(resp: requests.Response, cursor: List[int], end: int) -> None:
+        # cursor[0] adalah posisi tulis berikutnya dan ikut maju bila koneksi putus
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            if abort.is_set():
+                raise RangeDownloadError("aborted")
+            if deadline:
+                deadline.check("download")
+            if not chunk:
+                continue
+            position = cursor[0]
+            size = min(len(chunk), end + 1 - position)
+            write_at(position, chunk[:size])
+            cursor[0] = position + size
+            with lock:
+                state["downloaded"] += size
+                if progress:
+                    progress(state["downloaded"], total_size)
+            if cursor[0] > end:
+                break
+
+    def fetch_segment(start: int, end: int, resp: Optional[requests.Response] = None) -> int:
+        cursor = [start]
+        attempts = 0
+        while True:
+            try:
+                if resp is None:
+                    resp = _open_range(url, cursor[0], end, validator, deadline)
+                    if resp.status_code != 206:
+                        raise RangeDownloadError(f"range {cursor[0]}-{end} answered with HTTP {resp.status_code}")
+                with resp:
+                    read_into(resp, cursor, end)
+                return cursor[0] - start
+            except requests.RequestException as e:
+                resp = None
+                if attempts >= MAX_RETRIES:
+                    raise RangeDownloadError(f"range {start}-{end} failed: {str(e)}")
+                attempts += 1
+                logger.warning(f"Range {start}-{end} interrupted at {cursor[0]}, resuming ({attempts}/{MAX_RETRIES})")
+
+    logger.info(f"Downloading {total_size / (1024 * 1024):.1f} MB in {len(ranges)} ranges")
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges) - 1) as executor:
+            futures = [executor.submit(fetch_segment, start, end) for start, end in ranges[1:]]
+            try:
+                first_start, first_end = ranges[0]
+                received = [fetch_segment(first_start, first_end, response)]
+                received += [future.result() for future in futures]
+            except BaseException:
+                abort.set()
+                raise
+    finally:
+        if view is not None:
+            view.release()
+
+    # Verifikasi panjang setiap segmen dan total
+    for (start, end), length in zip(ranges, received):
+        if length != end - start + 1:
+            raise RangeDownloadError(f"range {start}-{end} is short: {length} bytes")
+    if sum(received) != total_size:
+        raise RangeDownloadError(f"received {sum(received)} of {total_size} bytes")
+
+    return sink
@@ -0,0 +1,122 @@
+import os
+import logging
+from typing import Any, Dict, Optional
+from io import BytesIO
+from pathlib import Path
+
+from mp4_probe import probe_mp4_file
+
+logger = logging.getLogger(__name__)
+
+# Jumlah byte awal yang cukup untuk mengenali semua format di bawah
+SNIFF_BYTES = 64
+
+# Brand ftyp untuk MP4 yang hanya berisi audio
+_AUDIO_BRANDS = (b'M4A ', b'M4B ', b'M4P ', b'F4A ', b'F4B ')
+# Brand ftyp umum (isom, mp42, dash, ...) dipakai baik untuk video maupun audio saja
+_GENERIC_BRANDS = (b'isom', b'iso2', b'iso3', b'iso4', b'iso5', b'iso6', b'mp41', b'mp42', b'dash', b'msdh', b'avc1')
+
+# Tipe hasil sniff untuk MP4 ber-brand umum: video atau audio ditentukan dari track-nya
+MP4_UNKNOWN = "unknown-mp4"
+
+
+def sniff_media(head: bytes) -> Optional[Dict[str, str]]:
+    """
+    Detect the media format from the first bytes of a file.
+
+    Recognizes JPEG, PNG, MP4/MOV, M4A, WebM/Matroska, MP3 and AAC. An MP4
+    with a generic brand (isom, mp42, dash, ...) may hold video or only
+    audio, which the first bytes cannot tell; its type is MP4_UNKNOWN.
+
+    Args:
+        head: First bytes of the file (at least SNIFF_BYTES when available)
+
+    Returns:
+        Dictionary with "type" ('photo', 'video', 'audio' or MP4_UNKNOWN),
+        "mime_type" and "extension" (with leading dot), or None if the format
+        is not recognized
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return {"type": "photo", "mime_type": "image/jpeg", "extension": ".jpg"}
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return {"type": "photo", "mime_type": "image/png", "extension": ".png"}
+
+    # ISO base media file: [size][ftyp][major brand]
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in _AUDIO_BRANDS:
+            return {"type": "audio", "mime_type": "audio/mp4", "extension": ".m4a"}
+        if brand == b'qt  ':
+            return {"type": "video", "mime_type": "video/quicktime", "extension": ".mov"}
+        if brand in _GENERIC_BRANDS:
+            return {"type": MP4_UNKNOWN, "mime_type": "video/mp4", "extension": ".mp4"}
+        return {"type": "video", "mime_type": "video/mp4", "extension": ".mp4"}
+
+    # EBML header; doctype "webm" atau "matroska" ada di awal header
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        if b'webm' in head[:SNIFF_BYTES]:
+            return {"type": "video", "mime_type": "video/webm", "extension": ".webm"}
+        return {"type": "video", "mime_type": "video/x-matroska", "extension": ".mkv"}
+
+    if head.startswith(b'ID3'):
+        return {"type": "audio", "mime_type": "audio/mpeg", "extension": ".mp3"}
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Frame sync MPEG audio; layer 00 berarti header ADTS (AAC)
+        if head[1] & 0x06 == 0:
+            return {"type": "audio", "mime_type": "audio/aac", "extension": ".aac"}
+        return {"type": "audio", "mime_type": "audio/mpeg", "extension": ".mp3"}
+
+    return None
+
+
+def sniff_file(file_obj: Any) -> Optional[Dict[str, str]]:
+    """
+    Detect the media format of a downloaded file without consuming it.
+
+    An MP4 with a generic brand is resolved from the handler types of its
+    tracks: video if it has a video track, audio if it only has sound.
+
+    Args:
+        file_obj: BytesIO or Path returned by fetch_media
+
+    Returns:
+        Same as sniff_media (MP4_UNKNOWN only if the tracks cannot be read),
+        or None if the file cannot be read or is not recognized
+    """
+    try:
+        if isinstance(file_obj, BytesIO):
+            head = bytes(file_obj.getbuffer()[:SNIFF_BYTES])
+        elif isinstance(file_obj, Path):
+            with open(file_obj, 'rb') as media_file:
+                head = media_file.read(SNIFF_BYTES)
+        else:
+            return None
+    except OSError as e:
+        logger.warning(f"Could not read media header: {str(e)}")
+        return None
+
+    sniffed = sniff_media(head)
+    if sniffed and sniffed["type"] == MP4_UNKNOWN:
+        tracks = (probe_mp4_file(file_obj) or {}).get("tracks", [])
+        if "vide" in tracks:
+            return {"type": "video", "mime_type": "video/mp4", "extension": ".mp4"}
+        if "soun" in tracks:
+            return {"type": "audio", "mime_type": "audio/mp4", "extension": ".m4a"}
+    return sniffed
+
+
+def with_extension(filename: str, extension: str) -> str:
+    """
+    Give a file name the extension of its detected format.
+
+    Args:
+        filename: Current file name (may be empty or lack an extension)
+        extension: Detected extension with leading dot
+
+    Returns:
+        File name ending in `extension`
+    """
+    stem, current = os.path.splitext(filename or "media")
+    if current.lower() == extension or (extension == ".jpg" and current.lower() == ".jpeg"):
+        return filename
+    return f"{stem or 'media'}{extension}"
@@ -0,0 +1,229 @@
+import struct
+import logging
+import requests
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from io import BytesIO
+from pathlib import Path
+
+from deadline import Deadline, request_timeout
+
+logger = logging.getLogger(__name__)
+
+# Bagian awal file yang diambil sekaligus; biasanya memuat ftyp dan moov (faststart)
+HEAD_SIZE = 64 * 1024
+# moov yang lebih besar dari ini tidak diparse (file rusak atau sangat panjang)
+MAX_MOOV_SIZE = 16 * 1024 * 1024
+
+# Box yang boleh muncul di awal file MP4/MOV
+_TOP_LEVEL_BOXES = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip')
+# Box kontainer di dalam moov yang berisi box lain
+_CONTAINER_BOXES = (b'trak', b'mdia')
+
+# Fungsi baca: (offset, panjang) -> bytes (bisa lebih pendek di akhir file)
+ReadAt = Callable[[int, int], bytes]
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload start, box end) for each box in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        header_size = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def parse_moov(moov: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Read duration and video dimensions from the payload of a `moov` box.
+
+    Args:
+        moov: Payload of the moov box (without its 8/16-byte header)
+
+    Returns:
+        Dictionary with "duration" (seconds, rounded), "width" and "height"
+        (0 if there is no video track) and "tracks" (handler type of every
+        track, e.g. "vide" or "soun"), or None if the box cannot be parsed
+    """
+    info = {"duration": 0, "width": 0, "height": 0, "tracks": []}
+    found_header = False
+    try:
+        for box_type, start, end in _iter_boxes(moov):
+            if box_type == b'mvhd':
+                version = moov[start]
+                if version == 1:
+                    timescale, duration = struct.unpack('>IQ', moov[start + 20:start + 32])
+                else:
+                    timescale, duration = struct.unpack('>II', moov[start + 12:start + 20])
+                if timescale:
+                    info["duration"] = round(duration / timescale)
+                found_header = True
+            elif box_type == b'trak':
+                handler, width, height = _parse_track(moov, start, end)
+                if handler:
+                    info["tracks"].append(handler)
+                if handler == "vide" and not info["width"]:
+                    info["width"], info["height"] = width, height
+    except (struct.error, IndexError) as e:
+        logger.warning(f"Could not parse moov box: {str(e)}")
+        return None
+    return info if found_header else None
+
+
+def _parse_track(data: bytes, start: int, end: int) -> Tuple[Optional[str], int, int]:
+    """Return the handler type of a trak box and its display (width, height), (0, 0) unless it is a video track."""
+    handler = None
+    width = height = 0
+    rotated = False
+    pending = [(start, end)]
+    while pending:
+        box_start, box_end = pending.pop()
+        for box_type, payload_start, payload_end in _iter_boxes(data, box_start, box_end):
+            if box_type in _CONTAINER_BOXES:
+                pending.append((payload_start, payload_end))
+            elif box_type == b'tkhd':
+                # Lebar/tinggi fixed-point 16.16 di 8 byte terakhir; matriks 36 byte sebelumnya
+                width, height = struct.unpack('>II', data[payload_end - 8:payload_end])
+                width, height = width >> 16, height >> 16
+                matrix_a = struct.unpack('>i', data[payload_end - 44:payload_end - 40])[0]
+                rotated = matrix_a == 0
+            elif box_type == b'hdlr':
+                handler = data[payload_start + 8:payload_start + 12]
+    handler_type = handler.decode('latin-1') if handler else None
+    if handler != b'vide':
+        return handler_type, 0, 0
+    # Video yang diputar 90/270 derajat ditampilkan dengan lebar dan tinggi tertukar
+    return (handler_type,) + ((height, width) if rotated else (width, height))
+
+
+def _scan(read_at: ReadAt, total_size: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Locate and parse the moov box by walking the top-level box headers.
+
+    Args:
+        read_at: Function reading `length` bytes at `offset`
+        total_size: File size in bytes (0 if unknown)
+
+    Returns:
+        Same as probe_mp4_file, or None if there is no parsable moov box
+    """
+    offset = 0
+    mdat_offset = None
+    while not total_size or offset < total_size:
+        header = read_at(offset, 16)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header[:8])
+        if offset == 0 and box_type not in _TOP_LEVEL_BOXES:
+            return None
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return None
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            if not total_size:
+                return None
+            size = total_size - offset
+        if size < header_size:
+            return None
+
+        if box_type == b'moov':
+            if size > MAX_MOOV_SIZE:
+                logger.warning(f"moov box too large to parse: {size} bytes")
+                return None
+            payload = read_at(offset + header_size, size - header_size)
+            if len(payload) < size - header_size:
+                return None
+            info = parse_moov(payload)
+            if info is not None:
+                # faststart: moov sebelum mdat, pemutaran bisa dimulai sebelum file selesai diunduh
+                info["faststart"] = mdat_offset is None
+            return info
+        if box_type == b'mdat' and mdat_offset is None:
+            mdat_offset = offset
+        offset += size
+    return None
+
+
+def probe_mp4_file(file_obj: Any) -> Optional[Dict[str, Any]]:
+    """
+    Read MP4/MOV metadata from a downloaded file.
+
+    Args:
+        file_obj: BytesIO or Path returned by fetch_media
+
+    Returns:
+        Dictionary with "duration" (seconds), "width", "height", "tracks" and
+        "faststart", or None if the file is not a parsable MP4/MOV
+    """
+    try:
+        if isinstance(file_obj, BytesIO):
+            buffer = file_obj.getbuffer()
+            try:
+                return _scan(lambda offset, length: bytes(buffer[offset:offset + length]), len(buffer))
+            finally:
+                buffer.release()
+        if isinstance(file_obj, Path):
+            with open(file_obj, 'rb') as media_file:
+                def read_at(offset: int, length: int) -> bytes:
+                    media_file.seek(offset)
+                    return media_file.read(length)
+                return _scan(read_at, file_obj.stat().st_size)
+    except (OSError, struct.error) as e:
+        logger.warning(f"Could not probe MP4 file: {str(e)}")
+    return None
+
+
+def probe_mp4_url(url: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+    """
+    Read MP4/MOV metadata from a remote file with Range requests, without downloading it.
+
+    The first HEAD_SIZE bytes are fetched once; a moov box at the end of the
+    file (no faststart) is fetched with one more Range request after walking
+    the top-level box headers.
+
+    Args:
+        url: Media URL
+        deadline: Optional job deadline bounding the requests
+
+    Returns:
+        Same as probe_mp4_file, or None if the server does not support ranges
+        or the file is not a parsable MP4/MOV
+    """
+    state = {"head": b'', "total_size": 0}
+
+    def fetch_range(start: int, end: int) -> bytes:
+        with requests.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True,
+                          timeout=request_timeout(deadline)) as response:
+            if response.status_code != 206:
+                # Server mengabaikan Range; jangan unduh seluruh file hanya untuk metadata
+                raise ValueError(f"range request returned HTTP {response.status_code}")
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if total.isdigit():
+                state["total_size"] = int(total)
+            return response.raw.read(end - start + 1, decode_content=True)
+
+    def read_at(offset: int, length: int) -> bytes:
+        head = state["head"]
+        if offset + length <= len(head) or (state["total_size"] and len(head) >= state["total_size"]):
+            return head[offset:offset + length]
+        return fetch_range(offset, offset + length - 1)
+
+    try:
+        state["head"] = fetch_range(0, HEAD_SIZE - 1)
+        return _scan(read_at, state["total_size"])
+    except (requests.RequestException, ValueError, struct.error) as e:
+        logger.warning(f"Could not probe MP4 at {url}: {str(e)}")
+        return None
@@ -0,0 +1,165 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional, Tuple, Union
+from io import BytesIO
+from pathlib import Path
+
+from config import IMAGE_WORKERS, PHOTO_MAX_SIDE
+
+try:
+    from PIL import Image
+except ImportError:  # Tanpa Pillow foto dikirim apa adanya (bot mencatat peringatan saat start)
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Batas sendPhoto/InputMediaPhoto dari Telegram
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+PHOTO_MAX_DIMENSION_SUM = 10000
+PHOTO_MAX_ASPECT_RATIO = 20
+
+# Hasil normalize_photo
+PHOTO_OK = "ok"
+PHOTO_CONVERTED = "converted"
+PHOTO_INVALID = "invalid"
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def normalize_photo(source: Union[bytes, str], max_side: int = PHOTO_MAX_SIDE) -> Tuple[str, Optional[bytes]]:
+    """
+    Validate an image and re-encode it if Telegram would reject or downscale it.
+
+    Runs in a worker process. Images that are not JPEG/PNG, exceed the photo
+    size limit or have a side longer than `max_side` are converted to an RGB
+    JPEG that fits within `max_side`.
+
+    Args:
+        source: Image bytes, or the path of an image file
+        max_side: Longest accepted side in pixels
+
+    Returns:
+        Tuple of (PHOTO_OK, None) if the image can be sent unchanged,
+        (PHOTO_CONVERTED, jpeg bytes) if it was re-encoded, or
+        (PHOTO_INVALID, None) if it is not a usable photo
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as image_file:
+            data = image_file.read()
+    else:
+        data = source
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+        # verify() membuat objek tidak bisa dipakai lagi, buka ulang untuk memproses
+        image = Image.open(BytesIO(data))
+        image.load()
+    except Exception:
+        return PHOTO_INVALID, None
+
+    width, height = image.size
+    if not width or not height or max(width, height) / min(width, height) > PHOTO_MAX_ASPECT_RATIO:
+        return PHOTO_INVALID, None
+
+    if (image.format in ('JPEG', 'PNG') and len(data) <= PHOTO_MAX_BYTES
+            and max(width, height) <= max_side and width + height <= PHOTO_MAX_DIMENSION_SUM):
+        return PHOTO_OK, None
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Ratakan transparansi ke latar putih; JPEG tidak punya kanal alpha
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail((max_side, max_side))
+
+    quality = 90
+    while True:
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        if output.tell() <= PHOTO_MAX_BYTES or quality <= 50:
+            return PHOTO_CONVERTED, output.getvalue()
+        quality -= 15
+
+
+def photo_validation_available() -> bool:
+    """Return True if Pillow is installed, i.e. album photos are validated and recompressed."""
+    return Image is not None
+
+
+def _replace_with_jpeg(path: Path, data: bytes) -> Path:
+    """
+    Write re-encoded JPEG bytes next to `path` under a .jpg name and remove the original.
+
+    Args:
+        path: Downloaded photo file
+        data: JPEG bytes
+
+    Returns:
+        Path of the JPEG file
+    """
+    # Tulis file baru lalu ganti; path bisa berupa hard link ke blob cache media
+    jpeg_path = path.with_suffix('.jpg')
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, jpeg_path)
+    if jpeg_path != path:
+        path.unlink()
+    return jpeg_path
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: worker tidak mewarisi thread dan socket milik event loop bot
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+async def prepare_photo(file_obj: Any) -> Any:
+    """
+    Validate and, if needed, recompress a downloaded photo in the image process pool.
+
+    Args:
+        file_obj: BytesIO or Path returned by download_media
+
+    Returns:
+        The same file object (a BytesIO is rewritten in place if it was
+        converted, a Path is replaced by a .jpg file whose Path is returned),
+        or None if the image is not a usable photo. Without Pillow the file
+        is returned unchanged.
+    """
+    if Image is None or not isinstance(file_obj, (BytesIO, Path)):
+        return file_obj
+
+    source = str(file_obj) if isinstance(file_obj, Path) else file_obj.getvalue()
+    loop = asyncio.get_running_loop()
+    try:
+        status, converted = await loop.run_in_executor(_get_executor(), normalize_photo, source)
+    except Exception as e:
+        logger.warning(f"Image worker failed, sending photo unchanged: {str(e)}")
+        return file_obj
+
+    if status == PHOTO_INVALID:
+        return None
+    if status == PHOTO_CONVERTED:
+        logger.info(f"Recompressed photo to {len(converted) / 1024:.0f} KB JPEG")
+        if isinstance(file_obj, Path):
+            try:
+                return await asyncio.to_thread(_replace_with_jpeg, file_obj, converted)
+            except OSError as e:
+                logger.warning(f"Could not write recompressed photo, sending it unchanged: {str(e)}")
+                return file_obj
+        else:
+            file_obj.seek(0)
+            file_obj.truncate()
+            file_obj.write(converted)
+            file_obj.seek(0)
+            file_obj.name = f"{os.path.splitext(file_obj.name or 'photo')[0]}.jpg"
+    return file_obj
@@ -0,0 +1,75 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from deadline import Deadline
+from media_fetcher import MAX_FILE_SIZE, TOO_LARGE, probe_media
+
+logger = logging.getLogger(__name__)
+
+
+def _unreachable(probe: Dict[str, Any]) -> bool:
+    """Return True if a probe failed for a reason that says nothing about the rendition itself."""
+    return probe["status"] == 0 or probe["status"] >= 500
+
+
+def select_rendition(media: Dict[str, Any],
+                     max_bytes: int = MAX_FILE_SIZE,
+                     deadline: Optional[Deadline] = None) -> Union[Dict[str, Any], str, None]:
+    """
+    Pick the best rendition of a media item that is available and fits the size limit.
+
+    Downloaders list the alternative encodings of one item (e.g. TikTok
+    hdplay/play/wmplay or Facebook 720p/360p) best quality first in
+    `media["renditions"]`. All of them are probed concurrently, and the first
+    one that responds and is not larger than `max_bytes` wins. A rendition that
+    returns 404 or is too large is skipped in favour of the next one.
+
+    Args:
+        media: Media item data with an optional "renditions" list of dicts with "url" and quality fields
+        max_bytes: Maximum deliverable size in bytes
+        deadline: Optional job deadline bounding the probes
+
+    Returns:
+        Copy of `media` pointing at the chosen rendition, with its probe result under "probe";
+        `media` itself if it has fewer than two renditions; None if no rendition is
+        available; or the string "TOO_LARGE" if every available rendition exceeds `max_bytes`
+    """
+    renditions: List[Dict[str, Any]] = []
+    for rendition in media.get('renditions') or []:
+        if rendition.get('url') and all(rendition['url'] != seen['url'] for seen in renditions):
+            renditions.append(rendition)
+    if len(renditions) < 2:
+        return media
+
+    with ThreadPoolExecutor(max_workers=len(renditions)) as executor:
+        probes = list(executor.map(lambda rendition: probe_media(rendition['url'], deadline), renditions))
+
+    chosen = None
+    for rendition, probe in zip(renditions, probes):
+        if probe["ok"] and (not probe["size"] or probe["size"] <= max_bytes):
+            chosen = (rendition, probe)
+            break
+
+    if chosen is None:
+        if any(probe["ok"] for probe in probes):
+            logger.warning(f"Every rendition exceeds {max_bytes / (1024 * 1024):.0f} MB")
+            return TOO_LARGE
+        # Probe gagal karena jaringan/server: biarkan unduhan mencoba rendisi terbaik
+        unknown = [(rendition, probe) for rendition, probe in zip(renditions, probes) if _unreachable(probe)]
+        if not unknown:
+            logger.warning(f"No rendition available: {[probe['status'] for probe in probes]}")
+            return None
+        chosen = unknown[0]
+
+    rendition, probe = chosen
+    skipped = [f"{r.get('quality') or r.get('resolution') or '?'} ({p['status']}, {p['size'] / (1024 * 1024):.1f} MB)"
+               for r, p in zip(renditions, probes) if r is not rendition]
+    logger.info(f"Selected rendition {rendition.get('quality') or rendition.get('resolution') or '?'} "
+                f"({probe['size'] / (1024 * 1024):.1f} MB); other renditions: {', '.join(skipped)}")
+
+    selected = {key: value for key, value in media.items() if key != 'renditions'}
+    selected.update(rendition)
+    selected['downloadUrl'] = rendition['url']
+    selected['probe'] = probe
+    return selected
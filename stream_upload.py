@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import queue
+import uuid
+import logging
+import threading
+import mimetypes
+import zipfile
+import requests
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from io import BytesIO
+
+from config import TELEGRAM_API_URL, STREAM_QUEUE_CHUNKS, IDLE_READ_TIMEOUT, UPLOAD_RESPONSE_TIMEOUT
+from deadline import Deadline, PHASE_IDLE, request_timeout, set_idle_timeout
+from media_fetcher import CHUNK_SIZE, MAX_FILE_SIZE, TOO_LARGE, media_filename
+from media_sniffer import sniff_media, with_extension, MP4_UNKNOWN
+
+logger = logging.getLogger(__name__)
+
+# Penanda akhir stream pada antrian chunk
+_END_OF_STREAM = object()
+
+# Bagian form yang baru tersedia setelah file terkirim: (field biasa, file kecil)
+Trailer = Callable[[], Tuple[Dict[str, Any], Dict[str, BytesIO]]]
+
+# Minta sumber tanpa kompresi: Content-Length harus sama dengan jumlah byte yang di-upload
+_IDENTITY = {'Accept-Encoding': 'identity'}
+
+
+class StreamUploadError(Exception):
+    """Raised when a streamed upload to the Bot API fails."""
+
+    def __init__(self, message: str, body_sent: bool = False):
+        """
+        Initialize the error.
+
+        Args:
+            message: Error description
+            body_sent: True if the whole file reached Telegram before the
+                request failed, so the media may have been delivered anyway
+                and must not be sent again
+        """
+        super().__init__(message)
+        self.body_sent = body_sent
+
+
+class _SourceTooLarge(Exception):
+    """Raised inside the upload body when the source exceeds the size limit."""
+
+
+def _form_field(boundary: str, name: str, value: Any) -> bytes:
+    """Encode one plain multipart/form-data field."""
+    if not isinstance(value, str):
+        value = json.dumps(value) if isinstance(value, (bool, dict, list)) else str(value)
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+        f'{value}\r\n'
+    ).encode('utf-8')
+
+
+def _file_header(boundary: str, name: str, filename: str) -> bytes:
+    """Encode the headers of one multipart/form-data file part."""
+    mimetype = mimetypes.guess_type(filename, strict=False)[0] or 'application/octet-stream'
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+        f'Content-Type: {mimetype}\r\n\r\n'
+    ).encode('utf-8')
+
+
+def stream_to_telegram(token: str,
+                       method: str,
+                       field: str,
+                       url: str,
+                       params: Dict[str, Any],
+                       attachments: Optional[Dict[str, BytesIO]] = None,
+                       deadline: Optional[Deadline] = None,
+                       max_bytes: int = MAX_FILE_SIZE,
+                       trailer: Optional[Trailer] = None) -> Union[Dict[str, Any], str]:
+    """
+    Upload a remote media file to the Bot API while it is still downloading.
+
+    A producer thread reads the source in chunks into a bounded queue and the
+    multipart request body is generated from that queue, so the upload starts
+    with the first chunk and the producer blocks whenever the upload falls
+    STREAM_QUEUE_CHUNKS chunks behind. The full file never sits in memory.
+
+    The first chunk is sniffed for its format: a source that is not actually
+    a video/audio (as `field` says) is rejected before anything is uploaded,
+    and the file part gets a filename and MIME type matching its content.
+
+    Args:
+        token: Bot token
+        method: Bot API method, e.g. "sendVideo" or "sendAudio"
+        field: Name of the file parameter, e.g. "video" or "audio"
+        url: Source media URL
+        params: Other method parameters (chat_id, caption, ...)
+        attachments: Small in-memory files referenced as "attach://<name>" in params
+        deadline: Optional job deadline bounding both download and upload
+        max_bytes: Maximum accepted source size in bytes
+        trailer: Optional function called in the upload thread once the media
+            has been sent; the fields and files it returns are appended after
+            it, e.g. a thumbnail that was downloaded in the meantime
+
+    Returns:
+        The `result` object of the Bot API response, or "TOO_LARGE" if the source exceeds `max_bytes`
+
+    Raises:
+        StreamUploadError: If the source or the upload fails
+        DeadlineExceeded: If the job deadline runs out
+    """
+    try:
+        source = requests.get(url, headers=_IDENTITY, stream=True, timeout=request_timeout(deadline))
+        source.raise_for_status()
+    except requests.RequestException as e:
+        raise StreamUploadError(f"source request failed: {str(e)}")
+
+    with source:
+        total_size = int(source.headers.get('Content-Length', 0) or 0)
+        if total_size > max_bytes:
+            logger.warning(f"File terlalu besar: {total_size / (1024 * 1024):.2f} MB > {max_bytes / (1024 * 1024):.0f} MB")
+            return TOO_LARGE
+        if source.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+            # Body didekode oleh requests, panjangnya tidak sama dengan Content-Length: kirim chunked
+            total_size = 0
+
+        set_idle_timeout(source, request_timeout(deadline, PHASE_IDLE)[1])
+
+        # Kenali format dari chunk pertama sebelum upload dimulai
+        source_chunks = source.iter_content(chunk_size=CHUNK_SIZE)
+        try:
+            first_chunk = next((chunk for chunk in source_chunks if chunk), b'')
+        except requests.RequestException as e:
+            raise StreamUploadError(f"source read failed: {str(e)}")
+        sniffed = sniff_media(first_chunk)
+        extension = sniffed["extension"] if sniffed else None
+        if sniffed and sniffed["type"] == MP4_UNKNOWN:
+            # Brand MP4 umum: track belum bisa dibaca dari chunk pertama, percayai `field`
+            extension = ".m4a" if field == "audio" else ".mp4"
+        elif sniffed and sniffed["type"] != field:
+            raise StreamUploadError(f"source is {sniffed['mime_type']}, not {field}")
+
+        def produce(put: Callable[[Any], None], stop: threading.Event) -> None:
+            downloaded_size = len(first_chunk)
+            if first_chunk:
+                put(first_chunk)
+            for chunk in source_chunks:
+                if stop.is_set():
+                    return
+                if not chunk:
+                    continue
+                downloaded_size += len(chunk)
+                if downloaded_size > max_bytes:
+                    raise _SourceTooLarge()
+                put(chunk)
+
+        filename = media_filename(url) or field
+        if extension:
+            filename = with_extension(filename, extension)
+        return _upload_stream(token, method, field, filename, params, attachments, produce,
+                              deadline, max_bytes, total_size, trailer)
+
+
+def _upload_stream(token: str,
+                   method: str,
+                   field: str,
+                   filename: str,
+                   params: Dict[str, Any],
+                   attachments: Optional[Dict[str, BytesIO]],
+                   produce: Callable[[Callable[[Any], None], threading.Event], None],
+                   deadline: Optional[Deadline],
+                   max_bytes: int,
+                   total_size: int = 0,
+                   trailer: Optional[Trailer] = None) -> Union[Dict[str, Any], str]:
+    """
+    Send a multipart Bot API request whose file part is generated by `produce`.
+
+    `produce(put, stop)` runs in a producer thread and passes each chunk of the
+    file to `put`, which blocks while STREAM_QUEUE_CHUNKS chunks are waiting
+    to be uploaded. It should return early once `stop` is set and raise
+    _SourceTooLarge when the file exceeds `max_bytes`.
+
+    The job deadline bounds the upload of the body. Once the body has been
+    sent, Telegram's reply is awaited for up to UPLOAD_RESPONSE_TIMEOUT
+    seconds, since processing a large video can take longer than the idle
+    read timeout.
+
+    Args:
+        token: Bot token
+        method: Bot API method
+        field: Name of the file parameter
+        filename: File name of the file part
+        params: Other method parameters
+        attachments: Small in-memory files referenced as "attach://<name>" in params
+        produce: Chunk producer
+        deadline: Optional job deadline bounding the upload
+        max_bytes: Maximum accepted file size in bytes (for the log message)
+        total_size: File size in bytes if known in advance, 0 otherwise
+        trailer: Optional source of fields and files sent after the file part
+
+    Returns:
+        The `result` object of the Bot API response, or "TOO_LARGE"
+
+    Raises:
+        StreamUploadError: If the producer or the upload fails (with
+            `body_sent` set when the failure came after the whole body was sent)
+        DeadlineExceeded: If the job deadline runs out
+    """
+    chunks: "queue.Queue[Any]" = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    stop = threading.Event()
+    body_sent = threading.Event()
+
+    def put(item: Any) -> None:
+        # Tunggu selama antrian penuh (backpressure), kecuali upload sudah berhenti
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def run_producer() -> None:
+        try:
+            produce(put, stop)
+            put(_END_OF_STREAM)
+        except Exception as e:
+            put(e)
+
+    boundary = uuid.uuid4().hex
+    preamble = b''.join(_form_field(boundary, name, value) for name, value in params.items() if value is not None)
+    for name, attachment in (attachments or {}).items():
+        preamble += _file_header(boundary, name, getattr(attachment, 'name', '') or name)
+        preamble += attachment.getvalue() + b'\r\n'
+    preamble += _file_header(boundary, field, filename)
+    closing = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    def body() -> Iterator[bytes]:
+        yield preamble
+        while True:
+            if deadline:
+                deadline.check("upload")
+            try:
+                item = chunks.get(timeout=IDLE_READ_TIMEOUT)
+            except queue.Empty:
+                raise StreamUploadError("source stalled")
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+        if trailer:
+            # Urutan bagian multipart bebas; field yang baru siap dikirim setelah file
+            trailing_params, trailing_files = trailer()
+            parts = b''.join(_form_field(boundary, name, value)
+                             for name, value in trailing_params.items() if value is not None)
+            for name, attachment in trailing_files.items():
+                parts += _file_header(boundary, name, getattr(attachment, 'name', '') or name)
+                parts += attachment.getvalue() + b'\r\n'
+            if parts:
+                # Bagian file ditutup dengan CRLF sebelum boundary berikutnya; CRLF terakhir milik `closing`
+                yield b'\r\n' + parts[:-2]
+        yield closing
+        body_sent.set()
+
+    producer = threading.Thread(target=run_producer, name="stream-upload-source", daemon=True)
+    producer.start()
+
+    request = requests.Request(
+        'POST',
+        f"{TELEGRAM_API_URL}/bot{token}/{method}",
+        data=body(),
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    ).prepare()
+    if total_size and not trailer:
+        # Panjang body diketahui, kirim dengan Content-Length alih-alih chunked
+        request.headers.pop('Transfer-Encoding', None)
+        request.headers['Content-Length'] = str(len(preamble) + total_size + len(closing))
+
+    # Timeout baca hanya berlaku untuk menunggu balasan Telegram setelah body terkirim
+    timeout = (request_timeout(deadline)[0], UPLOAD_RESPONSE_TIMEOUT)
+    try:
+        with requests.Session() as session:
+            response = session.send(request, timeout=timeout)
+        data = response.json()
+    except _SourceTooLarge:
+        logger.warning(f"Downloaded content too large: > {max_bytes / (1024 * 1024):.0f} MB")
+        return TOO_LARGE
+    except (requests.RequestException, ValueError) as e:
+        raise StreamUploadError(f"upload failed: {str(e)}", body_sent=body_sent.is_set())
+    finally:
+        stop.set()
+        producer.join(timeout=1)
+
+    if not data.get('ok'):
+        raise StreamUploadError(data.get('description', f"HTTP {response.status_code}"))
+    return data['result']
+
+
+class _QueueWriter:
+    """Minimal unseekable file object handing everything zipfile writes to `put`."""
+
+    def __init__(self, put: Callable[[Any], None], stop: threading.Event, max_bytes: int):
+        self._put = put
+        self._stop = stop
+        self._max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        if self._stop.is_set():
+            raise StreamUploadError("upload stopped")
+        self.written += len(data)
+        if self.written > self._max_bytes:
+            raise _SourceTooLarge()
+        if data:
+            self._put(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def stream_archive_to_telegram(token: str,
+                               items: List[Tuple[str, str]],
+                               archive_name: str,
+                               params: Dict[str, Any],
+                               deadline: Optional[Deadline] = None,
+                               max_bytes: int = MAX_FILE_SIZE) -> Union[Dict[str, Any], str]:
+    """
+    Upload many remote media files as one ZIP document, building the archive while it uploads.
+
+    Items are downloaded one after another and written to the archive without
+    compression (ZIP_STORED, the media is already compressed) with data
+    descriptors, so neither the files nor the archive are ever held in memory.
+    Each entry is named after its position and gets the extension of its
+    sniffed format. An item whose request fails is left out of the archive.
+
+    Args:
+        token: Bot token
+        items: List of (entry name without extension, source URL) in archive order
+        archive_name: File name of the document, e.g. "tiktok_123.zip"
+        params: Other sendDocument parameters (chat_id, caption, ...)
+        deadline: Optional job deadline bounding every download and the upload
+        max_bytes: Maximum archive size in bytes
+
+    Returns:
+        The `result` object of the Bot API response with an added "archived"
+        count of included items, or "TOO_LARGE" if the archive exceeds `max_bytes`
+
+    Raises:
+        StreamUploadError: If no item could be fetched, an item fails mid-download or the upload fails
+        DeadlineExceeded: If the job deadline runs out
+    """
+    archived = []
+
+    def produce(put: Callable[[Any], None], stop: threading.Event) -> None:
+        writer = _QueueWriter(put, stop, max_bytes)
+        with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for entry_name, url in items:
+                if stop.is_set():
+                    return
+                try:
+                    source = requests.get(url, headers=_IDENTITY, stream=True, timeout=request_timeout(deadline))
+                    source.raise_for_status()
+                except requests.RequestException as e:
+                    logger.warning(f"Skipping archive item {entry_name}: {str(e)}")
+                    continue
+
+                with source:
+                    set_idle_timeout(source, request_timeout(deadline, PHASE_IDLE)[1])
+                    source_chunks = source.iter_content(chunk_size=CHUNK_SIZE)
+                    first_chunk = next((chunk for chunk in source_chunks if chunk), b'')
+                    if not first_chunk:
+                        logger.warning(f"Skipping empty archive item {entry_name}")
+                        continue
+                    sniffed = sniff_media(first_chunk)
+                    extension = sniffed["extension"] if sniffed else os.path.splitext(media_filename(url))[1]
+                    entry = zipfile.ZipInfo(f"{entry_name}{extension}", date_time=time.localtime()[:6])
+                    entry.compress_type = zipfile.ZIP_STORED
+                    # Ukuran entri belum diketahui; gagal di tengah unduhan membatalkan seluruh arsip
+                    with archive.open(entry, 'w') as entry_file:
+                        entry_file.write(first_chunk)
+                        for chunk in source_chunks:
+                            if stop.is_set():
+                                return
+                            if chunk:
+                                entry_file.write(chunk)
+                archived.append(entry_name)
+
+            if not archived:
+                raise StreamUploadError("no archive item could be downloaded")
+        logger.info(f"Archived {len(archived)}/{len(items)} items, {writer.written / (1024 * 1024):.1f} MB")
+
+    result = _upload_stream(token, "sendDocument", "document", archive_name, params, None, produce,
+                            deadline, max_bytes)
+    if isinstance(result, dict):
+        result["archived"] = len(archived)
+    return result
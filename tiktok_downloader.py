@@ -4,6 +4,9 @@ import urllib.parse
 from typing import Dict, Any, Optional, Union
 from io import BytesIO
 
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from media_fetcher import fetch_media
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -55,12 +58,13 @@ class TiktokDownloader:
         ]
         return any(pattern in url for pattern in patterns)
     
-    def download_content(self, url: str) -> Dict[str, Any]:
+    def download_content(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Download TikTok content from URL.
         
         Args:
             url: TikTok video URL
+            deadline: Optional job deadline bounding the API request
             
         Returns:
             Dictionary containing download response
@@ -83,7 +87,7 @@ class TiktokDownloader:
             
             # Make the request with 'accept: application/json' header
             headers = {'accept': 'application/json'}
-            response = requests.get(request_url, headers=headers, timeout=self.timeout)
+            response = requests.get(request_url, headers=headers, timeout=request_timeout(deadline, read_timeout=self.timeout))
             response.raise_for_status()
             
             # Parse response
@@ -130,6 +134,13 @@ class TiktokDownloader:
                 
                 # Jika bukan slideshow (tidak ada images), proses sebagai video biasa
                 else:
+                    # Semua rendisi video, kualitas terbaik lebih dulu; dipilih sesuai ukuran saat dikirim
+                    renditions = [
+                        {"quality": quality, "url": video_url}
+                        for quality, video_url in (("HD", hdplay), ("SD (No Watermark)", play), ("SD (Watermarked)", wmplay))
+                        if video_url
+                    ]
+                    
                     # Prioritaskan video HD
                     if hdplay:
                         media_list.append({
@@ -137,7 +148,8 @@ class TiktokDownloader:
                             "quality": "HD",
                             "url": hdplay,
                             "downloadUrl": hdplay,
-                            "thumbnail": cover
+                            "thumbnail": cover,
+                            "renditions": renditions
                         })
                     # Jika tidak ada HD, gunakan versi tanpa watermark
                     elif play:
@@ -146,7 +158,8 @@ class TiktokDownloader:
                             "quality": "SD (No Watermark)",
                             "url": play,
                             "downloadUrl": play,
-                            "thumbnail": cover
+                            "thumbnail": cover,
+                            "renditions": renditions
                         })
                     # Terakhir, gunakan versi dengan watermark jika tidak ada pilihan lain
                     elif wmplay:
@@ -155,7 +168,8 @@ class TiktokDownloader:
                             "quality": "SD (Watermarked)",
                             "url": wmplay,
                             "downloadUrl": wmplay,
-                            "thumbnail": cover
+                            "thumbnail": cover,
+                            "renditions": renditions
                         })
                     # Jika tidak ada video, tambahkan audio saja (jika ada)
                     elif music:
@@ -177,6 +191,9 @@ class TiktokDownloader:
             # If we got here, something went wrong
             return {"status": "error", "message": "Tidak dapat mengekstrak konten dari TikTok URL. Coba link lain."}
             
+        except DeadlineExceeded as e:
+            logger.error(f"Deadline exceeded: {str(e)}")
+            return {"status": "error", "message": "Waktu pemrosesan habis. Coba lagi nanti."}
         except requests.Timeout:
             logger.error("Request timeout")
             return {"status": "error", "message": "Request timed out"}
@@ -187,47 +204,21 @@ class TiktokDownloader:
             logger.error(f"Unexpected error: {str(e)}")
             return {"status": "error", "message": f"Unexpected error: {str(e)}"}
     
-    def download_media_file(self, url: str) -> Union[BytesIO, str, None]:
+    def download_media_file(self, url: str, deadline: Optional[Deadline] = None) -> Union[BytesIO, str, None]:
         """
         Download media file from URL.
         
         Args:
             url: Media URL
+            deadline: Optional job deadline bounding the download
             
         Returns:
             BytesIO object containing media file data, or None if download failed
             Returns string "TOO_LARGE" if file is too large
         """
+        # Satu GET streaming; cache media di disk diperiksa lebih dulu oleh fetch_media
         try:
-            # Get file size with HEAD request first to check if it's too large
-            head_response = requests.head(url, timeout=self.timeout)
-            head_response.raise_for_status()
-            
-            # Check if Content-Length header exists
-            if 'Content-Length' in head_response.headers:
-                content_length = int(head_response.headers['Content-Length'])
-                # Convert bytes to MB
-                size_mb = content_length / (1024 * 1024)
-                
-                # Check if file size exceeds 100 MB
-                if size_mb > 100:
-                    logger.warning(f"File size too large: {size_mb:.2f} MB > 100 MB")
-                    return "TOO_LARGE"
-            
-            # If size is acceptable or unknown, proceed with download
-            response = requests.get(url, timeout=self.timeout)
-            response.raise_for_status()
-            
-            # Double-check actual content size
-            content_size = len(response.content) / (1024 * 1024)  # Convert to MB
-            if content_size > 100:
-                logger.warning(f"Downloaded content too large: {content_size:.2f} MB > 100 MB")
-                return "TOO_LARGE"
-            
-            file_data = BytesIO(response.content)
-            file_data.seek(0)
-            
-            return file_data
+            return fetch_media(url, deadline)
         except Exception as e:
             logger.error(f"Error downloading media file: {str(e)}")
-            return None
\ No newline at end of file
+            return None
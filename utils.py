@@ -1,5 +1,5 @@
 import re
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import urllib.parse
 
 def clean_url(url: str) -> str:
@@ -115,6 +115,71 @@ def clean_youtube_url(url: str) -> str:
     
     return url
 
+def canonical_content_id(url: str) -> str:
+    """
+    Build a canonical ID for the content behind a social media URL.
+    
+    Different spellings of the same link (tracking parameters, www/m subdomains,
+    youtu.be vs youtube.com) map to the same ID.
+    
+    Args:
+        url: Social media URL
+        
+    Returns:
+        ID in the form '<platform>:<identifier>'
+    """
+    url_type = detect_url_type(url)
+    
+    if url_type == 'youtube':
+        cleaned = clean_youtube_url(url)
+        video_id = urllib.parse.parse_qs(urllib.parse.urlparse(cleaned).query).get('v', [''])[0]
+        if video_id:
+            return f"youtube:{video_id}"
+    elif url_type == 'instagram':
+        cleaned = clean_instagram_url(url)
+        match = re.search(r'instagram\.com/(?:p|reel|tv)/([^/?#]+)', cleaned)
+        if match:
+            return f"instagram:{match.group(1)}"
+    elif url_type == 'tiktok':
+        cleaned = clean_tiktok_url(url)
+        match = re.search(r'/video/(\d+)', cleaned)
+        if match:
+            return f"tiktok:{match.group(1)}"
+    elif url_type == 'facebook':
+        # Foto dan video lama diidentifikasi lewat parameter query
+        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        for param in ('fbid', 'story_fbid', 'v'):
+            value = query_params.get(param, [''])[0]
+            if value:
+                return f"facebook:{param}:{value}"
+        cleaned = clean_facebook_url(url)
+    else:
+        cleaned = clean_url(url)
+    
+    # Tanpa ID yang dikenali, gunakan URL bersih tanpa skema dan subdomain www/m
+    parsed = urllib.parse.urlparse(cleaned if '://' in cleaned else f"https://{cleaned}")
+    host = re.sub(r'^(www|m|mobile)\.', '', parsed.netloc.lower())
+    query = f"?{parsed.query}" if parsed.query else ""
+    return f"{url_type}:{host}{parsed.path.rstrip('/')}{query}"
+
+def extract_urls(text: str) -> List[str]:
+    """
+    Extract every URL from a message text, in order and without duplicates.
+    
+    Args:
+        text: Message text that may contain several links
+        
+    Returns:
+        List of URLs (empty if the text contains none)
+    """
+    urls = []
+    for match in re.finditer(r'(?:https?://|www\.)[^\s<>"\']+', text, re.IGNORECASE):
+        # Tanda baca di akhir kalimat bukan bagian dari URL
+        url = match.group(0).rstrip('.,;:!?)]}')
+        if url not in urls:
+            urls.append(url)
+    return urls
+
 def detect_url_type(url: str) -> str:
     """
     Detect the type of URL (Instagram, Facebook, TikTok, YouTube, or Unknown).
@@ -211,10 +276,30 @@ def is_valid_youtube_url(url: str) -> bool:
         'youtu.be/',
         'youtube.com/embed/',
         'youtube.com/v/',
-        'music.youtube.com/watch'
+        'music.youtube.com/watch',
+        'youtube.com/playlist'
     ]
     return any(pattern in url for pattern in patterns)
 
+def youtube_playlist_id(url: str) -> Optional[str]:
+    """
+    Extract the playlist ID of a YouTube URL.
+    
+    Auto-generated mixes (RD...) and personal lists (liked videos, watch later)
+    are ignored, since they cannot be expanded without the user's session.
+    
+    Args:
+        url: YouTube URL
+        
+    Returns:
+        Value of the `list` parameter, or None if the URL is not a playlist link
+    """
+    query_params = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    playlist_id = query_params.get('list', [''])[0]
+    if not playlist_id or playlist_id.startswith(('RD', 'LL', 'WL', 'UL')):
+        return None
+    return playlist_id
+
 def get_content_type(url: str) -> str:
     """
     Determine the type of Instagram content from the URL.
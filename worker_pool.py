@@ -0,0 +1,481 @@
+import os
+import sys
+import time
+import queue
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from pathlib import Path
+
+from config import (
+    ITZPIRE_API_URL, FACEBOOK_API_URL, TIKTOK_API_URL, YOUTUBE_API_URL, FIRST_BYTE_TIMEOUT
+)
+from deadline import Deadline, DeadlineExceeded
+from media_fetcher import fetch_media, release_media
+from media_sniffer import sniff_file
+from instagram_downloader import InstagramDownloader
+from facebook_downloader import FacebookDownloader
+from tiktok_downloader import TiktokDownloader
+from youtube_downloader import YoutubeDownloader
+
+logger = logging.getLogger(__name__)
+
+# Backend antrean antara bot dan worker
+BACKEND_PROCESS = "process"
+BACKEND_SOCKET = "socket"
+
+# Pesan pembatalan untuk tugas yang sedang berjalan di worker
+CANCEL_TASK = "cancel"
+# Jeda minimum antara dua pesan progress dari worker (detik)
+PROGRESS_INTERVAL = 0.5
+
+_downloaders: Dict[str, Any] = {}
+
+
+def resolve_content(url_type: str, url: str, deadline: Optional[Deadline] = None,
+                    progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Ask the platform API for the media of a URL (runs in a worker).
+
+    Args:
+        url_type: 'instagram', 'facebook', 'tiktok' or 'youtube'
+        url: Social media URL
+        deadline: Deadline of the task, rebuilt in the worker from the job's remaining budget
+        progress: Unused; every task accepts it
+
+    Returns:
+        Response dictionary of the platform downloader's download_content
+    """
+    if not _downloaders:
+        # Dibuat di proses worker, sehingga session HTTP tidak dibagi antarproses
+        _downloaders.update({
+            'instagram': InstagramDownloader(ITZPIRE_API_URL, FIRST_BYTE_TIMEOUT),
+            'facebook': FacebookDownloader(FACEBOOK_API_URL, FIRST_BYTE_TIMEOUT),
+            'tiktok': TiktokDownloader(TIKTOK_API_URL, FIRST_BYTE_TIMEOUT),
+            'youtube': YoutubeDownloader(YOUTUBE_API_URL, FIRST_BYTE_TIMEOUT)
+        })
+    return _downloaders[url_type].download_content(url, deadline)
+
+
+def fetch_file(url: str, max_bytes: int, dest_path: str, cache_key: Optional[str] = None,
+               deadline: Optional[Deadline] = None,
+               progress: Optional[Callable[[int, int], None]] = None) -> Union[Path, str, None]:
+    """
+    Download a media file to `dest_path` (runs in a worker).
+
+    The file goes through the shared on-disk media cache, so hashing the
+    bytes for the cache happens in the worker as well.
+
+    Args:
+        url: Media URL
+        max_bytes: Maximum accepted size in bytes
+        dest_path: File path the media is written to; it must be reachable by the bot process
+        cache_key: Optional canonical key of the media
+        deadline: Deadline of the task; cancelling it stops the download at the next chunk
+        progress: Optional callback called with (downloaded, total)
+
+    Returns:
+        Path of `dest_path`, None if the download failed, or "TOO_LARGE"
+
+    Raises:
+        DeadlineExceeded: If the deadline runs out or the task is cancelled
+    """
+    return fetch_media(url, deadline, max_bytes, progress, dest_path, cache_key)
+
+
+def sniff_path(path: str, deadline: Optional[Deadline] = None,
+               progress: Optional[Callable[[int, int], None]] = None) -> Optional[Dict[str, str]]:
+    """
+    Detect the media format of a file on disk (runs in a worker).
+
+    Args:
+        path: File path
+        deadline: Deadline of the task
+        progress: Unused; every task accepts it
+
+    Returns:
+        Result of sniff_file
+    """
+    if deadline:
+        deadline.check("sniff")
+    return sniff_file(Path(path))
+
+
+# Tugas yang bisa dijalankan worker, berdasarkan nama. Setiap tugas menerima
+# argumen kata kunci `deadline` dan `progress` dari serve_tasks.
+TASKS: Dict[str, Callable[..., Any]] = {
+    "resolve": resolve_content,
+    "fetch": fetch_file,
+    "sniff": sniff_path
+}
+
+
+def serve_tasks(connection: Connection) -> None:
+    """
+    Run tasks received on a connection until it is closed.
+
+    Each task message is (task_id, name, args, budget), where budget is the
+    seconds left in the job's deadline (None for no limit). The final reply is
+    (task_id, ok, result), where result is the task's return value or the
+    exception it raised; progress is reported as (task_id, None, (done, total)).
+
+    A reader thread keeps receiving while a task runs, so a (task_id,
+    CANCEL_TASK, None) message cancels the task's deadline and the task stops
+    at its next check, e.g. the next downloaded chunk.
+
+    Args:
+        connection: Connection to the bot process
+    """
+    tasks: "queue.Queue[Any]" = queue.Queue()
+    running: Dict[int, Deadline] = {}
+    running_lock = threading.Lock()
+
+    def read() -> None:
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                message = None
+            if message is not None and message[1] == CANCEL_TASK:
+                with running_lock:
+                    deadline = running.get(message[0])
+                if deadline is not None:
+                    deadline.cancel()
+                continue
+            tasks.put(message)
+            if message is None:
+                return
+
+    threading.Thread(target=read, name="worker-reader", daemon=True).start()
+    while True:
+        message = tasks.get()
+        if message is None:
+            return
+        task_id, name, args, budget = message
+        deadline = Deadline(budget if budget is not None else float('inf'))
+        last_report = [0.0]
+
+        def progress(done: int, total: int) -> None:
+            now = time.monotonic()
+            if now - last_report[0] < PROGRESS_INTERVAL:
+                return
+            last_report[0] = now
+            connection.send((task_id, None, (done, total)))
+
+        with running_lock:
+            running[task_id] = deadline
+        try:
+            reply = (task_id, True, TASKS[name](*args, deadline=deadline, progress=progress))
+        except Exception as e:
+            reply = (task_id, False, e)
+        finally:
+            with running_lock:
+                running.pop(task_id, None)
+        try:
+            connection.send(reply)
+        except (EOFError, OSError):
+            return
+        except Exception as e:
+            # Hasil atau exception yang tidak bisa di-pickle
+            connection.send((task_id, False, RuntimeError(f"{type(e).__name__}: {str(e)}")))
+
+
+def _process_worker(connection: Connection) -> None:
+    """Entry point of a worker started by the process backend."""
+    logging.basicConfig(format='%(asctime)s - worker %(process)d - %(levelname)s - %(message)s', level=logging.INFO)
+    serve_tasks(connection)
+
+
+def _socket_worker(address: Tuple[str, int], authkey: bytes) -> None:
+    """Entry point of a worker that connects to the socket broker."""
+    logging.basicConfig(format='%(asctime)s - worker %(process)d - %(levelname)s - %(message)s', level=logging.INFO)
+    try:
+        connection = Client(address, authkey=authkey)
+    except OSError as e:
+        logger.error(f"Cannot connect to worker broker at {address[0]}:{address[1]}: {str(e)}")
+        return
+    with connection:
+        serve_tasks(connection)
+
+
+class WorkerPool:
+    """
+    Download stages run by a pool of worker processes, fed from a local queue.
+
+    The bot process keeps handling updates, quota and uploads while the
+    workers run the download stages (API calls and JSON parsing, the media
+    download with its cache hashing, sniffing) on the other cores. Every
+    worker is a connection that takes one task at a time from the shared
+    queue; a feeder thread per connection sends the task, forwards progress
+    and cancellation, and hands the reply back to the event loop.
+
+    Two backends provide the connections:
+
+    - BACKEND_PROCESS: `workers` spawned processes, each linked by a pipe.
+      A worker that dies is replaced.
+    - BACKEND_SOCKET: a broker listening on a local TCP address. It spawns
+      `workers` processes that connect to it, and further workers can be
+      started by hand with `python worker_pool.py --connect HOST:PORT`
+      (with the same WORKER_AUTHKEY).
+    """
+
+    def __init__(self, workers: int, backend: str = BACKEND_PROCESS,
+                 address: Tuple[str, int] = ("127.0.0.1", 0), authkey: bytes = b""):
+        """
+        Initialize the pool; call start() to launch the workers.
+
+        Args:
+            workers: Number of worker processes to start
+            backend: BACKEND_PROCESS or BACKEND_SOCKET
+            address: Address the socket broker listens on (port 0 = any free port)
+            authkey: Key workers must present to the socket broker (random if empty)
+        """
+        if backend not in (BACKEND_PROCESS, BACKEND_SOCKET):
+            raise ValueError(f"Unknown worker backend: {backend}")
+        self.workers = max(1, workers)
+        self.backend = backend
+        self.address = address
+        self.authkey = authkey or os.urandom(16)
+        self.listener: Optional[Listener] = None
+        self.connected = 0
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._processes: List[Any] = []
+        self._context = multiprocessing.get_context('spawn')
+        self._closed = False
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def start(self) -> None:
+        """Launch the workers (and the broker for the socket backend)."""
+        if self.backend == BACKEND_SOCKET:
+            self.listener = Listener(self.address, authkey=self.authkey)
+            self.address = self.listener.address
+            threading.Thread(target=self._accept, name="worker-broker", daemon=True).start()
+            for _ in range(self.workers):
+                self._spawn(self._socket_worker_process)
+            logger.info(f"Worker broker listening on {self.address[0]}:{self.address[1]}")
+        else:
+            for _ in range(self.workers):
+                self._spawn(self._pipe_worker_process)
+        logger.info(f"Started {self.workers} {self.backend} download workers")
+
+    async def call(self, name: str, *args: Any, deadline: Optional[Deadline] = None,
+                   on_progress: Optional[Callable[[int, int], None]] = None) -> Any:
+        """
+        Run a task in a worker and wait for its result.
+
+        The worker rebuilds the deadline from its remaining budget when the
+        task starts. Cancelling the caller or the deadline sends a cancel
+        message to the worker, which stops the task at its next deadline
+        check; a file the task still returns afterwards is removed.
+
+        Args:
+            name: Task name in TASKS
+            *args: Task arguments (must be picklable)
+            deadline: Optional job deadline
+            on_progress: Optional callback called from a feeder thread with (done, total)
+
+        Returns:
+            The task's return value
+
+        Raises:
+            DeadlineExceeded: If the deadline runs out or is cancelled
+            Exception: Whatever the task raised in the worker
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._next_id += 1
+            task_id = self._next_id
+        self._queue.put((task_id, name, args, deadline, on_progress, future, loop))
+        return await future
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the number of connected and busy workers, queued tasks and task totals."""
+        return {
+            "backend": self.backend,
+            "workers": self.connected,
+            "busy": self.busy,
+            "queued": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    def close(self) -> None:
+        """Stop the workers; tasks still queued fail with an error."""
+        self._closed = True
+        for _ in range(self.connected):
+            self._queue.put(None)
+        if self.listener:
+            self.listener.close()
+        deadline = time.monotonic() + 5
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._resolve(item, False, RuntimeError("Worker pool closed"))
+
+    def _pipe_worker_process(self) -> Tuple[Any, Optional[Connection]]:
+        """Create a worker process linked by a pipe."""
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_process_worker, args=(child,), daemon=True)
+        process.start()
+        child.close()
+        return process, parent
+
+    def _socket_worker_process(self) -> Tuple[Any, Optional[Connection]]:
+        """Create a worker process that connects to the broker (its connection arrives via _accept)."""
+        process = self._context.Process(target=_socket_worker, args=(self.address, self.authkey), daemon=True)
+        process.start()
+        return process, None
+
+    def _spawn(self, factory: Callable[[], Tuple[Any, Optional[Connection]]]) -> None:
+        """Start a worker process and, for pipes, the feeder thread of its connection."""
+        process, connection = factory()
+        with self._lock:
+            self._processes = [proc for proc in self._processes if proc.is_alive()] + [process]
+        if connection is not None:
+            self._feed_in_thread(connection, process)
+
+    def _accept(self) -> None:
+        """Accept worker connections on the socket broker until it is closed."""
+        while not self._closed:
+            try:
+                connection = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                logger.warning("Rejected a worker connection with a wrong key")
+                continue
+            except Exception as e:
+                if not self._closed:
+                    logger.error(f"Worker broker stopped accepting connections: {str(e)}")
+                return
+            self._feed_in_thread(connection, None)
+
+    def _feed_in_thread(self, connection: Connection, process: Any) -> None:
+        """Run _feed for one worker connection in a daemon thread."""
+        with self._lock:
+            self.connected += 1
+        threading.Thread(target=self._feed, args=(connection, process), name="worker-feeder", daemon=True).start()
+
+    def _feed(self, connection: Connection, process: Any) -> None:
+        """Send queued tasks to one worker, one at a time, and deliver its replies."""
+        item = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    connection.send(None)
+                    return
+                task_id, name, args, deadline, on_progress, future, loop = item
+                if future.cancelled():
+                    item = None
+                    continue
+                if deadline and deadline.expired():
+                    self._resolve(item, False, DeadlineExceeded(
+                        f"{'Dibatalkan' if deadline.cancelled else 'Batas waktu habis'} saat {name}"
+                    ))
+                    item = None
+                    continue
+                if process is not None and not process.is_alive():
+                    # Worker mati saat menganggur; tugas diambil worker lain
+                    self._queue.put(item)
+                    item = None
+                    return
+                with self._lock:
+                    self.busy += 1
+                try:
+                    connection.send((task_id, name, args, deadline.remaining() if deadline else None))
+                    ok, result = self._wait_reply(connection, task_id, deadline, on_progress, future)
+                finally:
+                    with self._lock:
+                        self.busy -= 1
+                self._resolve(item, ok, result)
+                item = None
+        except (EOFError, OSError) as e:
+            if item is not None:
+                self._resolve(item, False, RuntimeError(f"Download worker stopped: {str(e) or 'connection closed'}"))
+        finally:
+            connection.close()
+            with self._lock:
+                self.connected -= 1
+            if not self._closed:
+                logger.warning(f"Download worker disconnected ({self.connected} left)")
+                if process is not None:
+                    # Worker yang mati diganti agar jumlah worker tetap
+                    self._spawn(self._pipe_worker_process)
+
+    @staticmethod
+    def _wait_reply(connection: Connection, task_id: int, deadline: Optional[Deadline],
+                    on_progress: Optional[Callable[[int, int], None]], future: Any) -> Tuple[bool, Any]:
+        """Wait for a task's reply, forwarding its progress and, once, a cancel to the worker."""
+        cancel_sent = False
+        while True:
+            if not cancel_sent and (future.cancelled() or (deadline and deadline.cancelled)):
+                connection.send((task_id, CANCEL_TASK, None))
+                cancel_sent = True
+            if not connection.poll(0.25):
+                continue
+            _, ok, result = connection.recv()
+            if ok is not None:
+                return ok, result
+            if on_progress and not cancel_sent:
+                try:
+                    on_progress(*result)
+                except Exception as e:
+                    logger.warning(f"Progress callback of task {task_id} failed: {str(e)}")
+
+    def _resolve(self, item: Tuple[Any, ...], ok: bool, result: Any) -> None:
+        """Set the result of a task's future on its event loop."""
+        future, loop = item[-2:]
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+        def deliver() -> None:
+            if future.done():
+                # Pemanggil sudah pergi: file hasil unduhan tidak akan dipakai
+                if ok:
+                    release_media(result)
+                return
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+        try:
+            loop.call_soon_threadsafe(deliver)
+        except RuntimeError:
+            # Event loop sudah ditutup
+            if ok:
+                release_media(result)
+
+
+def main() -> None:
+    """Run a worker that connects to the socket broker of a running bot."""
+    parser = argparse.ArgumentParser(description="Download worker for the socket broker of the bot")
+    parser.add_argument("--connect", required=True, help="Broker address, HOST:PORT")
+    args = parser.parse_args()
+    host, _, port = args.connect.rpartition(":")
+    authkey = os.environ.get("WORKER_AUTHKEY", "").encode()
+    if not authkey:
+        sys.exit("WORKER_AUTHKEY must be set to the key of the broker")
+    _socket_worker((host or "127.0.0.1", int(port)), authkey)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 import os
+import re
 import logging
 import requests
 import urllib.parse
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional, Union
 from io import BytesIO
 
+from deadline import Deadline, DeadlineExceeded, request_timeout
+from media_fetcher import fetch_media
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
@@ -12,6 +16,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ID video entri playlist di ytInitialData (bukan video rekomendasi atau thumbnail lain di halaman)
+VIDEO_ID_PATTERN = re.compile(rb'"playlistVideoRenderer":\{"videoId":"([\w-]{11})"')
+
 class YoutubeDownloader:
     """Class for handling YouTube music content downloading."""
     
@@ -68,16 +75,58 @@ class YoutubeDownloader:
             'youtu.be/',
             'youtube.com/embed/',
             'youtube.com/v/',
-            'music.youtube.com/watch'
+            'music.youtube.com/watch',
+            'youtube.com/playlist'
         ]
         return any(pattern in url for pattern in patterns)
     
-    def download_content(self, url: str) -> Dict[str, Any]:
+    def iter_playlist_video_ids(self, playlist_id: str, limit: int = 25,
+                                deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """
+        Yield the video IDs of a playlist while its page is still downloading.
+        
+        Args:
+            playlist_id: Value of the `list` URL parameter
+            limit: Maximum number of IDs to yield
+            deadline: Optional job deadline bounding the request
+            
+        Yields:
+            Video IDs in playlist order, without duplicates
+        """
+        url = f"https://www.youtube.com/playlist?list={urllib.parse.quote(playlist_id)}"
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+            'Accept-Language': 'en-US,en;q=0.9',
+            # Lewati halaman persetujuan cookie di wilayah EU
+            'Cookie': 'CONSENT=YES+1'
+        }
+        seen = set()
+        try:
+            with requests.get(url, headers=headers, stream=True,
+                              timeout=request_timeout(deadline, read_timeout=self.timeout)) as response:
+                response.raise_for_status()
+                tail = b''
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    text = tail + chunk
+                    for match in VIDEO_ID_PATTERN.finditer(text):
+                        video_id = match.group(1).decode('ascii')
+                        if video_id not in seen:
+                            seen.add(video_id)
+                            yield video_id
+                            if len(seen) >= limit:
+                                return
+                    # Simpan ekor chunk agar ID yang terpotong di batas chunk tetap ditemukan
+                    tail = text[-64:]
+        except requests.RequestException as e:
+            logger.error(f"Error loading playlist {playlist_id}: {str(e)}")
+    
+    def download_content(self, url: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         Download YouTube music content from URL.
         
         Args:
             url: YouTube music URL
+            deadline: Optional job deadline bounding the API request
             
         Returns:
             Dictionary containing download response
@@ -101,7 +150,7 @@ class YoutubeDownloader:
             response = requests.get(
                 request_url, 
                 headers=headers,
-                timeout=self.timeout
+                timeout=request_timeout(deadline, read_timeout=self.timeout)
             )
             response.raise_for_status()
             
@@ -148,6 +197,9 @@ class YoutubeDownloader:
             # If we got here, something went wrong
             return {"status": "error", "message": "Tidak dapat mengekstrak audio dari YouTube URL. Coba link lain."}
             
+        except DeadlineExceeded as e:
+            logger.error(f"Deadline exceeded: {str(e)}")
+            return {"status": "error", "message": "Waktu pemrosesan habis. Coba lagi nanti."}
         except requests.Timeout:
             logger.error("Request timeout")
             return {"status": "error", "message": "Request timed out"}
@@ -158,24 +210,21 @@ class YoutubeDownloader:
             logger.error(f"Unexpected error: {str(e)}")
             return {"status": "error", "message": f"Unexpected error: {str(e)}"}
     
-    def download_media_file(self, url: str) -> Optional[BytesIO]:
+    def download_media_file(self, url: str, deadline: Optional[Deadline] = None) -> Union[BytesIO, str, None]:
         """
         Download media file from URL.
         
         Args:
             url: Media URL
+            deadline: Optional job deadline bounding the download
             
         Returns:
             BytesIO object containing media file data, or None if download failed
+            Returns string "TOO_LARGE" if file is too large
         """
+        # Cache media di disk diperiksa lebih dulu oleh fetch_media
         try:
-            response = requests.get(url, timeout=self.timeout)
-            response.raise_for_status()
-            
-            file_data = BytesIO(response.content)
-            file_data.seek(0)
-            
-            return file_data
+            return fetch_media(url, deadline)
         except Exception as e:
             logger.error(f"Error downloading media file: {str(e)}")
             return None
\ No newline at end of file